@@ -14,15 +14,19 @@ CREATE TABLE IF NOT EXISTS bm.parkeervakken (
     "type" varchar(20),
     "aantal" numeric(10,0),
     "e_type" varchar(5),
-    "bord" varchar(50)
+    "bord" varchar(50),
+    -- md5 of the normalized geometry and the attributes, see
+    -- import_his_bm.sql
+    "inhoud_hash" text
 );
 
 SELECT AddGeometryColumn('bm','parkeervakken','geom','0','MULTIPOLYGON',2);
 
 DROP TABLE IF EXISTS bm.reserveringen_fiscaal CASCADE;
 
+-- The primary keys of the reserveringen are their natural keys, the
+-- import deduplicates on them with ON CONFLICT DO NOTHING.
 CREATE TABLE IF NOT EXISTS bm.reserveringen_fiscaal (
-    "reserverings_key_md5" text PRIMARY KEY,
     "parkeer_id" varchar(30),
     "parkeer_id_md5" text,
     "soort" varchar(20),
@@ -33,13 +37,15 @@ CREATE TABLE IF NOT EXISTS bm.reserveringen_fiscaal (
     "begin_tijd" time without time zone,
     "eind_tijd" time without time zone,
     "opmerkingen" varchar(100),
-    "reservering_bron" varchar(100)
+    "reservering_bron" varchar(100),
+
+    PRIMARY KEY ("parkeer_id", "reserverings_datum", "begin_tijd",
+                 "eind_tijd", "reservering_bron")
 );
 
 DROP TABLE IF EXISTS bm.reserveringen_mulder CASCADE;
 
 CREATE TABLE IF NOT EXISTS bm.reserveringen_mulder (
-    "reserverings_key_md5" text PRIMARY KEY,
     "parkeer_id" varchar(40),
     "parkeer_id_md5" text,
     "soort" varchar(20),
@@ -51,13 +57,15 @@ CREATE TABLE IF NOT EXISTS bm.reserveringen_mulder (
     "begin_tijd" time without time zone,
     "eind_tijd" time without time zone,
     "opmerkingen" varchar(100),
-    "reservering_bron" varchar(100)
+    "reservering_bron" varchar(100),
+
+    PRIMARY KEY ("parkeer_id", "reserverings_datum", "begin_tijd",
+                 "eind_tijd")
 );
 
 DROP TABLE IF EXISTS bm.reserveringen_mulder_schoon CASCADE;
 
 CREATE TABLE IF NOT EXISTS bm.reserveringen_mulder_schoon (
-    "reserverings_key_md5" text PRIMARY KEY,
     "parkeer_id" varchar(40),
     "parkeer_id_md5" text,
     "soort" varchar(20),
@@ -69,7 +77,10 @@ CREATE TABLE IF NOT EXISTS bm.reserveringen_mulder_schoon (
     "begin_tijd" time without time zone,
     "eind_tijd" time without time zone,
     "opmerkingen" varchar(100),
-    "reservering_bron" varchar(100)
+    "reservering_bron" varchar(100),
+
+    PRIMARY KEY ("parkeer_id", "reserverings_datum", "begin_tijd",
+                 "eind_tijd")
 );
 
 DROP TABLE IF EXISTS bm.datums CASCADE;
@@ -8,6 +8,8 @@ DROP TABLE IF EXISTS bv.parkeervakken CASCADE;
 
 DROP TABLE IF EXISTS bv.e_types CASCADE;
 
+DROP TABLE IF EXISTS bv.parkeervakken_capaciteit CASCADE;
+
 CREATE TABLE bv.e_types (
   "code" varchar(5) PRIMARY KEY,
   "title" text,
@@ -43,13 +45,32 @@ CREATE TABLE bv.parkeervakken (
     "aantal" numeric(10,0),
 
     "e_type" varchar(5),
-    "bord" varchar(50)
+    "bord" varchar(50),
+    "inhoud_hash" text
 
 );
 
 SELECT AddGeometryColumn('bv','parkeervakken','geom','0','MULTIPOLYGON',2);
 SELECT AddGeometryColumn('bv','parkeervakken','geo_id','0','POINT',2);
 
+-- Used by the bbox, within and near filters of the API
+CREATE INDEX parkeervakken_geom_idx ON bv.parkeervakken USING GIST (geom);
+
+-- Capacity per street and kind of parkeervak, the API sums it for
+-- coarser groupings.
+CREATE TABLE bv.parkeervakken_capaciteit (
+    "id" serial PRIMARY KEY,
+    "stadsdeel" varchar(20),
+    "buurtcode" varchar(20),
+    "straatnaam" varchar(40),
+    "e_type" varchar(5),
+    "soort" varchar(20),
+    "type" varchar(20),
+
+    "aantal_vakken" integer,
+    "aantal" numeric(10,0)
+);
+
 CREATE TABLE IF NOT EXISTS bv.reserveringen (
     "reserverings_key_md5" text PRIMARY KEY,
     "parkeer_id_md5" text,
@@ -70,3 +91,58 @@ ALTER TABLE bv.reserveringen
     ADD CONSTRAINT fk_reserveringen
         FOREIGN KEY (parkeer_id_md5)
         REFERENCES bv.parkeervakken (parkeer_id_md5);
+
+-- Increased by every import (new_generation.sql), never dropped. The API
+-- uses the latest generation to find out when cached data is stale.
+CREATE TABLE IF NOT EXISTS bv.import_generations (
+    "generation" serial PRIMARY KEY,
+    "created_at" timestamp with time zone DEFAULT now()
+);
+
+-- The content hash of every parkeervak of the last import, to find what
+-- the next import changed. Never dropped.
+CREATE TABLE IF NOT EXISTS bv.parkeervakken_hashes (
+    "parkeer_id" varchar(30) PRIMARY KEY,
+    "inhoud_hash" text NOT NULL
+);
+
+-- Parkeervakken added, removed or modified by every import generation
+-- (update_changes.sql). Never dropped, rows older than 90 days are removed.
+CREATE TABLE IF NOT EXISTS bv.parkeervakken_changes (
+    "generation" integer NOT NULL,
+    "parkeer_id" varchar(30) NOT NULL,
+    "change" varchar(10) NOT NULL
+        CHECK ("change" IN ('added', 'removed', 'modified')),
+    "inhoud_hash" text,
+
+    PRIMARY KEY ("generation", "parkeer_id")
+);
+
+-- Timing and row counts of every import stage (import_data.py, stages.py).
+-- Never dropped.
+CREATE TABLE IF NOT EXISTS bv.import_runs (
+    "id" serial PRIMARY KEY,
+    "run_id" uuid NOT NULL,
+    "started_at" timestamp with time zone,
+    "stage" text,
+    "seconds" double precision,
+    "rows" bigint,
+    "bytes" bigint,
+    "failed" boolean,
+    "plan" jsonb,
+    -- Other fields of the stage, like the stadsdeel of a shape file
+    "details" jsonb
+);
+
+ALTER TABLE bv.import_runs
+    ADD COLUMN IF NOT EXISTS "details" jsonb;
+
+CREATE INDEX IF NOT EXISTS import_runs_started_at_idx
+    ON bv.import_runs (started_at);
+
+-- Import steps (steps.py) finished by a run that has not completed yet.
+-- Never dropped.
+CREATE TABLE IF NOT EXISTS bv.import_checkpoints (
+    "step" text PRIMARY KEY,
+    "finished_at" timestamp with time zone DEFAULT now()
+);
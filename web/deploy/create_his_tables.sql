@@ -6,8 +6,10 @@ CREATE SCHEMA IF NOT EXISTS his;
 
 DROP TABLE IF EXISTS his.parkeervakken CASCADE;
 
+-- Partitioned per stadsdeel, import_data.py swaps in a freshly loaded
+-- partition for every shape file.
 CREATE TABLE his.parkeervakken (
-    "parkeervak_id_md5" text PRIMARY KEY,
+    "parkeervak_id_md5" text,
     "parkeer_id" varchar(40),
     "buurtcode" varchar(20),
     "straatnaam" varchar(40),
@@ -35,11 +37,60 @@ CREATE TABLE his.parkeervakken (
     "tvm_eindd" date,
     "tvm_begint" varchar(20),
     "tvm_eindt" varchar(20),
-    "tvm_opmerk" varchar(100)
+    "tvm_opmerk" varchar(100),
+    "geom" geometry(MultiPolygon),
+    "stadsdeel" varchar(40) NOT NULL,
+    "goedkeurings_datum" date,
+    -- md5 of the geometry WKB, the key of his.geometrie_cache
+    "geom_hash" text,
+    -- The days of the reservation, bit 1 << date_part('dow') for every day
+    "dagen_mask" smallint
+) PARTITION BY LIST ("stadsdeel");
+
+-- Not unique: a shape file can have rows with the same parkeer_id and TVM,
+-- or several rows without a parkeer_id
+CREATE INDEX parkeervakken_id_idx
+    ON his.parkeervakken (parkeervak_id_md5, stadsdeel);
+
+CREATE INDEX parkeervakken_geom_hash_idx ON his.parkeervakken (geom_hash);
+
+-- Append only copies of every loaded shape file (import_data.py
+-- --keep-history), partitioned on stadsdeel and goedkeurings_datum. Never
+-- dropped.
+CREATE TABLE IF NOT EXISTS his.parkeervakken_snapshots (
+    LIKE his.parkeervakken
 );
 
-SELECT AddGeometryColumn('his','parkeervakken','geom','0','MULTIPOLYGON',2);
+ALTER TABLE his.parkeervakken_snapshots
+    ADD COLUMN IF NOT EXISTS "geom_hash" text;
+
+ALTER TABLE his.parkeervakken_snapshots
+    ADD COLUMN IF NOT EXISTS "dagen_mask" smallint;
+
+-- Validity of every geometry in his.parkeervakken, by the md5 of its WKB.
+-- valid geometries are used as they are, repaired geometries are replaced
+-- by geom, dropped geometries could not be repaired to a MultiPolygon.
+-- Filled by import_data.py (repair_geometries), pruned by the last update
+-- of an import (--prune-geometrie-cache). Never dropped.
+CREATE TABLE IF NOT EXISTS his.geometrie_cache (
+    "geom_hash" text PRIMARY KEY,
+    "status" varchar(10) NOT NULL
+        CHECK ("status" IN ('valid', 'repaired', 'dropped')),
+    "geom" geometry(MultiPolygon)
+);
+
+-- Capacity and reservations per buurt and e_type per day, the days of the
+-- import window replaced by update_dagtotalen.sql. Never dropped.
+CREATE TABLE IF NOT EXISTS his.parkeervakken_dagtotalen (
+    "id" serial PRIMARY KEY,
+    "datum" date NOT NULL,
+    "stadsdeel" varchar(40),
+    "buurtcode" varchar(20),
+    "e_type" varchar(5),
+    "aantal_vakken" integer,
+    "aantal" numeric(10,0),
+    "reserveringen" integer
+);
 
-ALTER TABLE "his"."parkeervakken"
-    ADD COLUMN "stadsdeel" varchar(40),
-    ADD COLUMN "goedkeurings_datum" date;
+CREATE INDEX IF NOT EXISTS parkeervakken_dagtotalen_datum_idx
+    ON his.parkeervakken_dagtotalen (datum);
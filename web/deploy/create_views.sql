@@ -45,6 +45,42 @@ CREATE VIEW bv.geo_parkeervakken AS
   FROM bv.parkeervakken pv
   LEFT JOIN bv.e_types ec ON ec.code = pv.e_type;
 
+CREATE VIEW public.geo_parkeervakken_capaciteit AS
+
+  SELECT
+    pc.id              AS id,
+    pc.stadsdeel       AS stadsdeel,
+    pc.buurtcode       AS buurtcode,
+    pc.straatnaam      AS straatnaam,
+    pc.e_type          AS e_type,
+    pc.soort           AS soort,
+    pc.type            AS type,
+    pc.aantal_vakken   AS aantal_vakken,
+    pc.aantal          AS aantal
+  FROM bv.parkeervakken_capaciteit pc;
+
+CREATE VIEW public.geo_parkeervakken_dagtotalen AS
+
+  SELECT
+    dt.id              AS id,
+    dt.datum           AS datum,
+    dt.stadsdeel       AS stadsdeel,
+    dt.buurtcode       AS buurtcode,
+    dt.e_type          AS e_type,
+    dt.aantal_vakken   AS aantal_vakken,
+    dt.aantal          AS aantal,
+    dt.reserveringen   AS reserveringen
+  FROM his.parkeervakken_dagtotalen dt;
+
+CREATE VIEW public.geo_parkeervakken_changes AS
+
+  SELECT
+    concat(ch.generation, '-', ch.parkeer_id) AS id,
+    ch.generation      AS generation,
+    ch.parkeer_id      AS parkeer_id,
+    ch.change          AS change
+  FROM bv.parkeervakken_changes ch;
+
 CREATE VIEW bv.geo_parkeervakken_reserveringen AS
 
   SELECT
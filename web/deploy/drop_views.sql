@@ -4,4 +4,10 @@ DROP VIEW IF EXISTS bv.geo_parkeervakken;
 
 DROP VIEW IF EXISTS bv.geo_parkeervakken_reserveringen;
 
+DROP VIEW IF EXISTS public.geo_parkeervakken_capaciteit;
+
+DROP VIEW IF EXISTS public.geo_parkeervakken_dagtotalen;
+
+DROP VIEW IF EXISTS public.geo_parkeervakken_changes;
+
 SELECT UpdateGeometrySRID('bv', 'parkeervakken', 'geom', 0);
@@ -0,0 +1,23 @@
+-- Fast load (import_data.py --fast-load), before import_his_bm.sql.
+--
+-- The bm tables are rebuilt from his on every import, so they are not
+-- WAL logged while loading. Afterwards they are logged again and
+-- bm.parkeervakken gets its primary key back (fast_load_post.sql, or
+-- fast_load_restore.sql when the import fails). The reserveringen keep
+-- their primary keys, the import deduplicates on them.
+
+SET maintenance_work_mem = '1GB';
+
+TRUNCATE
+    bm.parkeervakken,
+    bm.reserveringen_fiscaal,
+    bm.reserveringen_mulder,
+    bm.reserveringen_mulder_schoon;
+
+ALTER TABLE bm.parkeervakken SET UNLOGGED;
+ALTER TABLE bm.reserveringen_fiscaal SET UNLOGGED;
+ALTER TABLE bm.reserveringen_mulder SET UNLOGGED;
+ALTER TABLE bm.reserveringen_mulder_schoon SET UNLOGGED;
+
+ALTER TABLE bm.parkeervakken
+    DROP CONSTRAINT IF EXISTS parkeervakken_pkey;
@@ -0,0 +1,10 @@
+-- Fast load (import_data.py --fast-load), before import_bm_bv.sql.
+--
+-- The bv tables are served by the API and stay WAL logged, only the indexes
+-- not needed while loading are built afterwards (fast_load_post.sql). The
+-- primary key of bv.parkeervakken is kept for fk_reserveringen.
+
+ALTER TABLE bv.reserveringen
+    DROP CONSTRAINT IF EXISTS reserveringen_pkey;
+
+DROP INDEX IF EXISTS bv.parkeervakken_geom_idx;
@@ -0,0 +1,19 @@
+-- Fast load (import_data.py --fast-load), after import_bm_bv.sql. When the
+-- import fails before this, fast_load_restore.sql is run instead.
+
+ALTER TABLE bm.parkeervakken SET LOGGED;
+ALTER TABLE bm.reserveringen_fiscaal SET LOGGED;
+ALTER TABLE bm.reserveringen_mulder SET LOGGED;
+ALTER TABLE bm.reserveringen_mulder_schoon SET LOGGED;
+
+ALTER TABLE bm.parkeervakken
+    ADD PRIMARY KEY (parkeer_id_md5);
+
+ALTER TABLE bv.reserveringen
+    ADD PRIMARY KEY (reserverings_key_md5);
+
+CREATE INDEX IF NOT EXISTS parkeervakken_geom_idx
+    ON bv.parkeervakken USING GIST (geom);
+
+ANALYZE bv.parkeervakken;
+ANALYZE bv.reserveringen;
@@ -0,0 +1,32 @@
+-- Fast load (import_data.py --fast-load), after a failed import. Gives the
+-- tables back what fast_load_bm.sql and fast_load_bv.sql took away, as far
+-- as that is not done already, so the API keeps its indexes and bm is WAL
+-- logged again.
+
+ALTER TABLE bm.parkeervakken SET LOGGED;
+ALTER TABLE bm.reserveringen_fiscaal SET LOGGED;
+ALTER TABLE bm.reserveringen_mulder SET LOGGED;
+ALTER TABLE bm.reserveringen_mulder_schoon SET LOGGED;
+
+DO $$
+BEGIN
+    IF NOT EXISTS (
+        SELECT FROM pg_constraint
+        WHERE conrelid = 'bm.parkeervakken'::regclass AND contype = 'p'
+    ) THEN
+        ALTER TABLE bm.parkeervakken
+            ADD PRIMARY KEY (parkeer_id_md5);
+    END IF;
+
+    IF NOT EXISTS (
+        SELECT FROM pg_constraint
+        WHERE conrelid = 'bv.reserveringen'::regclass AND contype = 'p'
+    ) THEN
+        ALTER TABLE bv.reserveringen
+            ADD PRIMARY KEY (reserverings_key_md5);
+    END IF;
+END
+$$;
+
+CREATE INDEX IF NOT EXISTS parkeervakken_geom_idx
+    ON bv.parkeervakken USING GIST (geom);
@@ -0,0 +1,244 @@
+"""
+Write a flat binary snapshot of the geometries in `bv.parkeervakken`.
+
+The API workers `mmap` this file read-only (see
+`parkeervakken_api/geostore.py`) so all workers share one copy of the
+geometries in the page cache.
+
+Layout, all numbers little endian, every section starts 8 byte aligned:
+
+    header      8s magic, uint32 generation, n_features, n_parts, n_rings,
+                n_coords, n_nodes, node_size, ids_bytes (padded to 64)
+    boxes       float64[n_nodes * 4]     minx, miny, maxx, maxy per node
+    indices     uint32[n_nodes]          leaf: feature, node: first child
+    parts       uint32[n_features + 1]   first polygon of each feature
+    rings       uint32[n_parts + 1]      first ring of each polygon
+    coords_at   uint32[n_rings + 1]      first coordinate of each ring
+    coords      float64[n_coords * 2]    x, y
+    ids_at      uint32[n_features + 1]   first byte of each id
+    ids         utf-8 bytes
+
+The nodes form a packed Hilbert R-tree: the first n_features nodes are the
+feature bounding boxes sorted on the Hilbert curve, followed by the parent
+levels, the root is the last node.
+"""
+import logging
+import os
+import struct
+import sys
+from array import array
+
+import psycopg2
+
+log = logging.getLogger(__name__)
+
+MAGIC = b'PVSNAP\x00\x01'
+HEADER = struct.Struct('<8s8I')
+HEADER_SIZE = 64
+NODE_SIZE = 16
+
+SNAPSHOT_SQL = """SELECT parkeer_id, ST_AsBinary(geom)
+FROM bv.parkeervakken
+WHERE geom IS NOT NULL"""
+
+GENERATION_SQL = "SELECT max(generation) FROM bv.import_generations"
+
+
+def parse_wkb(wkb):
+    """
+    Returns the polygons of a (multi)polygon WKB as a list of polygons,
+    every polygon a list of rings, every ring a list of (x, y).
+    """
+    polygons, _ = _parse_geometry(memoryview(wkb), 0)
+    return polygons
+
+
+def _parse_geometry(wkb, offset):
+    endian = '<' if wkb[offset] == 1 else '>'
+    geometry_type, = struct.unpack_from(endian + 'I', wkb, offset + 1)
+    offset += 5
+
+    if geometry_type == 3:
+        polygon, offset = _parse_polygon(wkb, offset, endian)
+        return [polygon], offset
+
+    if geometry_type == 6:
+        count, = struct.unpack_from(endian + 'I', wkb, offset)
+        offset += 4
+        polygons = []
+        for _ in range(count):
+            polygon, offset = _parse_geometry(wkb, offset)
+            polygons.extend(polygon)
+        return polygons, offset
+
+    raise ValueError('Unsupported WKB geometry type {}'.format(geometry_type))
+
+
+def _parse_polygon(wkb, offset, endian):
+    ring_count, = struct.unpack_from(endian + 'I', wkb, offset)
+    offset += 4
+    rings = []
+    for _ in range(ring_count):
+        point_count, = struct.unpack_from(endian + 'I', wkb, offset)
+        offset += 4
+        values = struct.unpack_from(
+            endian + '{}d'.format(point_count * 2), wkb, offset)
+        offset += point_count * 16
+        rings.append(list(zip(values[0::2], values[1::2])))
+    return rings, offset
+
+
+def hilbert(x, y):
+    """Hilbert curve position of x, y in a 65536 x 65536 grid"""
+    d = 0
+    s = 1 << 15
+    while s > 0:
+        rx = 1 if x & s else 0
+        ry = 1 if y & s else 0
+        d += s * s * ((3 * rx) ^ ry)
+        if ry == 0:
+            if rx == 1:
+                x = s - 1 - x
+                y = s - 1 - y
+            x, y = y, x
+        s >>= 1
+    return d
+
+
+def bounding_box(polygons):
+    xs = [x for polygon in polygons for ring in polygon for x, _ in ring]
+    ys = [y for polygon in polygons for ring in polygon for _, y in ring]
+    return min(xs), min(ys), max(xs), max(ys)
+
+
+def pack_tree(boxes, node_size=NODE_SIZE):
+    """
+    Build the parent levels of a packed R-tree on top of the (sorted) leaf
+    boxes. Returns all node boxes and the index of every node.
+    """
+    nodes = list(boxes)
+    indices = list(range(len(boxes)))
+
+    level_start = 0
+    level_end = len(nodes)
+
+    while level_end - level_start > 1:
+        for first in range(level_start, level_end, node_size):
+            children = nodes[first:min(first + node_size, level_end)]
+            nodes.append((
+                min(box[0] for box in children),
+                min(box[1] for box in children),
+                max(box[2] for box in children),
+                max(box[3] for box in children),
+            ))
+            indices.append(first)
+        level_start, level_end = level_end, len(nodes)
+
+    return nodes, indices
+
+
+def _pad(f):
+    padding = -f.tell() % 8
+    if padding:
+        f.write(b'\x00' * padding)
+
+
+def write_snapshot(features, generation, path):
+    """
+    Write (id, wkb) `features` to `path`. The file is written next to the
+    target and renamed, so readers never see a partial snapshot.
+    """
+    features = [
+        (parkeer_id, parse_wkb(wkb)) for parkeer_id, wkb in features
+    ]
+    features = [(pid, polygons) for pid, polygons in features if polygons]
+
+    boxes = [bounding_box(polygons) for _, polygons in features]
+
+    if boxes:
+        minx = min(box[0] for box in boxes)
+        miny = min(box[1] for box in boxes)
+        width = (max(box[2] for box in boxes) - minx) or 1.0
+        height = (max(box[3] for box in boxes) - miny) or 1.0
+    else:
+        minx = miny = 0.0
+        width = height = 1.0
+
+    def hilbert_key(i):
+        box = boxes[i]
+        x = int(65535 * ((box[0] + box[2]) / 2 - minx) / width)
+        y = int(65535 * ((box[1] + box[3]) / 2 - miny) / height)
+        return hilbert(x, y)
+
+    order = sorted(range(len(features)), key=hilbert_key)
+    features = [features[i] for i in order]
+    nodes, indices = pack_tree([boxes[i] for i in order])
+
+    parts = array('I', [0])
+    rings = array('I', [0])
+    coords_at = array('I', [0])
+    coords = array('d')
+    ids_at = array('I', [0])
+    ids = bytearray()
+
+    for parkeer_id, polygons in features:
+        for polygon in polygons:
+            for ring in polygon:
+                for x, y in ring:
+                    coords.append(x)
+                    coords.append(y)
+                coords_at.append(len(coords) // 2)
+            rings.append(len(coords_at) - 1)
+        parts.append(len(rings) - 1)
+        ids.extend(parkeer_id.encode('utf-8'))
+        ids_at.append(len(ids))
+
+    boxes_array = array('d', [value for node in nodes for value in node])
+    indices_array = array('I', indices)
+
+    for section in (parts, rings, coords_at, coords, ids_at,
+                    boxes_array, indices_array):
+        if sys.byteorder == 'big':
+            section.byteswap()
+
+    header = HEADER.pack(
+        MAGIC, generation or 0, len(features), len(rings) - 1,
+        len(coords_at) - 1, len(coords) // 2, len(nodes), NODE_SIZE,
+        len(ids))
+
+    tmp_path = '{}.tmp'.format(path)
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    with open(tmp_path, 'wb') as f:
+        f.write(header.ljust(HEADER_SIZE, b'\x00'))
+        for section in (boxes_array, indices_array, parts, rings,
+                        coords_at, coords, ids_at):
+            section.tofile(f)
+            _pad(f)
+        f.write(bytes(ids))
+
+    os.replace(tmp_path, path)
+
+    log.info('Wrote snapshot of %d parkeervakken to %s',
+             len(features), path)
+
+
+def export_snapshot(path, database, user, password, host, port):
+    """Write the snapshot of `bv.parkeervakken` to `path`."""
+    conn = psycopg2.connect(
+        database=database,
+        user=user,
+        password=password,
+        host=host,
+        port=port)
+
+    try:
+        with conn.cursor() as cur:
+            cur.execute(GENERATION_SQL)
+            generation, = cur.fetchone()
+            cur.execute(SNAPSHOT_SQL)
+            features = [(row[0], bytes(row[1])) for row in cur]
+    finally:
+        conn.close()
+
+    write_snapshot(features, generation, path)
@@ -0,0 +1,156 @@
+import os
+import random
+import struct
+import sys
+import tempfile
+from unittest import TestCase
+from unittest import skipIf
+
+import geometry_snapshot
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+from parkeervakken_api import geostore  # noqa: E402
+
+try:
+    from shapely import wkb as shapely_wkb
+    from shapely.geometry import Point
+except ImportError:
+    shapely_wkb = None
+
+
+def polygon_wkb(rings):
+    wkb = struct.pack('<BII', 1, 3, len(rings))
+    for ring in rings:
+        wkb += struct.pack('<I', len(ring))
+        for x, y in ring:
+            wkb += struct.pack('<dd', x, y)
+    return wkb
+
+
+def multipolygon_wkb(polygons):
+    wkb = struct.pack('<BII', 1, 6, len(polygons))
+    for rings in polygons:
+        wkb += polygon_wkb(rings)
+    return wkb
+
+
+class TestSnapshot(TestCase):
+
+    square = [(0, 0), (2, 0), (2, 2), (0, 2), (0, 0)]
+
+    def test_parse_wkb(self):
+        wkb = multipolygon_wkb([[self.square], [self.square]])
+
+        polygons = geometry_snapshot.parse_wkb(wkb)
+
+        self.assertEqual(len(polygons), 2)
+        self.assertEqual(polygons[0][0][2], (2.0, 2.0))
+
+    def test_pack_tree(self):
+        boxes = [(i, i, i + 1, i + 1) for i in range(20)]
+
+        nodes, indices = geometry_snapshot.pack_tree(boxes, node_size=4)
+
+        # 20 leaves, 5 nodes, 2 nodes, 1 root
+        self.assertEqual(len(nodes), 28)
+        self.assertEqual(nodes[-1], (0, 0, 20, 20))
+        self.assertEqual(indices[20], 0)
+        self.assertEqual(indices[-1], 25)
+
+    def test_hilbert_order(self):
+        self.assertEqual(geometry_snapshot.hilbert(0, 0), 0)
+        self.assertLess(
+            geometry_snapshot.hilbert(0, 1),
+            geometry_snapshot.hilbert(65535, 0))
+
+
+@skipIf(shapely_wkb is None, 'Needs shapely for the brute force search')
+class TestGeometryStore(TestCase):
+    """Snapshots written by the importer, read by the API"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'parkeervakken.bin')
+        self.random = random.Random(1)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def square(self, x, y, size):
+        return [(x, y), (x + size, y), (x + size, y + size),
+                (x, y + size), (x, y)]
+
+    def features(self, count):
+        """Squares, squares with a hole and multipolygons"""
+        features = []
+        for i in range(count):
+            x = self.random.uniform(0, 1000)
+            y = self.random.uniform(0, 1000)
+            size = self.random.uniform(5, 50)
+            polygons = [[self.square(x, y, size)]]
+            if i % 3 == 1:
+                polygons[0].append(
+                    self.square(x + size / 4, y + size / 4, size / 2))
+            elif i % 3 == 2:
+                polygons.append([self.square(x + size * 2, y, size / 2)])
+            features.append(('PV{}'.format(i), multipolygon_wkb(polygons)))
+        return features
+
+    def store(self, features):
+        geometry_snapshot.write_snapshot(features, 7, self.path)
+        return geostore.GeometryStore(self.path)
+
+    def points(self, count):
+        return [
+            (self.random.uniform(-100, 1100), self.random.uniform(-100, 1100))
+            for _ in range(count)
+        ]
+
+    def assertSameAsBruteForce(self, features, points):
+        store = self.store(features)
+        shapes = {
+            parkeer_id: shapely_wkb.loads(wkb) for parkeer_id, wkb in features
+        }
+
+        self.assertEqual(len(store), len(features))
+        self.assertEqual(store.generation, 7)
+
+        for x, y in points:
+            point = Point(x, y)
+
+            expected = [
+                pid for pid, shape in shapes.items() if shape.contains(point)
+            ]
+            found = store.contains(x, y)
+            if expected:
+                parkeer_id, geometry = found
+                self.assertIn(parkeer_id, expected, (x, y))
+                self.assertTrue(shapes[parkeer_id].equals(shapely_wkb.loads(
+                    multipolygon_wkb(geometry['coordinates']))))
+            else:
+                self.assertIsNone(found, (x, y))
+
+            distances = sorted(
+                shape.distance(point) for shape in shapes.values())[:5]
+            nearest = store.nearest(x, y, 5)
+            self.assertEqual(len(nearest), len(distances), (x, y))
+            for (parkeer_id, _), distance in zip(nearest, distances):
+                self.assertAlmostEqual(
+                    shapes[parkeer_id].distance(point), distance, places=6)
+
+    def test_empty(self):
+        store = self.store([])
+
+        self.assertEqual(len(store), 0)
+        self.assertIsNone(store.contains(10, 10))
+        self.assertEqual(store.nearest(10, 10, 5), [])
+
+    def test_single(self):
+        features = [('PV1', multipolygon_wkb([[self.square(0, 0, 10)]]))]
+
+        self.assertSameAsBruteForce(
+            features, [(5, 5), (20, 5), (-3, -4)] + self.points(20))
+
+    def test_round_trip(self):
+        # More features than fit in one node, so the tree has three levels
+        self.assertSameAsBruteForce(self.features(300), self.points(300))
@@ -20,12 +20,21 @@ echo $DATABASE_PORT
 
 # Get files stored in the objectstore
 echo "Getting zip files from objectstore"
-python $SCRIPT_DIR/objectstore.py
+status=0
+python $SCRIPT_DIR/objectstore.py || status=$?
 
-echo 'unzipping latest source shape file'
-unzip -o $(ls -Art /data/parkeren/* | grep [0-9].zip | tail -n 1) -d /unzipped/
+if [ "$status" -eq 3 ]; then
+    echo "objectstore unchanged since the last import"
+    exit 0
+elif [ "$status" -ne 0 ]; then
+    exit $status
+fi
+
+# The shape files are read from the zips, without unzipping
+latest_zip=$(ls -Art /data/parkeren/* | grep [0-9].zip | tail -n 1)
+latest_nf_zip=$(ls -Art /data/parkeren/*niet*fiscaal*.zip | tail -n 1)
 
-count=$(ls /unzipped/*shp -l | wc -l)
+count=$(unzip -Z1 $latest_zip | grep -c '\.shp$' || true)
 
 echo $count shapefiles
 
@@ -34,8 +43,6 @@ if [ "$count" -lt '8' ]; then
     exit
 fi
 
-unzip -o $(ls -Art /data/parkeren/*niet*fiscaal*.zip | tail -n 1) -d /unzipped/nietfiscaal
-
 echo 'clear / build tables'
 # clear and or create tables
 python $SCRIPT_DIR/import_data.py --user $DATABASE_USER \
@@ -53,7 +60,10 @@ python $SCRIPT_DIR/import_data.py --user $DATABASE_USER \
 		      --port $DATABASE_PORT \
 		      --database parkeervakken \
                       update \
-                      --source /unzipped
+                      --source $latest_zip \
+                      --keep-history \
+                      --fast-load \
+                      --partial
 
 echo 'load parkeer NIET FISCAAL data'
 # run import / update data
@@ -63,7 +73,14 @@ python $SCRIPT_DIR/import_data.py --user $DATABASE_USER \
 		      --port $DATABASE_PORT \
 		      --database parkeervakken \
                       update \
-                      --source /unzipped/nietfiscaal \
+                      --source $latest_nf_zip \
                       --skip-dates \
+                      --keep-history \
+                      --fast-load \
+                      --record-changes \
+                      --prune-geometrie-cache \
+                      --snapshot /data/snapshot/parkeervakken.bin
+
+python $SCRIPT_DIR/objectstore.py --imported
 
 echo 'parkeerdata DONE'
@@ -19,7 +19,8 @@ INSERT INTO bv.parkeervakken
     bord,
 
     geom,
-    geo_id
+    geo_id,
+    inhoud_hash
 )
 SELECT
     parkeer_id_md5,
@@ -40,12 +41,42 @@ SELECT
     bord,
 
     geom,
-    ST_Centroid(geom) as geo_id
+    ST_Centroid(geom) as geo_id,
+    inhoud_hash
 
 FROM bm.parkeervakken;
 
+TRUNCATE bv.parkeervakken_capaciteit RESTART IDENTITY;
+
+INSERT INTO bv.parkeervakken_capaciteit
+(
+    stadsdeel,
+    buurtcode,
+    straatnaam,
+    e_type,
+    soort,
+    "type",
+
+    aantal_vakken,
+    aantal
+)
+SELECT
+    stadsdeel,
+    buurtcode,
+    straatnaam,
+    e_type,
+    soort,
+    "type",
+
+    count(*),
+    sum(aantal)
+FROM bv.parkeervakken
+GROUP BY stadsdeel, buurtcode, straatnaam, e_type, soort, "type";
+
 TRUNCATE bv.reserveringen;
 
+-- bm deduplicates on the typed keys, the text key of the API is derived
+
 INSERT INTO bv.reserveringen
 (
     reserverings_key_md5,
@@ -62,8 +93,28 @@ INSERT INTO bv.reserveringen
     opmerkingen,
     reservering_bron
 )
-SELECT /* DISTINCT on (reserverings_key_md5) */
-    *
+SELECT
+    md5(concat_ws(
+        '|',
+        soort,
+        reservering_bron,
+        parkeer_id,
+        reserverings_datum,
+        begin_tijd,
+        eind_tijd
+    )),
+    parkeer_id,
+    parkeer_id_md5,
+    soort,
+    kenteken,
+
+    reserverings_datum,
+    begin_datum,
+    eind_datum,
+    begin_tijd,
+    eind_tijd,
+    opmerkingen,
+    reservering_bron
 FROM bm.reserveringen_fiscaal;
 
 INSERT INTO bv.reserveringen
@@ -82,8 +133,28 @@ INSERT INTO bv.reserveringen
     opmerkingen,
     reservering_bron
 )
-SELECT /* DISTINCT ON (reserverings_key_md5) */
-    *
+SELECT
+    md5(concat_ws(
+        '|',
+        soort,
+        reservering_bron,
+        parkeer_id,
+        reserverings_datum,
+        begin_tijd,
+        eind_tijd
+    )),
+    parkeer_id,
+    parkeer_id_md5,
+    soort,
+    kenteken,
+
+    reserverings_datum,
+    begin_datum,
+    eind_datum,
+    begin_tijd,
+    eind_tijd,
+    opmerkingen,
+    reservering_bron
 FROM bm.reserveringen_mulder_schoon;
 
 ALTER TABLE bv.reserveringen
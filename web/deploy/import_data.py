@@ -1,15 +1,26 @@
 #!/usr/bin/python3.5
 
-import subprocess
 import datetime
 import argparse
+import hashlib
 import re
-import shlex
 import pathlib
 
 import psycopg2
 import logging
 import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from geometry_snapshot import export_snapshot
+from shape_reader import ShapeReader
+from shape_reader import copy_batches
+from sources import open_source
+from stages import describe
+from stages import recorder
+from stages import split_statements
+from steps import plan
+from steps import run_steps
 
 logging.basicConfig(level=logging.DEBUG)
 
@@ -91,18 +102,8 @@ def setup_argparse():
                                dest='source',
                                type=pathlib.Path,
                                required=True,
-                               help='The path where zip-files are resided')
-
-    update_parser.add_argument('--target',
-                               dest='target',
-                               type=pathlib.Path,
-                               default=None,
-                               required=False,
-                               help=("The target directory to where zip files "
-                                     "should be unzipped. If the target is "
-                                     "not given or the path is the same as "
-                                     "the target path, it will be changed to "
-                                     "<source_path>/tmp"))
+                               help=('The zip file, or the directory, '
+                                     'with the shape files'))
 
     update_parser.add_argument('--skip-import',
                                dest='skip_import',
@@ -115,18 +116,85 @@ def setup_argparse():
     update_parser.add_argument('--interval',
                                dest='interval',
                                default='5 days')
+    update_parser.add_argument('--keep-history',
+                               dest='keep_history',
+                               default=False,
+                               action='store_true',
+                               help=("Also append the loaded shape files to "
+                                     "his.parkeervakken_snapshots"))
+    update_parser.add_argument('--fast-load',
+                               dest='fast_load',
+                               default=False,
+                               action='store_true',
+                               help=("Load the bm tables unlogged and "
+                                     "build indexes after loading"))
+    update_parser.add_argument('--explain',
+                               dest='explain',
+                               default=False,
+                               action='store_true',
+                               help=("Record EXPLAIN ANALYZE plans of the "
+                                     "import statements in bv.import_runs"))
+    update_parser.add_argument('--jobs',
+                               dest='jobs',
+                               type=int,
+                               default=4,
+                               help="Import SQL steps run at the same time")
+    update_parser.add_argument('--retries',
+                               dest='retries',
+                               type=int,
+                               default=2,
+                               help=("Retries of an import SQL step after a "
+                                     "connection error or deadlock"))
+    update_parser.add_argument('--resume',
+                               dest='resume',
+                               default=False,
+                               action='store_true',
+                               help=("Skip the import SQL steps finished by "
+                                     "the last, failed, run. Combine with "
+                                     "--skip-import and --skip-dates when "
+                                     "the shape files were loaded"))
+    update_parser.add_argument('--partial',
+                               dest='partial',
+                               default=False,
+                               action='store_true',
+                               help=("Not the last update of an import, "
+                                     "other sources follow. Only the last "
+                                     "update starts a new import generation"))
+    update_parser.add_argument('--record-changes',
+                               dest='record_changes',
+                               default=False,
+                               action='store_true',
+                               help=("Record the added, removed and "
+                                     "modified parkeervakken. Only on the "
+                                     "last update of an import, when all "
+                                     "sources are loaded"))
+    update_parser.add_argument('--prune-geometrie-cache',
+                               dest='prune_geometrie_cache',
+                               default=False,
+                               action='store_true',
+                               help=("Remove the geometries no longer in "
+                                     "his.parkeervakken from "
+                                     "his.geometrie_cache. Only on the last "
+                                     "update of an import, when all sources "
+                                     "are loaded"))
+    update_parser.add_argument('--snapshot',
+                               dest='snapshot',
+                               default=None,
+                               help=("Write a geometry snapshot of "
+                                     "bv.parkeervakken for the API to "
+                                     "this path"))
     return parser.parse_args()
 
 
 def find_latest_date(source, file_type):
     """
-    :type source: pathlib.Path
+    :type source: sources.Source
     """
 
     last_date = None
 
-    for path in source.glob('*.{}'.format(file_type)):
-        match = stadsdeel_c.match(path.stem)
+    for stem in source.stems(file_type):
+        match = stadsdeel_c.match(stem)
         _, date_string = match.groups()
         date = datetime.datetime.strptime(date_string, '%Y%m%d')
 
@@ -139,6 +207,28 @@ def find_latest_date(source, file_type):
 import_files = [
     os.path.join(directory, 'import_his_bm.sql'),
     os.path.join(directory, 'import_bm_bv.sql'),
+    os.path.join(directory, 'update_dagtotalen.sql'),
+]
+
+fast_import_files = [
+    os.path.join(directory, 'fast_load_bm.sql'),
+    os.path.join(directory, 'import_his_bm.sql'),
+    os.path.join(directory, 'fast_load_bv.sql'),
+    os.path.join(directory, 'import_bm_bv.sql'),
+    os.path.join(directory, 'fast_load_post.sql'),
+    os.path.join(directory, 'update_dagtotalen.sql'),
+]
+
+fast_restore_files = [
+    os.path.join(directory, 'fast_load_restore.sql'),
+]
+
+generation_files = [
+    os.path.join(directory, 'new_generation.sql'),
+]
+
+changes_files = [
+    os.path.join(directory, 'update_changes.sql'),
 ]
 
 
@@ -150,10 +240,20 @@ def import_data(database,
                 source,
                 skip_import=False,
                 skip_dates=False,
-                interval='1 year'):
-    """Load data from zip files given in :param:`source` into the database.
-    These zip files should consist of shape files and files connected to the
-    shape files. The data in shape files contains data about reservations of
+                interval='1 year',
+                keep_history=False,
+                fast_load=False,
+                explain=False,
+                jobs=4,
+                retries=2,
+                resume=False,
+                partial=False,
+                record_changes=False,
+                prune_geometrie_cache=False):
+    """Load data from the zip file given in :param:`source` into the
+    database. The zip file should consist of shape files and files connected
+    to the shape files, :param:`source` can also be a directory with these
+    files. The data in shape files contains data about reservations of
     parking spaces. There should be files for each `stadsdeel` (city part), but
     it doesn't matter if a `stadsdeel` is ommitted.
 
@@ -163,11 +263,35 @@ def import_data(database,
     :type host: str
     :type port: int
     :type source: pathlib.Path
+    :param source: A zip file or a directory.
     :type skip_import: bool
     :type skip_dates: bool
+    :type keep_history: bool
+    :type fast_load: bool
+    :param fast_load: Load the bm tables unlogged and build indexes
+        after loading.
+    :type explain: bool
+    :param explain: Record the EXPLAIN ANALYZE plans of the import SQL.
+    :type jobs: int
+    :param jobs: The number of import SQL steps run at the same time.
+    :type retries: int
+    :type resume: bool
+    :param resume: Skip the import SQL steps finished by the last run.
+    :type partial: bool
+    :param partial: Other updates of the same import follow, do not start
+        a new import generation yet.
+    :type record_changes: bool
+    :param record_changes: Compare the parkeervakken with the last import,
+        see update_changes.sql. Every source is loaded by its own update, so
+        only the last update may do this.
+    :type prune_geometrie_cache: bool
+    :param prune_geometrie_cache: Remove the geometries of parkeervakken
+        that are gone from the cache, again only on the last update.
     """
 
-    source = source.absolute()
+    if partial and record_changes:
+        raise ValueError(
+            'Changes are recorded by the last update, not a partial one')
 
     conn = psycopg2.connect(
         database=database,
@@ -176,100 +300,91 @@ def import_data(database,
         host=host,
         port=port)
 
-    table_counts(conn)
-
     with conn:
         with conn.cursor() as cur:
 
             if not skip_import:
-                latest_date = find_latest_date(source, 'shp')
+                with open_source(source) as shape_source:
+                    latest_date = find_latest_date(shape_source, 'shp')
 
-                import_shape_data(source, latest_date, conn, cur)
+                    import_shape_data(
+                        shape_source, latest_date, conn, cur, keep_history)
 
             if not skip_dates:
                 update_dates(conn, cur, interval)
 
-    table_counts(conn)
-
-    execute_sql(import_files, database, user, password, host, port)
-
-    table_counts(conn)
+    connect = partial(psycopg2.connect, database=database, user=user,
+                      password=password, host=host, port=port)
 
+    repair_geometries(connect, jobs=jobs, prune=prune_geometrie_cache)
 
-def table_counts(conn):
+    files = fast_import_files if fast_load else import_files
+    if not partial:
+        files = files + generation_files
+    if record_changes:
+        files = files + changes_files
 
-    table_names = [
-        'his.parkeervakken',
-        'bm.parkeervakken',
-        'bm.reserveringen_fiscaal',
-        'bm.reserveringen_mulder',
-        'bm.reserveringen_mulder_schoon',
-        'bv.parkeervakken',
-        'bv.reserveringen',
-    ]
-
-    log.debug("""
-
-        his = source data'
-        bm = Business Model (intermediate tables)
-        bv = Business Views (final output tables)
-
-    """)
-
-    for table in table_names:
-        with conn:
-            with conn.cursor() as cursor:
-                count_statement = f"SELECT COUNT(*) FROM {table};"
-                count = 0
-                try:
-                    cursor.execute(count_statement)
-                    results = cursor.fetchone()
-                    count = results[0]
-                except Exception as e:
-                    pass
-                    # conn.close()
-                    # log.debug(e)
+    steps = plan(files)
+    try:
+        run_steps(steps, connect, jobs=jobs, retries=retries, resume=resume,
+                  explain=explain)
+    except Exception:
+        if fast_load:
+            restore_fast_load(database=database, user=user,
+                              password=password, host=host, port=port)
+        raise
 
-                log.info('Count %40s: %-10s', table, count)
 
-    log.debug('\n\n')
+def restore_fast_load(**credentials):
+    """Give the tables back the logging, keys and indexes a failed fast
+    load left out (fast_load_restore.sql). The import failed already, so
+    a failure here is only logged.
+    """
+    try:
+        execute_sql(fast_restore_files, **credentials)
+    except Exception:
+        log.exception('Could not restore the tables after the fast load')
 
 
-def import_shape_data(source, latest_date, conn, cur):
-    """Unzip all data in :param:`zip_file` and load the shape files.
+def import_shape_data(source, latest_date, conn, cur, keep_history=False):
+    """Load the shape files of :param:`latest_date` in :param:`source`.
 
-    :type source: pathlib.Path
+    :type source: sources.Source
     :type latest_date: datetime.datetime
     :type conn: psycopg2.extensions.connection
     :type cur: psycopg2.extensions.connection
+    :type keep_history: bool
     """
 
-    for shp_file in source.glob('*.shp'):
-        match = stadsdeel_c.match(shp_file.stem)
+    for stem in source.stems('shp'):
+        match = stadsdeel_c.match(stem)
         _, date_string = match.groups()
         file_date = datetime.datetime.strptime(date_string, '%Y%m%d')
 
         if latest_date != file_date:
             continue
 
-        # print('Load', shp_file)
-        log.debug('Load %s', shp_file)
+        log.debug('Load %s from %s', stem, source)
 
-        load_shape_file(conn, cur, shp_file)
+        load_shape_file(conn, cur, source, stem, keep_history)
 
 
-def load_shape_file(conn, cur, shp_file):
-    """Import data from shape files into the database. The shape files are
-    imported by first creating an sql script using `shp2pgsql` and executing
-    this on the database.
+def load_shape_file(conn, cur, source, stem, keep_history=False):
+    """Import data from shape files into the database. The shape file is
+    read in this process and copied straight into a new partition of the
+    history table, see `update_history`.
 
     :type conn: psycopg2.extensions.connection
     :type cur: psycopg2.extensions.connection
-    :type shp_file: pathlib.Path
-    :param shp_file: The path to the shape file.
+    :type source: sources.Source
+    :param source: The zip file or directory with the shape file.
+    :type stem: str
+    :param stem: The name of the shape file, without extension.
+    :type keep_history: bool
+    :param keep_history: Append the data to the snapshot history as well.
     """
 
-    match = stadsdeel_c.match(shp_file.stem)
+    match = stadsdeel_c.match(stem)
 
     if match is None:
         conn.close()
@@ -287,168 +402,367 @@ def load_shape_file(conn, cur, shp_file):
     if stadsdeel == '':
         stadsdeel = 'unknown'
 
-    if 'nietfiscaal' in shp_file.parts:
+    if source.nietfiscaal:
         stadsdeel += '_NF'
 
     stadsdeel = stadsdeel.lower().replace('-', '_')
 
     log.debug(stadsdeel)
 
-    drop_table(conn, cur, 'parkeervakken', 'public')
+    # Load the shape file into the history table
+    partition_table = update_history(
+        conn, cur, ShapeReader(source, stem), stadsdeel, date)
+
+    if keep_history:
+        append_snapshot(conn, cur, partition_table, stadsdeel, date)
+
+
+# The columns of his.parkeervakken loaded from the shape files, with their
+# COPY types (see shape_reader.ENCODERS)
+HISTORY_COLUMNS = [
+    ('parkeervak_id_md5', 'text'),
+    ('parkeer_id', 'text'),
+    ('buurtcode', 'text'),
+    ('straatnaam', 'text'),
+    ('soort', 'text'),
+    ('type', 'text'),
+    ('aantal', 'numeric'),
+    ('kenteken', 'text'),
+    ('e_type', 'text'),
+    ('bord', 'text'),
+    ('begintijd1', 'text'),
+    ('eindtijd1', 'text'),
+    ('ma_vr', 'boolean'),
+    ('ma_za', 'boolean'),
+    ('zo', 'boolean'),
+    ('ma', 'boolean'),
+    ('di', 'boolean'),
+    ('wo', 'boolean'),
+    ('do', 'boolean'),
+    ('vr', 'boolean'),
+    ('za', 'boolean'),
+    ('eindtijd2', 'text'),
+    ('begintijd2', 'text'),
+    ('opmerking', 'text'),
+    ('tvm_begind', 'date'),
+    ('tvm_eindd', 'date'),
+    ('tvm_begint', 'text'),
+    ('tvm_eindt', 'text'),
+    ('tvm_opmerk', 'text'),
+    ('geom', 'geometry'),
+    ('stadsdeel', 'text'),
+    ('goedkeurings_datum', 'date'),
+    ('geom_hash', 'text'),
+    ('dagen_mask', 'smallint'),
+]
 
-    cmd_fmt = 'shp2pgsql -W LATIN1 -I {shape_file} public.parkeervakken'
+# Times that do not look like a time are loaded as NULL
+TIME_COLUMNS = [
+    'begintijd1', 'eindtijd1', 'eindtijd2', 'begintijd2', 'tvm_begint',
+    'tvm_eindt',
+]
 
-    shp2pgsql_cmd = shlex.split(cmd_fmt.format(shape_file=str(shp_file)))
+time_c = re.compile(r'[0-9][0-9]?[:;][0-9][0-9]?([:;][0-9][0-9]?)?')
 
-    # Create the sql statements for loading shape data into the database
-    try:
-        output = subprocess.check_output(shp2pgsql_cmd)
-        shp_stmts = output.decode('UTF-8')
-    except Exception:
-        conn.close()
-        raise
 
-    # Load shape file into temporary table in the database
+def valid_time(value):
+    if value is not None and time_c.fullmatch(value):
+        return value
+    return None
+
+
+# The days (date_part('dow'), sunday is 0) of the weekday columns
+DAY_COLUMNS = [
+    ('ma_vr', (1, 2, 3, 4, 5)),
+    ('ma_za', (1, 2, 3, 4, 5, 6)),
+    ('zo', (0,)),
+    ('ma', (1,)),
+    ('di', (2,)),
+    ('wo', (3,)),
+    ('do', (4,)),
+    ('vr', (5,)),
+    ('za', (6,)),
+]
+ALL_DAYS = 0b1111111
+
+
+def dagen_mask(flags):
+    """The days of a reservation as a bit mask, bit `dow` for every day.
+    A reservation with all weekday columns false is valid on all days.
+
+    :param flags: The values of the `DAY_COLUMNS`, in that order.
+    :type flags: tuple
+    """
+    if all(flag is False for flag in flags):
+        return ALL_DAYS
+
+    mask = 0
+    for flag, (_, days) in zip(flags, DAY_COLUMNS):
+        if flag:
+            for day in days:
+                mask |= 1 << day
+    return mask
+
+
+def history_batches(shapes, stadsdeel, date):
+    """The batches of :param:`shapes` as columns of `HISTORY_COLUMNS`.
+
+    :type shapes: shape_reader.ShapeReader
+    :type stadsdeel: str
+    :type date: datetime.datetime
+    """
+
+    for batch in shapes.batches():
+        missing = {name for name, _ in HISTORY_COLUMNS} - set(batch) - {
+            'parkeervak_id_md5', 'stadsdeel', 'goedkeurings_datum',
+            'geom_hash', 'dagen_mask'}
+        if missing:
+            raise ValueError('{} misses the columns {}'.format(
+                shapes.stem, ', '.join(sorted(missing))))
+
+        size = len(batch['geom'])
+
+        batch['parkeervak_id_md5'] = [
+            '{}-{}-{}'.format(
+                parkeer_id or '',
+                tvm_begind.isoformat() if tvm_begind else '',
+                tvm_begint or '')
+            for parkeer_id, tvm_begind, tvm_begint in zip(
+                batch['parkeer_id'], batch['tvm_begind'],
+                batch['tvm_begint'])
+        ]
+
+        for name in TIME_COLUMNS:
+            batch[name] = [valid_time(value) for value in batch[name]]
+
+        batch['stadsdeel'] = [stadsdeel] * size
+        batch['goedkeurings_datum'] = [date] * size
+        batch['geom_hash'] = [
+            hashlib.md5(geom).hexdigest() if geom is not None else None
+            for geom in batch['geom']
+        ]
+        batch['dagen_mask'] = [
+            dagen_mask(flags)
+            for flags in zip(*(batch[name] for name, _ in DAY_COLUMNS))
+        ]
+
+        yield batch
+
+
+def update_history(conn, cur, shapes, stadsdeel, date):
+    """Copy the shape file to the partition of `his.parkeervakken` for
+    :param:`stadsdeel`. The data is loaded into a separate table first,
+    which then replaces the partition. The `bytes` of the stage are the
+    bytes sent to the database, not the bytes read from the shape file.
+
+    :type conn: psycopg2.extensions.connection
+    :type cur: psycopg2.extensions.connection
+    :type shapes: shape_reader.ShapeReader
+    :type stadsdeel: str
+    :type date: datetime.datetime
+    :rtype: str
+    """
+
+    partition_table = 'parkeervakken_{stadsdeel}'.format(stadsdeel=stadsdeel)
+
+    load_table = create_load_table(conn, cur, 'parkeervakken', 'his',
+                                   partition_table)
+
     try:
-        cur.execute(shp_stmts)
-        conn.commit()
+        with recorder.stage('update_history', stadsdeel=stadsdeel) as stage:
+            stage['rows'], stage['bytes'] = copy_batches(
+                cur, 'his.{}'.format(load_table), HISTORY_COLUMNS,
+                history_batches(shapes, stadsdeel, date))
+            conn.commit()
     except Exception:
         conn.rollback()
         conn.close()
         raise
 
-    # Update data from the temporary table into the history table
-    update_history(conn, cur, stadsdeel, date)
+    swap_partition(conn, cur, 'parkeervakken', 'his', partition_table,
+                   load_table, stadsdeel)
 
+    return partition_table
 
-def update_history(conn, cur, stadsdeel, date):
-    """Copy data from :param:`tmp_table` to :param:`hist_table`. First all data
-    with the same :param:`stadsdeel` and :param:`date` is deleted from
-    :param:`hist_table`. After that new data is inserted.
+
+def append_snapshot(conn, cur, partition_table, stadsdeel, date):
+    """Copy the data of :param:`partition_table` to a partition of
+    `his.parkeervakken_snapshots` for :param:`stadsdeel` and :param:`date`.
+    Snapshots are never replaced, a shape file that was loaded before is
+    skipped.
 
     :type conn: psycopg2.extensions.connection
     :type cur: psycopg2.extensions.connection
+    :type partition_table: str
     :type stadsdeel: str
-    :type date: str
+    :type date: datetime.datetime
     """
 
-    partition_table = create_partition(
-        conn,
-        cur,
-        'parkeervakken',
-        'his',
-        stadsdeel
-    )
+    if date is None:
+        log.warning('No date for %s, no snapshot kept', stadsdeel)
+        return
 
-    # First truncate partition
-    truncate = ("TRUNCATE his.{part_table}".format(part_table=partition_table))
+    snapshot_table = 'parkeervakken_snapshots_{stadsdeel}_{date}'.format(
+        stadsdeel=stadsdeel, date=date.strftime('%Y%m%d'))
+
+    columns = ', '.join('"{}"'.format(name) for name, _ in HISTORY_COLUMNS)
+
+    # A snapshot that exists is left as it is, the INSERT adds no rows
+    stmt = """CREATE TABLE IF NOT EXISTS his.{snapshot_table} (
+        CHECK ( stadsdeel = %(stadsdeel)s
+            AND goedkeurings_datum = %(date)s )
+    ) INHERITS (his.parkeervakken_snapshots);
+
+    INSERT INTO his.{snapshot_table} ({columns})
+    SELECT {columns} FROM ONLY his.{part_table}
+    WHERE NOT EXISTS (SELECT FROM ONLY his.{snapshot_table})""".format(
+        snapshot_table=snapshot_table,
+        part_table=partition_table,
+        columns=columns)
 
     try:
-        cur.execute(truncate)
-        conn.commit()
+        with recorder.stage('append_snapshot', stadsdeel=stadsdeel) as stage:
+            cur.execute(stmt, {'stadsdeel': stadsdeel, 'date': date})
+            stage['rows'] = cur.rowcount
+            conn.commit()
     except Exception:
         conn.close()
         raise
 
-    # Insert data from the temporary table into the history table
-    insert_stmt = """INSERT INTO his.{part_table}
-    (
-        parkeervak_id_md5,
-        parkeer_id,
-        buurtcode,
-        straatnaam,
-        soort,
-        "type",
-        aantal,
-        kenteken,
-        e_type,
-        bord,
-        begintijd1,
-        eindtijd1,
-        ma_vr,
-        ma_za,
-        zo,
-        ma,
-        di,
-        wo,
-        "do",
-        vr,
-        za,
-        eindtijd2,
-        begintijd2,
-        opmerking,
-        tvm_begind,
-        tvm_eindd,
-        tvm_begint,
-        tvm_eindt,
-        tvm_opmerk,
-        geom,
-        stadsdeel,
-        goedkeurings_datum
-    )
+
+PARTITIONS_SQL = """SELECT child.relname
+FROM pg_inherits
+JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+JOIN pg_namespace ON pg_namespace.oid = parent.relnamespace
+WHERE pg_namespace.nspname = 'his' AND parent.relname = 'parkeervakken'
+ORDER BY child.relname"""
+
+# Only geometries not seen before are checked, and only invalid geometries
+# are repaired with the expensive ST_MakeValid
+REPAIR_SQL = """INSERT INTO his.geometrie_cache (geom_hash, status, geom)
+SELECT
+    geom_hash,
+    CASE
+        WHEN valid THEN 'valid'
+        WHEN ST_GeometryType(repaired) = 'ST_MultiPolygon' THEN 'repaired'
+        ELSE 'dropped'
+    END,
+    CASE
+        WHEN NOT valid AND ST_GeometryType(repaired) = 'ST_MultiPolygon'
+        THEN repaired
+    END
+FROM (
     SELECT
-        concat(parkeer_id,
-                   '-',
-                   tvm_begind,
-                   '-',
-                   tvm_begint),
-        parkeer_id,
-        buurtcode,
-        straatnaam,
-        soort,
-        "type",
-        aantal,
-        kenteken,
-        e_type,
-        bord,
-        CASE begintijd1 ~ '^[0-9][0-9]?[:;][0-9][0-9]?([:;][0-9][0-9]?)?$'
-            WHEN TRUE THEN begintijd1
-            ELSE NULL
-        END,
-        CASE eindtijd1 ~ '^[0-9][0-9]?[:;][0-9][0-9]?([:;][0-9][0-9]?)?$'
-            WHEN TRUE THEN eindtijd1
-            ELSE NULL
-        END,
-        ma_vr,
-        ma_za,
-        zo,
-        ma,
-        di,
-        wo,
-        "do",
-        vr,
-        za,
-        CASE eindtijd2 ~ '^[0-9][0-9]?[:;][0-9][0-9]?([:;][0-9][0-9]?)?$'
-            WHEN TRUE THEN eindtijd2
-            ELSE NULL
-        END,
-        CASE begintijd2 ~ '^[0-9][0-9]?[:;][0-9][0-9]?([:;][0-9][0-9]?)?$'
-            WHEN TRUE THEN begintijd2
-            ELSE NULL
-        END,
-        opmerking,
-        tvm_begind,
-        tvm_eindd,
-        CASE tvm_begint ~ '^[0-9][0-9]?[:;][0-9][0-9]?([:;][0-9][0-9]?)?$'
-            WHEN TRUE THEN tvm_begint
-            ELSE NULL
-        END,
-        CASE tvm_eindt ~ '^[0-9][0-9]?[:;][0-9][0-9]?([:;][0-9][0-9]?)?$'
-            WHEN TRUE THEN tvm_eindt
-            ELSE NULL
-        END,
-        tvm_opmerk,
-        geom,
-        %(stadsdeel)s,
-        %(date)s
-    FROM public.parkeervakken""".format(part_table=partition_table)
+        geom_hash,
+        valid,
+        CASE WHEN NOT valid THEN ST_Multi(ST_MakeValid(geom)) END AS repaired
+    FROM (
+        SELECT DISTINCT ON (geom_hash)
+            geom_hash,
+            geom,
+            ST_IsValid(geom) AS valid
+        FROM his.{partition_table} AS pv
+        WHERE geom_hash IS NOT NULL AND NOT EXISTS (
+            SELECT 1 FROM his.geometrie_cache AS cache
+            WHERE cache.geom_hash = pv.geom_hash
+        )
+    ) AS unseen
+) AS checked
+-- Partitions are repaired at the same time, inserting in the same order
+-- keeps them from deadlocking on a geometry they share
+ORDER BY geom_hash
+ON CONFLICT (geom_hash) DO NOTHING
+RETURNING status"""
+
+REPAIR_COUNTS_SQL = """SELECT status, count(*)
+FROM his.parkeervakken
+INNER JOIN his.geometrie_cache USING (geom_hash)
+WHERE status != 'valid'
+GROUP BY status"""
+
+PRUNE_CACHE_SQL = """DELETE FROM his.geometrie_cache AS cache
+WHERE NOT EXISTS (
+    SELECT 1 FROM his.parkeervakken AS pv
+    WHERE pv.geom_hash = cache.geom_hash
+)"""
+
+
+def _repair_partition(connect, partition_table):
+    conn = connect()
+    try:
+        with conn:
+            with conn.cursor() as cur:
+                with recorder.stage('repair_geometries',
+                                    partition=partition_table) as stage:
+                    cur.execute(
+                        REPAIR_SQL.format(partition_table=partition_table))
+                    statuses = [row[0] for row in cur.fetchall()]
+                    stage['rows'] = len(statuses)
+                    stage['repaired'] = statuses.count('repaired')
+                    stage['dropped'] = statuses.count('dropped')
+    finally:
+        conn.close()
+
 
+def repair_geometries(connect, jobs=4, prune=False):
+    """Check the geometries of `his.parkeervakken` that are not in
+    `his.geometrie_cache` yet and repair the invalid ones, for all
+    partitions at the same time. The bm build takes the geometries from the
+    cache.
+
+    :type connect: callable
+    :param connect: Returns a new database connection.
+    :type jobs: int
+    :type prune: bool
+    :param prune: Remove the geometries no longer in `his.parkeervakken`
+        from the cache. `his.parkeervakken` only has every source after the
+        last update of an import, pruning earlier drops the geometries of the
+        sources still to come.
+    :rtype: dict
+    :returns: The number of rows in `his.parkeervakken` with a repaired and
+        with a dropped geometry.
+    """
+
+    conn = connect()
     try:
-        cur.execute(insert_stmt, {'stadsdeel': stadsdeel, 'date': date})
-        conn.commit()
-    except Exception:
+        with conn:
+            with conn.cursor() as cur:
+                cur.execute(PARTITIONS_SQL)
+                partitions = [row[0] for row in cur.fetchall()]
+    finally:
         conn.close()
-        raise
+
+    with ThreadPoolExecutor(max_workers=max(jobs, 1)) as executor:
+        futures = [
+            executor.submit(_repair_partition, connect, partition_table)
+            for partition_table in partitions
+        ]
+        for future in futures:
+            future.result()
+
+    conn = connect()
+    try:
+        with conn:
+            with conn.cursor() as cur:
+                if prune:
+                    with recorder.stage('prune_geometrie_cache') as stage:
+                        cur.execute(PRUNE_CACHE_SQL)
+                        stage['rows'] = cur.rowcount
+
+                cur.execute(REPAIR_COUNTS_SQL)
+                counts = dict(cur.fetchall())
+    finally:
+        conn.close()
+
+    counts = {
+        'repaired': counts.get('repaired', 0),
+        'dropped': counts.get('dropped', 0),
+    }
+    log.info('Geometries repaired: %(repaired)d, dropped: %(dropped)d',
+             counts)
+
+    return counts
 
 
 def update_dates(conn, cur, interval='1 day'):
@@ -483,102 +797,123 @@ def update_dates(conn, cur, interval='1 day'):
     ) as t"""
 
     try:
-        cur.execute(insert, {'interval': interval})
-        conn.commit()
+        with recorder.stage('update_dates') as stage:
+            cur.execute(insert, {'interval': interval})
+            stage['rows'] = cur.rowcount
+            conn.commit()
     except Exception:
         conn.close()
         raise
 
 
-def create_partition(conn, cur, table, schema, stadsdeel):
-    """Create a partition for a :param:`stadsdeel` if it not already exists.
+def create_load_table(conn, cur, table, schema, partition_table):
+    """Create an empty table with the columns of :param:`table`, to load the
+    data of a partition into.
 
     :type conn: psycopg2.extensions.connection
     :type cur: psycopg2.extensions.connection
     :type table: str
-    :param table: The table name on which a new partition should be created.
+    :param table: The partitioned table.
     :type schema: str
-    :type stadsdeel: str
+    :type partition_table: str
     :rtype: str
     """
 
-    partition_table = (
-        '{table}_{stadsdeel}'.format(table=table, stadsdeel=stadsdeel)
-    )
-
-    if table_exists(conn, cur, partition_table, schema):
-        return partition_table
+    load_table = '{partition_table}_load'.format(
+        partition_table=partition_table)
 
-    stmt = """CREATE TABLE IF NOT EXISTS {schema}.{stadsdeel_table} (
-        CHECK ( stadsdeel = %(stadsdeel)s )
-    ) INHERITS ({schema}.{table})""".format(schema=schema,
-                                            stadsdeel_table=partition_table,
-                                            table=table)
+    stmt = """DROP TABLE IF EXISTS {schema}.{load_table};
+    CREATE TABLE {schema}.{load_table} (
+        LIKE {schema}.{table} INCLUDING DEFAULTS
+    )""".format(schema=schema, load_table=load_table, table=table)
 
     try:
-        cur.execute(stmt, {'stadsdeel': stadsdeel})
+        cur.execute(stmt)
+        conn.commit()
     except Exception:
         conn.close()
         raise
 
-    return partition_table
+    return load_table
 
 
-def drop_table(conn, cur, table, schema):
-    """Drop a table.
+def swap_partition(conn, cur, table, schema, partition_table, load_table,
+                   stadsdeel):
+    """Replace the partition of :param:`table` for :param:`stadsdeel` with
+    :param:`load_table`. The indexes and a check constraint matching the
+    partition bound are created first, so attaching the table does not have
+    to scan or index it and the swap is near instant. Like the partitions,
+    the index on parkeervak_id_md5 is not unique, a shape file can have the
+    same key more than once.
 
     :type conn: psycopg2.extensions.connection
     :type cur: psycopg2.extensions.connection
     :type table: str
     :type schema: str
+    :type partition_table: str
+    :type load_table: str
+    :type stadsdeel: str
     """
 
-    stmt = (
-        "DROP TABLE IF EXISTS {schema}.{table} CASCADE"
-        .format(schema=schema, table=table)
-    )
+    prepare = """ALTER TABLE {schema}.{load_table}
+        ADD CHECK ( stadsdeel IS NOT NULL AND stadsdeel = %(stadsdeel)s );
+    CREATE INDEX ON {schema}.{load_table} (parkeervak_id_md5, stadsdeel);
+    CREATE INDEX ON {schema}.{load_table} (geom_hash)
+    """.format(schema=schema, load_table=load_table)
+
+    swap = """DROP TABLE IF EXISTS {schema}.{partition_table};
+    ALTER TABLE {schema}.{load_table} RENAME TO {partition_table};
+    ALTER TABLE {schema}.{table}
+        ATTACH PARTITION {schema}.{partition_table}
+        FOR VALUES IN (%(stadsdeel)s)""".format(
+        schema=schema, table=table, partition_table=partition_table,
+        load_table=load_table)
 
     try:
-        cur.execute(stmt)
-        conn.commit()
+        with recorder.stage('swap_partition', stadsdeel=stadsdeel):
+            cur.execute(prepare, {'stadsdeel': stadsdeel})
+            conn.commit()
+            cur.execute(swap, {'stadsdeel': stadsdeel})
+            conn.commit()
     except Exception:
+        conn.rollback()
         conn.close()
         raise
 
 
-def table_exists(conn, cur, table, schema):
-    """Check if a table exists.
+def drop_table(conn, cur, table, schema):
+    """Drop a table.
 
     :type conn: psycopg2.extensions.connection
     :type cur: psycopg2.extensions.connection
     :type table: str
     :type schema: str
-    :rtype: bool
     """
 
-    table_exists = """SELECT *
-    FROM information_schema.tables
-    WHERE table_schema = %(schema)s AND table_name = %(table)s"""
+    stmt = (
+        "DROP TABLE IF EXISTS {schema}.{table} CASCADE"
+        .format(schema=schema, table=table)
+    )
 
     try:
-        cur.execute(table_exists, {'schema': schema, 'table': table})
-        results = cur.fetchall()
-
+        cur.execute(stmt)
+        conn.commit()
     except Exception:
         conn.close()
         raise
 
-    return len(results) > 0
 
+def execute_sql(files, database, user, password, host, port, explain=False):
+    """Execute the statements of every file in one transaction per file.
+    Every statement is recorded as a stage.
 
-def execute_sql(files, database, user, password, host, port):
-    """
     :type files: list of files
     :type database: str
     :type user: str
     :type password: str
     :type host: str
     :type port: int
+    :type explain: bool
     """
 
     conn = psycopg2.connect(
@@ -593,11 +928,15 @@ def execute_sql(files, database, user, password, host, port):
         log.debug('SQL: %s', filename)
 
         with open(filename) as f:
-            stmts = f.read()
+            stmts = split_statements(f.read())
 
             try:
                 with conn.cursor() as c:
-                    c.execute(stmts)
+                    for number, stmt in enumerate(stmts, 1):
+                        name = '{}:{} {}'.format(
+                            os.path.basename(filename), number,
+                            describe(stmt))
+                        recorder.execute(c, stmt, name, explain)
                 conn.commit()
             except Exception:
                 conn.rollback()
@@ -635,21 +974,43 @@ def main():
         execute_sql(create_tables_files, **database_credentials)
 
     elif command == 'update':
-
-        execute_sql(drop_views_files, **database_credentials)
-
-        source = pathlib.Path(args.source)
-        skip_import = args.skip_import
-        skip_dates = args.skip_dates
-        interval = args.interval
-
-        import_data(source=source,
-                    skip_import=skip_import,
-                    skip_dates=skip_dates,
-                    interval=interval,
-                    **database_credentials)
-
-        execute_sql(create_views_files, **database_credentials)
+        try:
+            update(args, database_credentials)
+        finally:
+            try:
+                recorder.save(**database_credentials)
+            except Exception:
+                log.exception('Could not save the import stages')
+
+
+def update(args, database_credentials):
+    execute_sql(drop_views_files, **database_credentials)
+
+    source = pathlib.Path(args.source)
+    skip_import = args.skip_import
+    skip_dates = args.skip_dates
+    interval = args.interval
+
+    import_data(source=source,
+                skip_import=skip_import,
+                skip_dates=skip_dates,
+                interval=interval,
+                keep_history=args.keep_history,
+                fast_load=args.fast_load,
+                explain=args.explain,
+                jobs=args.jobs,
+                retries=args.retries,
+                resume=args.resume,
+                partial=args.partial,
+                record_changes=args.record_changes,
+                prune_geometrie_cache=args.prune_geometrie_cache,
+                **database_credentials)
+
+    execute_sql(create_views_files, **database_credentials)
+
+    if args.snapshot:
+        with recorder.stage('export_snapshot'):
+            export_snapshot(args.snapshot, **database_credentials)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,327 @@
+import datetime
+import os
+from functools import partial
+from unittest import TestCase
+from unittest.mock import patch
+
+import psycopg2
+
+import import_data
+
+# A PostGIS database the tests may drop and create the import tables in
+DATABASE = {
+    'database': os.getenv('TEST_DATABASE_NAME', 'test_parkeervakken'),
+    'user': os.getenv('TEST_DATABASE_USER', 'test'),
+    'password': os.getenv('TEST_DATABASE_PASSWORD', 'test'),
+    'host': os.getenv('TEST_DATABASE_HOST', 'localhost'),
+    'port': int(os.getenv('TEST_DATABASE_PORT', '5432')),
+}
+
+SQUARE = 'MULTIPOLYGON((({left} 0, {left} 5, {right} 5, {right} 0, {left} 0)))'
+
+
+class DatabaseTestCase(TestCase):
+
+    def setUp(self):
+        try:
+            self.conn = psycopg2.connect(**DATABASE)
+        except psycopg2.OperationalError:
+            self.skipTest('No test database')
+
+        import_data.execute_sql(import_data.create_tables_files, **DATABASE)
+        self.execute("""TRUNCATE
+            bv.parkeervakken_hashes,
+            bv.parkeervakken_changes,
+            his.geometrie_cache""")
+
+    def tearDown(self):
+        self.conn.close()
+
+    def execute(self, sql, params=None):
+        with self.conn:
+            with self.conn.cursor() as cur:
+                cur.execute(sql, params)
+                if cur.description is not None:
+                    return cur.fetchall()
+
+    def load_history(self, stadsdeel, parkeervakken):
+        """A partition of his.parkeervakken, as the shape file of
+        `stadsdeel` would be loaded. `parkeervakken` are (parkeer_id,
+        geometry) tuples."""
+        self.execute("""CREATE TABLE his.parkeervakken_{0}
+            PARTITION OF his.parkeervakken
+            FOR VALUES IN ('{0}')""".format(stadsdeel))
+
+        for parkeer_id, geometry in parkeervakken:
+            self.execute("""INSERT INTO his.parkeervakken
+            (parkeervak_id_md5, parkeer_id, soort, aantal, stadsdeel, geom,
+             geom_hash, dagen_mask)
+            SELECT id, id, 'FISCAAL', 1, %(stadsdeel)s, geom,
+                md5(ST_AsBinary(geom)), 127
+            FROM (
+                SELECT
+                    %(parkeer_id)s AS id,
+                    ST_GeomFromText(%(geometry)s) AS geom
+            ) AS pv""", {
+                'parkeer_id': parkeer_id,
+                'geometry': geometry,
+                'stadsdeel': stadsdeel,
+            })
+
+    def update(self, **kwargs):
+        import_data.import_data(
+            source=None, skip_import=True, skip_dates=True, jobs=2,
+            **kwargs, **DATABASE)
+
+
+class TestRecordChanges(DatabaseTestCase):
+
+    def generation(self):
+        return self.execute(
+            "SELECT max(generation) FROM bv.import_generations")[0][0]
+
+    def night(self, fiscaal, nietfiscaal):
+        """Import the fiscale and the niet fiscale parkeervakken like
+        import.sh does"""
+        import_data.execute_sql(import_data.create_tables_files, **DATABASE)
+        self.load_history('centrum', fiscaal)
+        self.update(partial=True)
+        self.load_history('centrum_nf', nietfiscaal)
+        self.update(record_changes=True)
+
+        return self.execute("""SELECT parkeer_id, change
+            FROM bv.parkeervakken_changes
+            WHERE generation = (
+                SELECT max(generation) FROM bv.import_generations)
+            ORDER BY parkeer_id""")
+
+    def test_unchanged(self):
+        fiscaal = [('F1', SQUARE.format(left=0, right=5))]
+        nietfiscaal = [('N1', SQUARE.format(left=10, right=15))]
+
+        self.assertEqual(
+            self.night(fiscaal, nietfiscaal),
+            [('F1', 'added'), ('N1', 'added')])
+        self.assertEqual(self.night(fiscaal, nietfiscaal), [])
+
+    def test_one_generation(self):
+        nietfiscaal = [('N1', SQUARE.format(left=10, right=15))]
+        fiscaal = [('F1', SQUARE.format(left=0, right=5))]
+
+        self.night(fiscaal, nietfiscaal)
+        first = self.generation()
+        self.night(fiscaal, nietfiscaal)
+        self.assertEqual(self.generation(), first + 1)
+
+        with self.assertRaises(ValueError):
+            self.update(partial=True, record_changes=True)
+
+    def test_same_row_every_import(self):
+        # A parkeer_id with several rows, the first by parkeervak_id_md5
+        # gives the inhoud_hash
+        self.load_history('centrum', [('F1', SQUARE.format(left=0, right=5))])
+        self.execute("""INSERT INTO his.parkeervakken
+            (parkeervak_id_md5, parkeer_id, soort, aantal, stadsdeel, geom,
+             geom_hash, dagen_mask)
+            SELECT 'F1-TVM', parkeer_id, soort, 2, stadsdeel, geom,
+                geom_hash, dagen_mask
+            FROM his.parkeervakken""")
+        self.load_history('centrum_nf', [])
+        self.update(record_changes=True)
+
+        self.assertEqual(self.execute(
+            "SELECT aantal FROM bm.parkeervakken"), [(1,)])
+
+    def test_changed(self):
+        nietfiscaal = [('N1', SQUARE.format(left=10, right=15))]
+        self.night([
+            ('F1', SQUARE.format(left=0, right=5)),
+            ('F2', SQUARE.format(left=5, right=10)),
+        ], nietfiscaal)
+
+        changes = self.night([
+            ('F1', SQUARE.format(left=0, right=6)),
+            ('F3', SQUARE.format(left=5, right=10)),
+        ], nietfiscaal)
+
+        self.assertEqual(changes, [
+            ('F1', 'modified'), ('F2', 'removed'), ('F3', 'added')])
+
+
+class TestRepairGeometries(DatabaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.connect = partial(psycopg2.connect, **DATABASE)
+
+    def cache(self):
+        return dict(self.execute("""SELECT status, count(*)
+            FROM his.geometrie_cache
+            GROUP BY status"""))
+
+    def test_repair(self):
+        self.load_history('centrum', [
+            ('VALID', SQUARE.format(left=0, right=5)),
+            # Self intersecting, repaired into two triangles
+            ('BOWTIE', 'MULTIPOLYGON(((0 0, 2 2, 2 0, 0 2, 0 0)))'),
+            # No area, repaired into a line
+            ('LINE', 'MULTIPOLYGON(((0 0, 1 1, 2 2, 0 0)))'),
+        ])
+
+        counts = import_data.repair_geometries(self.connect, jobs=2)
+
+        self.assertEqual(counts, {'repaired': 1, 'dropped': 1})
+        self.assertEqual(
+            self.cache(), {'valid': 1, 'repaired': 1, 'dropped': 1})
+        self.assertEqual(self.execute(
+            """SELECT ST_NumGeometries(geom)
+            FROM his.geometrie_cache WHERE status = 'repaired'"""), [(2,)])
+
+        # Known geometries are not checked again
+        self.execute("""UPDATE his.geometrie_cache
+            SET geom = NULL WHERE status = 'repaired'""")
+        import_data.repair_geometries(self.connect, jobs=2)
+        self.assertEqual(self.execute(
+            """SELECT geom FROM his.geometrie_cache
+            WHERE status = 'repaired'"""), [(None,)])
+
+    def test_prune(self):
+        self.load_history('centrum', [
+            ('F1', SQUARE.format(left=0, right=5))])
+        self.load_history('centrum_nf', [
+            ('N1', SQUARE.format(left=10, right=15))])
+        import_data.repair_geometries(self.connect)
+
+        # The next import, before the niet fiscale parkeervakken are loaded
+        self.execute("DROP TABLE his.parkeervakken_centrum_nf")
+        import_data.repair_geometries(self.connect)
+        self.assertEqual(self.cache(), {'valid': 2})
+
+        import_data.repair_geometries(self.connect, prune=True)
+        self.assertEqual(self.cache(), {'valid': 1})
+
+
+class Shapes(object):
+    """A shape file of (parkeer_id, wkb) rows, like shape_reader.ShapeReader"""
+
+    stem = 'Centrum_parkeerhaven_20190501'
+
+    def __init__(self, rows):
+        self.rows = rows
+
+    def batches(self):
+        batch = {name: [None] * len(self.rows)
+                 for name, _ in import_data.HISTORY_COLUMNS}
+        batch['parkeer_id'] = [parkeer_id for parkeer_id, _ in self.rows]
+        batch['geom'] = [wkb for _, wkb in self.rows]
+        yield batch
+
+
+class TestUpdateHistory(DatabaseTestCase):
+
+    def test_duplicate_keys(self):
+        wkb, = self.execute(
+            "SELECT ST_AsBinary(ST_GeomFromText(%s))",
+            (SQUARE.format(left=0, right=5),))[0]
+        # The same parkeervak_id_md5 twice, with and without a parkeer_id
+        shapes = Shapes([(None, bytes(wkb))] * 2 + [('F1', bytes(wkb))] * 2)
+
+        with self.conn.cursor() as cur:
+            import_data.update_history(
+                self.conn, cur, shapes, 'centrum',
+                datetime.datetime(2019, 5, 1))
+
+        self.assertEqual(self.execute("""SELECT parkeervak_id_md5, count(*)
+            FROM his.parkeervakken_centrum
+            GROUP BY parkeervak_id_md5
+            ORDER BY parkeervak_id_md5"""), [('--', 2), ('F1--', 2)])
+
+
+class TestFastLoad(DatabaseTestCase):
+
+    def test_restore_after_failure(self):
+        def fail(steps, connect, **kwargs):
+            # fast_load_bm.sql and fast_load_bv.sql ran, the next step fails
+            import_data.execute_sql([
+                step for step in import_data.fast_import_files
+                if os.path.basename(step).startswith('fast_load_b')
+            ], **DATABASE)
+            raise RuntimeError('import_bm_bv failed')
+
+        with patch('import_data.run_steps', side_effect=fail):
+            with self.assertRaises(RuntimeError):
+                self.update(fast_load=True)
+
+        self.assertEqual(self.execute("""SELECT relname, relpersistence
+            FROM pg_class
+            WHERE relnamespace = 'bm'::regnamespace AND relkind = 'r'
+                AND relname IN ('parkeervakken', 'reserveringen_fiscaal')
+            ORDER BY relname"""),
+            [('parkeervakken', 'p'), ('reserveringen_fiscaal', 'p')])
+        self.assertEqual(self.execute("""SELECT count(*) FROM pg_constraint
+            WHERE conrelid = 'bv.reserveringen'::regclass
+                AND contype = 'p'"""), [(1,)])
+        self.assertEqual(self.execute(
+            "SELECT to_regclass('bv.parkeervakken_geom_idx')::text"),
+            [('bv.parkeervakken_geom_idx',)])
+
+
+class TestAppendSnapshot(DatabaseTestCase):
+
+    date = datetime.datetime(2019, 5, 1)
+
+    def setUp(self):
+        super().setUp()
+        self.execute("""DROP TABLE IF EXISTS
+            his.parkeervakken_snapshots_centrum_20190501""")
+
+    def append(self):
+        with self.conn.cursor() as cur:
+            import_data.append_snapshot(
+                self.conn, cur, 'parkeervakken_centrum', 'centrum',
+                self.date)
+
+    def test_append_once(self):
+        self.load_history('centrum', [
+            ('F1', SQUARE.format(left=0, right=5)),
+            ('F2', SQUARE.format(left=5, right=10)),
+        ])
+
+        self.append()
+        # The same shape file loaded again
+        self.append()
+
+        self.assertEqual(self.execute("""SELECT parkeer_id, dagen_mask
+            FROM his.parkeervakken_snapshots_centrum_20190501
+            ORDER BY parkeer_id"""), [('F1', 127), ('F2', 127)])
+
+
+class TestDagenMask(TestCase):
+
+    def mask(self, default=False, **days):
+        """The mask of the flags of `DAY_COLUMNS`, `default` unless given
+        in `days`"""
+        return import_data.dagen_mask(tuple(
+            days.get(name, default) for name, _ in import_data.DAY_COLUMNS))
+
+    def test_all_false(self):
+        # Valid on all days
+        self.assertEqual(self.mask(), 0b1111111)
+
+    def test_mix_with_none(self):
+        # Not all false, so only the days that are set
+        self.assertEqual(self.mask(zo=None, ma=True), 0b0000010)
+        # Like the SQL this replaced, NULL is not false
+        self.assertEqual(self.mask(zo=None), 0)
+        self.assertEqual(self.mask(default=None), 0)
+
+    def test_ma_vr(self):
+        self.assertEqual(self.mask(ma_vr=True), 0b0111110)
+
+    def test_ma_za(self):
+        self.assertEqual(self.mask(ma_za=True), 0b1111110)
+        self.assertEqual(self.mask(ma_za=True, ma_vr=True), 0b1111110)
+
+    def test_zo(self):
+        self.assertEqual(self.mask(zo=True), 0b0000001)
+        self.assertEqual(self.mask(zo=True, za=True), 0b1000001)
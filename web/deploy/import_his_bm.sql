@@ -1,3 +1,12 @@
+-- Steps, see steps.py. Statements before the first step run at the
+-- start of every step.
+
+-- his.parkeervakken is partitioned on stadsdeel
+SET enable_partitionwise_aggregate = on;
+SET enable_partitionwise_join = on;
+
+-- step: parkeervakken
+
 TRUNCATE bm.parkeervakken;
 
 INSERT INTO bm.parkeervakken
@@ -13,7 +22,8 @@ INSERT INTO bm.parkeervakken
     e_type,
     bord,
 
-    geom
+    geom,
+    inhoud_hash
 
 )
 
@@ -30,12 +40,23 @@ SELECT DISTINCT ON (parkeer_id)
     e_type,
     bord,
 
-    geom
+    geom,
+
+    -- Changes between imports are found with this hash (update_changes.sql),
+    -- ST_Normalize makes it independent of the ring order and start point
+    md5(
+        ST_AsBinary(ST_Normalize(geom)) ||
+        convert_to(
+            ROW(stadsdeel, buurtcode, straatnaam, soort, "type", aantal,
+                e_type, bord)::text,
+            'UTF8')
+    ) AS inhoud_hash
 
 FROM (
     SELECT
     parkeer_id as pid,
     parkeer_id,
+    parkeervak_id_md5,
     stadsdeel,
     buurtcode,
     straatnaam,
@@ -46,19 +67,29 @@ FROM (
     e_type,
     bord,
 
-    ST_Multi(ST_MakeValid(geom)) as geom
+    -- Invalid geometries were repaired by import_data.py
+    -- (repair_geometries), rows without a geometry are left out
+    COALESCE(cache.geom, pv.geom) as geom
+
+    FROM his.parkeervakken AS pv
+    INNER JOIN his.geometrie_cache AS cache USING (geom_hash)
+    WHERE cache.status != 'dropped') as pvg
+-- The same row of a parkeer_id with several rows (TVM) on every import,
+-- otherwise its inhoud_hash could change without anything changing. Keys
+-- are not unique, rows with the same key are ordered on their content.
+ORDER BY parkeer_id, parkeervak_id_md5, stadsdeel, inhoud_hash;
 
-    FROM his.parkeervakken) as pvg
-WHERE
-    ST_GeometryType(pvg.geom) = 'ST_MultiPolygon';
 
+-- step: fiscaal_leeg
 
 TRUNCATE bm.reserveringen_fiscaal;
 
 
+-- step: fiscaal_tvm
+-- after: fiscaal_leeg
+
 INSERT INTO bm.reserveringen_fiscaal
 (
-    reserverings_key_md5,
     parkeer_id,
     parkeer_id_md5,
     soort,
@@ -70,17 +101,7 @@ INSERT INTO bm.reserveringen_fiscaal
     opmerkingen,
     reservering_bron
 )
-SELECT DISTINCT
-    concat(
-        reserverings_tijden.parkeer_id,
-        '-',
-        bm.datums.datum,
-        '-',
-        reserverings_tijden.begin_tijd,
-        '-',
-        reserverings_tijden.eind_tijd,
-	'fiscaal-tvm'
-    ),
+SELECT
     reserverings_tijden.parkeer_id,
     reserverings_tijden.parkeer_id_md5,
     'FISCAAL',
@@ -111,17 +132,21 @@ INNER JOIN (
     FROM his.parkeervakken
     WHERE tvm_begint ~ '^[0-9][0-9]?[:;][0-9][0-9]?([:;][0-9][0-9]?)?$' AND
           tvm_eindt ~ '^[0-9][0-9]?[:;][0-9][0-9]?([:;][0-9][0-9]?)?$' AND
+          parkeer_id IS NOT NULL AND
           soort = 'FISCAAL' AND
           tvm_begind <= tvm_eindd
 ) AS reserverings_tijden
     ON reserverings_tijden.begin_datum <= bm.datums.datum AND
        bm.datums.datum <= reserverings_tijden.eind_datum
 WHERE reserverings_tijden.begin_datum != reserverings_tijden.eind_datum OR
-      reserverings_tijden.begin_tijd < reserverings_tijden.eind_tijd;
+      reserverings_tijden.begin_tijd < reserverings_tijden.eind_tijd
+ON CONFLICT DO NOTHING;
+
+-- step: fiscaal_tvm_begind
+-- after: fiscaal_leeg
 
 INSERT INTO bm.reserveringen_fiscaal
 (
-    reserverings_key_md5,
     parkeer_id,
     parkeer_id_md5,
     soort,
@@ -133,18 +158,7 @@ INSERT INTO bm.reserveringen_fiscaal
     opmerkingen,
     reservering_bron
 )
-SELECT DISTINCT
-    concat(
-        'ID',
-        reserverings_tijden.parkeer_id,
-        'D',
-        bm.datums.datum,
-        'BT',
-        reserverings_tijden.begin_tijd,
-        'ET',
-        reserverings_tijden.eind_tijd,
-	'FISCAAL'
-    ),
+SELECT
     reserverings_tijden.parkeer_id,
     reserverings_tijden.parkeer_id_md5,
     'FISCAAL',
@@ -175,19 +189,25 @@ INNER JOIN (
         tvm_opmerk AS opmerkingen
     FROM his.parkeervakken
     WHERE tvm_begind IS NOT NULL AND
+          parkeer_id IS NOT NULL AND
           soort = 'FISCAAL' AND
           tvm_begind <= tvm_eindd
 ) AS reserverings_tijden
     ON reserverings_tijden.begin_datum <= bm.datums.datum AND
        bm.datums.datum <= reserverings_tijden.eind_datum
 WHERE reserverings_tijden.begin_datum != reserverings_tijden.eind_datum OR
-      reserverings_tijden.begin_tijd < reserverings_tijden.eind_tijd;
+      reserverings_tijden.begin_tijd < reserverings_tijden.eind_tijd
+ON CONFLICT DO NOTHING;
+
+-- step: mulder
 
 TRUNCATE bm.reserveringen_mulder;
 
+-- Every reservation is expanded to the days of its dagen_mask (see
+-- import_data.py), which are joined to the dates on their day of the week.
+
 INSERT INTO bm.reserveringen_mulder
 (
-    reserverings_key_md5,
     parkeer_id,
     parkeer_id_md5,
     soort,
@@ -197,23 +217,7 @@ INSERT INTO bm.reserveringen_mulder
     eind_tijd,
     opmerkingen
 )
-SELECT DISTINCT  ON (thekey)
-    concat(
-        reserverings_tijden.parkeer_id,
-        '-',
-        the_datums.datum,
-        'BT:',
-        reserverings_tijden.begin_tijd,
-        'EIND:',
-        reserverings_tijden.eind_tijd,
-        'OPMRK:',
-        reserverings_tijden.opmerkingen,
-        'GK:',
-        reserverings_tijden.goedkeurings_datum,
-	'soort:',
-	reserverings_tijden.soort
-
-    ) as thekey,
+SELECT
     reserverings_tijden.parkeer_id,
     reserverings_tijden.parkeer_id_md5,
     'MULDER',
@@ -238,18 +242,13 @@ INNER JOIN (
             WHEN TRUE THEN replace(eindtijd1, ';', ':')::time
             ELSE '23:59:59'::time
         END AS eind_tijd,
-        ma_vr,
-        ma_za,
-        zo,
-        ma,
-        di,
-        wo,
-        "do",
-        vr,
-        za,
+        dagen.dag,
         goedkeurings_datum
     FROM his.parkeervakken
-    WHERE soort = 'MULDER'
+    CROSS JOIN LATERAL generate_series(0, 6) AS dagen(dag)
+    WHERE soort = 'MULDER' AND
+          parkeer_id IS NOT NULL AND
+          dagen_mask & (1 << dagen.dag) != 0
     UNION ALL
     SELECT
         parkeer_id,
@@ -265,59 +264,38 @@ INNER JOIN (
             WHEN TRUE THEN replace(eindtijd2, ';', ':')::time
             ELSE '23:59:59'::time
         END AS eind_tijd,
-        ma_vr,
-        ma_za,
-        zo,
-        ma,
-        di,
-        wo,
-        "do",
-        vr,
-        za,
+        dagen.dag,
         goedkeurings_datum
     FROM his.parkeervakken
+    CROSS JOIN LATERAL generate_series(0, 6) AS dagen(dag)
     WHERE soort = 'MULDER' AND
-          begintijd2 IS NOT NULL
+          parkeer_id IS NOT NULL AND
+          begintijd2 IS NOT NULL AND
+          dagen_mask & (1 << dagen.dag) != 0
 ) AS reserverings_tijden
-ON ((reserverings_tijden.ma_vr AND
-	the_datums.dag >= 1 AND
-	the_datums.dag <= 5)
-	OR
-	(reserverings_tijden.ma_za AND
-	the_datums.dag >= 1 AND
-	the_datums.dag <= 6)
-	OR
-	  (reserverings_tijden.zo AND the_datums.dag = 0)
-	OR
-	  (reserverings_tijden.ma AND the_datums.dag = 1)
-	OR
-	  (reserverings_tijden.di AND the_datums.dag = 2)
-	OR
-	  (reserverings_tijden.wo AND the_datums.dag = 3)
-	OR
-	  (reserverings_tijden."do" AND the_datums.dag = 4)
-	OR
-	  (reserverings_tijden.vr AND the_datums.dag = 5)
-	OR
-	  (reserverings_tijden.za AND the_datums.dag = 6)
-	OR(
-	  NOT reserverings_tijden.ma_vr AND
-  	  NOT reserverings_tijden.ma_za AND
-	  NOT reserverings_tijden.zo AND
-	  NOT reserverings_tijden.ma AND
-	  NOT reserverings_tijden.di AND
-	  NOT reserverings_tijden.wo AND
-	  NOT reserverings_tijden."do" AND
-	  NOT reserverings_tijden.vr AND
-	  NOT reserverings_tijden.za)
-	)
-	AND the_datums.datum >= reserverings_tijden.goedkeurings_datum;
+    ON the_datums.dag = reserverings_tijden.dag AND
+       the_datums.datum >= reserverings_tijden.goedkeurings_datum
+ON CONFLICT DO NOTHING;
+
+-- step: mulder_schoon
+-- after: fiscaal_tvm, fiscaal_tvm_begind, mulder
+
+-- The reserveringen are joined on the start of their primary keys,
+-- (parkeer_id, reserverings_datum). Fresh statistics let the planner pick
+-- the join.
+ANALYZE bm.reserveringen_fiscaal;
+ANALYZE bm.reserveringen_mulder;
 
 TRUNCATE bm.reserveringen_mulder_schoon;
 
+-- step: mulder_schoon_vrij
+-- after: mulder_schoon
+
+-- Mulder reserveringen on a day without fiscale reserveringen. These do
+-- not overlap with the rows of mulder_schoon_overlap, so both steps can
+-- run at the same time.
 INSERT INTO bm.reserveringen_mulder_schoon
 (
-    "reserverings_key_md5",
     "parkeer_id",
     "parkeer_id_md5",
     "soort",
@@ -330,16 +308,33 @@ INSERT INTO bm.reserveringen_mulder_schoon
     "opmerkingen",
     "reservering_bron"
 )
-SELECT mulder.*
+SELECT
+    mulder.parkeer_id,
+    mulder.parkeer_id_md5,
+    mulder.soort,
+    mulder.kenteken,
+    mulder.reserverings_datum,
+    mulder.begin_datum,
+    mulder.eind_datum,
+    mulder.begin_tijd,
+    mulder.eind_tijd,
+    mulder.opmerkingen,
+    mulder.reservering_bron
 FROM bm.reserveringen_mulder AS mulder
-LEFT OUTER JOIN bm.reserveringen_fiscaal AS fiscaal
-    ON mulder.parkeer_id_md5 = fiscaal.parkeer_id_md5 AND
-       mulder.reserverings_datum = fiscaal.reserverings_datum
-WHERE fiscaal.parkeer_id IS NULL;
+WHERE NOT EXISTS (
+    SELECT 1
+    FROM bm.reserveringen_fiscaal AS fiscaal
+    WHERE fiscaal.parkeer_id = mulder.parkeer_id AND
+          fiscaal.reserverings_datum = mulder.reserverings_datum
+)
+ON CONFLICT DO NOTHING;
+
+-- step: mulder_schoon_overlap
+-- after: mulder_schoon
 
+-- Mulder reserveringen cut to the times without fiscale reserveringen
 INSERT INTO bm.reserveringen_mulder_schoon
 (
-    "reserverings_key_md5",
     "parkeer_id",
     "parkeer_id_md5",
     "soort",
@@ -352,17 +347,6 @@ INSERT INTO bm.reserveringen_mulder_schoon
     "opmerkingen"
 )
 SELECT
-    concat(
-        'id',
-        mulder.parkeer_id,
-        'd',
-        mulder.reserverings_datum,
-        'bt',
-        mulder.begin_tijd,
-        'et',
-        mulder.eind_tijd,
-	'mulder'
-    ),
     mulder.parkeer_id,
     mulder.parkeer_id_md5,
     mulder.soort,
@@ -375,15 +359,15 @@ SELECT
     mulder.opmerkingen
 FROM bm.reserveringen_mulder AS mulder
 INNER JOIN bm.reserveringen_fiscaal AS fiscaal
-    ON mulder.parkeer_id_md5 = fiscaal.parkeer_id_md5 AND
+    ON mulder.parkeer_id = fiscaal.parkeer_id AND
        mulder.reserverings_datum = fiscaal.reserverings_datum
 WHERE mulder.begin_tijd < fiscaal.begin_tijd AND
       mulder.eind_tijd > fiscaal.begin_tijd AND
-      mulder.eind_tijd <= fiscaal.eind_tijd;
+      mulder.eind_tijd <= fiscaal.eind_tijd
+ON CONFLICT DO NOTHING;
 
 INSERT INTO bm.reserveringen_mulder_schoon
 (
-    "reserverings_key_md5",
     "parkeer_id",
     "parkeer_id_md5",
     "soort",
@@ -396,19 +380,7 @@ INSERT INTO bm.reserveringen_mulder_schoon
     "opmerkingen",
     "reservering_bron"
 )
-
-SELECT DISTINCT on (thekey)
-    concat(
-        mulder.parkeer_id,
-        '-',
-        mulder.reserverings_datum,
-        '-',
-        fiscaal.begin_tijd,
-        '-',
-        fiscaal.eind_tijd,
-	'-',
-	'fiscaal'
-    ) as thekey,
+SELECT
     mulder.parkeer_id,
     mulder.parkeer_id_md5,
     mulder.soort,
@@ -422,16 +394,16 @@ SELECT DISTINCT on (thekey)
     'mulder-join-fiscaal'
 FROM bm.reserveringen_mulder AS mulder
 INNER JOIN bm.reserveringen_fiscaal AS fiscaal
-    ON mulder.parkeer_id_md5 = fiscaal.parkeer_id_md5 AND
+    ON mulder.parkeer_id = fiscaal.parkeer_id AND
        mulder.reserverings_datum = fiscaal.reserverings_datum
 WHERE mulder.begin_tijd >= fiscaal.begin_tijd AND
       mulder.begin_tijd <= fiscaal.eind_tijd AND
-      mulder.eind_tijd >= fiscaal.eind_tijd;
+      mulder.eind_tijd >= fiscaal.eind_tijd
+ON CONFLICT DO NOTHING;
 
 
 INSERT INTO bm.reserveringen_mulder_schoon
 (
-    "reserverings_key_md5",
     "parkeer_id",
     "parkeer_id_md5",
     "soort",
@@ -444,17 +416,7 @@ INSERT INTO bm.reserveringen_mulder_schoon
     "opmerkingen",
     "reservering_bron"
 )
-SELECT  /* DISTINCT on (thekey) */
-    concat(
-        a.parkeer_id,
-        '-',
-        a.reserverings_datum,
-        '-',
-        a.begin_tijd,
-        '*',
-        a.eind_tijd,
-        '-m>f'
-    ) as thekey,
+SELECT
     a.parkeer_id,
     a.parkeer_id_md5,
     a.soort,
@@ -482,8 +444,9 @@ FROM (
         mulder.opmerkingen
     FROM bm.reserveringen_mulder AS mulder
     INNER JOIN bm.reserveringen_fiscaal AS fiscaal
-        ON mulder.parkeer_id_md5 = fiscaal.parkeer_id_md5 AND
+        ON mulder.parkeer_id = fiscaal.parkeer_id AND
         mulder.reserverings_datum = fiscaal.reserverings_datum
     WHERE mulder.begin_tijd < fiscaal.begin_tijd AND
         mulder.eind_tijd > fiscaal.eind_tijd
-) AS a;
+) AS a
+ON CONFLICT DO NOTHING;
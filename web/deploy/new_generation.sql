@@ -0,0 +1,5 @@
+-- Start a new import generation (bv.import_generations), after the bv
+-- layer is loaded. An import that loads its sources with several updates
+-- starts one generation, on the last update: the others are --partial.
+
+INSERT INTO bv.import_generations DEFAULT VALUES;
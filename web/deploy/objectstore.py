@@ -1,7 +1,29 @@
+"""
+Download the latest parkeervakken zips from the objectstore.
+
+Objects are streamed in chunks to `<name>.part` and renamed when complete
+and verified against the ETag (the MD5 of the object) and size of the
+listing. An interrupted download is resumed with a Range request. The
+fiscaal and niet fiscaal zips are downloaded at the same time, each on its
+own connection.
+
+What was downloaded and imported is kept in a state file. The listing
+starts after the objects fetched last time, and objects without a newer
+version are checked with a HEAD request. When nothing changed since the
+last import the script exits with `UNCHANGED`, so the import can stop.
+After a successful import `--imported` records the fetched objects as
+imported.
+"""
+import argparse
+import hashlib
+import json
 import logging
 import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
 
 from swiftclient.client import Connection
+from swiftclient.exceptions import ClientException
 
 from dateutil import parser
 
@@ -16,97 +38,288 @@ logging.getLogger("swiftclient").setLevel(logging.WARNING)
 
 destination_dir = "/data/"
 
-assert os.getenv('PARKEERVAKKEN_OBJECTSTORE_PASSWORD')
-
 global container
 
-container = 'Parkeervakken'
+container = os.getenv('OBJECTSTORE_CONTAINER', 'Parkeervakken')
+
+prefix = os.getenv('OBJECTSTORE_PREFIX', '')
+
+state_file = os.getenv(
+    'OBJECTSTORE_STATE', f'{destination_dir}parkeren/objectstore.json')
+
+CHUNK_SIZE = 1024 * 1024
+
+KINDS = ('fiscaal', 'nietfiscaal')
+
+# Exit status when nothing changed since the last import
+UNCHANGED = 3
 
 object_store = {
-    'auth_version': '2.0',
-    'authurl': 'https://identity.stack.cloudvps.com/v2.0',
+    'auth_version': os.getenv('OBJECTSTORE_AUTH_VERSION', '2.0'),
+    'authurl': os.getenv(
+        'OBJECTSTORE_AUTHURL', 'https://identity.stack.cloudvps.com/v2.0'),
     'user': os.getenv('OBJECTSTORE_USER', 'parkeervakken'),
     'key': os.getenv('PARKEERVAKKEN_OBJECTSTORE_PASSWORD', 'insecure'),
-    'tenant_name': 'BGE000081 Parkeervakken',
+    'tenant_name': os.getenv(
+        'OBJECTSTORE_TENANT_NAME', 'BGE000081 Parkeervakken'),
     'os_options': {
-        'tenant_id': '091e3bedc85447ef936e82bcda88fcac',
-        'region_name': 'NL',
+        'tenant_id': os.getenv(
+            'OBJECTSTORE_TENANT_ID', '091e3bedc85447ef936e82bcda88fcac'),
+        'region_name': os.getenv('OBJECTSTORE_REGION_NAME', 'NL'),
     }
 }
 
-parkeren_conn = Connection(**object_store)
 
+def connect():
+    """A new connection, swiftclient connections are not thread safe"""
+    return Connection(**object_store)
 
-def get_store_object(object_meta_data):
-    """ get a single file from object store """
-    return parkeren_conn.get_object(
-        container, object_meta_data['name'])[1]
 
+def is_manifest(headers):
+    """
+    The ETag of a large object manifest is not the MD5 of the contents, so
+    it can not be verified.
+    """
+    return 'x-object-manifest' in headers or \
+        'x-static-large-object' in headers
 
-def save_file(time, object_meta_data):
+
+def download(conn, object_meta_data, target, chunk_size=CHUNK_SIZE):
+    """
+    Stream a single object from the objectstore to `target`. A `.part` file
+    left by an earlier download is resumed.
+    """
+    name = object_meta_data['name']
+    part = target + '.part'
+
+    md5 = hashlib.md5()
+    offset = 0
+
+    if os.path.isfile(part):
+        with open(part, 'rb') as f:
+            for chunk in iter(lambda: f.read(chunk_size), b''):
+                md5.update(chunk)
+                offset += len(chunk)
+
+    size = object_meta_data.get('bytes')
+    if size is not None and offset > size:
+        log.info('Restarting %s, %d bytes of %d', name, offset, size)
+        md5 = hashlib.md5()
+        offset = 0
+
+    # A complete `.part`, left by a crash before the rename, is only
+    # verified: the objectstore answers a Range from its end with a 416
+    resp_headers = {}
+    if size is None or offset < size:
+        headers = {}
+        if offset:
+            log.info('Resuming %s at %d bytes', name, offset)
+            headers['Range'] = 'bytes={}-'.format(offset)
+
+        resp_headers, body = conn.get_object(
+            container, name, resp_chunk_size=chunk_size, headers=headers)
+
+        if offset and 'content-range' not in resp_headers:
+            # The objectstore ignored the Range, start over
+            log.info('Range not supported, restarting %s', name)
+            md5 = hashlib.md5()
+            offset = 0
+
+        with open(part, 'ab' if offset else 'wb') as f:
+            for chunk in body:
+                md5.update(chunk)
+                offset += len(chunk)
+                f.write(chunk)
+
+    try:
+        if size is not None and offset != size:
+            raise ValueError('Size of {} is {}, expected {}'.format(
+                name, offset, size))
+
+        etag = (object_meta_data.get('hash') or
+                resp_headers.get('etag', '')).strip('"')
+        if etag and not is_manifest(resp_headers) and \
+                etag != md5.hexdigest():
+            raise ValueError('MD5 of {} is {}, expected {}'.format(
+                name, md5.hexdigest(), etag))
+    except ValueError:
+        os.remove(part)
+        raise
+
+    os.replace(part, target)
+
+
+def kind_of(name):
+    return 'nietfiscaal' if 'nietfiscaal' in name else 'fiscaal'
+
+
+def target_of(object_meta_data):
     zipname = object_meta_data['name'].split('/')[-1]
+    return f'{destination_dir}parkeren/{zipname}'
+
+
+def object_state(object_meta_data):
+    """What identifies a version of an object"""
+    return {
+        'name': object_meta_data['name'],
+        'etag': object_meta_data.get('hash'),
+        'bytes': object_meta_data.get('bytes'),
+        'last_modified': object_meta_data.get('last_modified'),
+    }
+
 
+def same_object(a, b):
+    """Same name, ETag and size. last_modified differs in format between
+    the listing and a HEAD request."""
+    keys = ('name', 'etag', 'bytes')
+    return bool(a) and bool(b) and \
+        all(a.get(key) == b.get(key) for key in keys)
+
+
+def load_state(path=None):
+    path = path or state_file
+    if not os.path.isfile(path):
+        return {'fetched': {}, 'imported': {}}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_state(state, path=None):
+    path = path or state_file
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + '.part', 'w') as f:
+        json.dump(state, f, indent=2, sort_keys=True)
+    os.replace(path + '.part', path)
+
+
+def head(conn, name):
+    """Listing style metadata of a single object, None if it is gone"""
+    try:
+        headers = conn.head_object(container, name)
+    except ClientException as e:
+        if e.http_status == 404:
+            return None
+        raise
+
+    return {
+        'name': name,
+        'hash': headers.get('etag', '').strip('"'),
+        'bytes': int(headers['content-length']),
+        'last_modified': headers.get('last-modified'),
+        'content_type': headers.get('content-type'),
+    }
+
+
+def save_file(time, object_meta_data, conn):
     # create the directory inclusive nonexisting path
     os.makedirs(f'{destination_dir}parkeren/', exist_ok=True)
 
-    target = f'{destination_dir}parkeren/{zipname}'
+    target = target_of(object_meta_data)
 
-    if os.path.isfile(target):
-        log.debug('Already downloaded %s', target)
-        return
+    log.info('Downloading latest: %s %s', time, object_meta_data['name'])
+    download(conn, object_meta_data, target)
 
-    log.info('Downloading latest: %s %s', time, zipname)
-    latest_zip = get_store_object(object_meta_data)
 
-    # save output to file!
-    with open(target, 'wb') as outputzip:
-        outputzip.write(latest_zip)
+def _save_file(time, object_meta_data, connect):
+    conn = connect()
+    try:
+        save_file(time, object_meta_data, conn)
+    finally:
+        conn.close()
 
 
-def get_latest_zipfile():
+def latest_objects(conn, state):
     """
-    Get latest zipfile uploaded by mks
+    The latest fiscaal and niet fiscaal object. Object names sort by date,
+    so the listing starts after the oldest object fetched last time. An
+    object without a newer version in the listing is looked up with HEAD.
     """
-    niet_fiscaal = []
-    zip_list = []
+    fetched = state['fetched']
+    marker = None
+    if all(kind in fetched for kind in KINDS):
+        marker = min(fetched[kind]['name'] for kind in KINDS)
 
     meta_data = get_full_container_list(
-        parkeren_conn, container)
+        conn, container, prefix=prefix, marker=marker)
 
+    latest = {}
     for o_info in meta_data:
         if o_info['content_type'] in [
                 'application/zip', 'application/octet-stream']:
-            dt = parser.parse(o_info['last_modified'])
-            if 'nietfiscaal' in o_info['name']:
-                niet_fiscaal.append((dt, o_info))
-                continue
-            zip_list.append((dt, o_info))
-
-    zips_sorted_by_time = sorted(zip_list)
-    nf_zips_sorted_by_time = sorted(niet_fiscaal)
+            kind = kind_of(o_info['name'])
+            latest.setdefault(kind, []).append(
+                (parser.parse(o_info['last_modified']), o_info))
 
     log.info('Available files..')
 
-    for time, meta in zips_sorted_by_time:
-        log.info('%s %s', time, meta['name'])
+    for kind in KINDS:
+        objects = sorted(latest.pop(kind, []), key=lambda item: item[0])
+        for time, meta in objects:
+            log.info('%s %s', time, meta['name'])
 
-    for time, meta in nf_zips_sorted_by_time:
-        log.info('%s %s', time, meta['name'])
+        if objects:
+            latest[kind] = objects[-1][1]
+        elif kind in fetched:
+            latest[kind] = head(conn, fetched[kind]['name'])
 
-    if not zips_sorted_by_time:
-        raise ValueError
+        if not latest.get(kind):
+            if marker:
+                # The last fetched object is gone, look at everything
+                state = dict(state, fetched={})
+                return latest_objects(conn, state)
+            raise ValueError('No {} zip in the objectstore'.format(kind))
 
-    if not nf_zips_sorted_by_time:
-        raise ValueError
+    return latest
 
-    time, object_meta_data = zips_sorted_by_time[-1]
 
-    # Download the latest data
-    save_file(time, object_meta_data)
-
-    # Download laatste niet fiscaal data
-    time, object_meta_data = nf_zips_sorted_by_time[-1]
-    save_file(time, object_meta_data)
+def get_latest_zipfile(connect=connect, path=None):
+    """
+    Get latest zipfile uploaded by mks. Returns False when nothing changed
+    since the last import.
+    """
+    state = load_state(path)
+
+    conn = connect()
+    try:
+        latest = latest_objects(conn, state)
+    finally:
+        conn.close()
+
+    current = {kind: object_state(latest[kind]) for kind in KINDS}
+
+    if all(same_object(current[kind], state['imported'].get(kind)) and
+           os.path.isfile(target_of(latest[kind])) for kind in KINDS):
+        log.info('Nothing changed since the last import')
+        return False
+
+    # Download the latest data and the latest niet fiscaal data, unless
+    # it was downloaded before
+    downloads = [
+        kind for kind in KINDS
+        if not same_object(current[kind], state['fetched'].get(kind)) or
+        not os.path.isfile(target_of(latest[kind]))
+    ]
+
+    with ThreadPoolExecutor(max_workers=len(KINDS)) as executor:
+        futures = {
+            kind: executor.submit(
+                _save_file, current[kind]['last_modified'], latest[kind],
+                connect)
+            for kind in downloads
+        }
+        for kind, future in futures.items():
+            future.result()
+            state['fetched'][kind] = current[kind]
+            save_state(state, path)
+
+    return True
+
+
+def mark_imported(path=None):
+    """Record the fetched objects as imported"""
+    state = load_state(path)
+    state['imported'] = dict(state['fetched'])
+    save_state(state, path)
 
 
 def get_full_container_list(conn, container, **kwargs):
@@ -128,6 +341,27 @@ def get_full_container_list(conn, container, **kwargs):
     return seed
 
 
+def setup_argparse():
+    parser = argparse.ArgumentParser(
+        description='Download the latest parkeervakken zips')
+
+    parser.add_argument('--imported',
+                        action='store_true',
+                        help=('Record the downloaded zips as imported, '
+                              'after a successful import'))
+
+    return parser
+
+
 if __name__ == "__main__":
+    args = setup_argparse().parse_args()
+
+    if args.imported:
+        mark_imported()
+        sys.exit()
+
+    assert os.getenv('PARKEERVAKKEN_OBJECTSTORE_PASSWORD')
+
     # Download files from objectstore
-    get_latest_zipfile()
+    if not get_latest_zipfile():
+        sys.exit(UNCHANGED)
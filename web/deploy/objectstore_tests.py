@@ -0,0 +1,173 @@
+import hashlib
+import os
+import tempfile
+from unittest import TestCase
+
+import objectstore
+
+
+class FakeConnection(object):
+    """Swift compatible stand-in, serving `objects` from memory"""
+
+    def __init__(self, objects, ranges=True):
+        self.objects = objects
+        self.ranges = ranges
+        self.requests = []
+
+    def get_container(self, container, limit=None, marker=None, prefix=''):
+        self.requests.append(('listing', marker))
+        names = sorted(
+            name for name in self.objects
+            if name > (marker or '') and name.startswith(prefix or ''))
+        return {}, [{
+            'name': name,
+            'bytes': len(self.objects[name]),
+            'hash': hashlib.md5(self.objects[name]).hexdigest(),
+            'content_type': 'application/zip',
+            'last_modified': '2019-05-0{}T12:00:00'.format(number),
+        } for number, name in enumerate(names[:limit], 1)]
+
+    def get_object(self, container, name, resp_chunk_size=None,
+                   headers=None):
+        self.requests.append((name, headers))
+        data = self.objects[name]
+        resp_headers = {'etag': hashlib.md5(data).hexdigest()}
+
+        start = 0
+        if self.ranges and headers and 'Range' in headers:
+            start = int(headers['Range'][len('bytes='):-1])
+            resp_headers['content-range'] = 'bytes {}-{}/{}'.format(
+                start, len(data) - 1, len(data))
+
+        def chunks():
+            for i in range(start, len(data), resp_chunk_size):
+                yield data[i:i + resp_chunk_size]
+
+        return resp_headers, chunks()
+
+    def head_object(self, container, name):
+        self.requests.append((name, 'HEAD'))
+        data = self.objects[name]
+        return {
+            'etag': hashlib.md5(data).hexdigest(),
+            'content-length': str(len(data)),
+            'content-type': 'application/zip',
+        }
+
+    def close(self):
+        pass
+
+
+class TestObjectstore(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.target = os.path.join(self.directory.name, 'parkeervakken.zip')
+        self.data = bytes(range(256)) * 10
+        self.conn = FakeConnection({'parkeervakken.zip': self.data})
+        _, self.listing = self.conn.get_container(objectstore.container)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_download(self):
+        objectstore.download(
+            self.conn, self.listing[0], self.target, chunk_size=100)
+
+        with open(self.target, 'rb') as f:
+            self.assertEqual(f.read(), self.data)
+        self.assertFalse(os.path.exists(self.target + '.part'))
+
+    def test_download_resume(self):
+        with open(self.target + '.part', 'wb') as f:
+            f.write(self.data[:1000])
+
+        objectstore.download(
+            self.conn, self.listing[0], self.target, chunk_size=100)
+
+        with open(self.target, 'rb') as f:
+            self.assertEqual(f.read(), self.data)
+        self.assertEqual(
+            self.conn.requests[-1][1], {'Range': 'bytes=1000-'})
+
+    def test_download_resume_without_range(self):
+        self.conn.ranges = False
+        with open(self.target + '.part', 'wb') as f:
+            f.write(self.data[:1000])
+
+        objectstore.download(
+            self.conn, self.listing[0], self.target, chunk_size=100)
+
+        with open(self.target, 'rb') as f:
+            self.assertEqual(f.read(), self.data)
+
+    def test_download_complete_part(self):
+        with open(self.target + '.part', 'wb') as f:
+            f.write(self.data)
+
+        objectstore.download(
+            self.conn, self.listing[0], self.target, chunk_size=100)
+
+        with open(self.target, 'rb') as f:
+            self.assertEqual(f.read(), self.data)
+        # Verified only, not requested from its end
+        self.assertEqual(self.conn.requests, [('listing', None)])
+
+    def test_download_corrupt(self):
+        self.listing[0]['hash'] = hashlib.md5(b'other').hexdigest()
+
+        with self.assertRaises(ValueError):
+            objectstore.download(
+                self.conn, self.listing[0], self.target, chunk_size=100)
+
+        self.assertFalse(os.path.exists(self.target))
+        self.assertFalse(os.path.exists(self.target + '.part'))
+
+
+class TestLatestZipfile(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.destination_dir = objectstore.destination_dir
+        objectstore.destination_dir = self.directory.name + '/'
+        self.state = os.path.join(self.directory.name, 'state.json')
+        self.conn = FakeConnection({
+            '20190501_parkeervakken.zip': b'fiscaal',
+            '20190501_parkeervakken_nietfiscaal.zip': b'nietfiscaal',
+        })
+
+    def tearDown(self):
+        objectstore.destination_dir = self.destination_dir
+        self.directory.cleanup()
+
+    def fetch(self):
+        return objectstore.get_latest_zipfile(
+            connect=lambda: self.conn, path=self.state)
+
+    def test_unchanged(self):
+        self.assertTrue(self.fetch())
+        # Downloaded, not imported yet
+        self.assertTrue(self.fetch())
+        objectstore.mark_imported(self.state)
+
+        self.conn.requests = []
+        self.assertFalse(self.fetch())
+
+        # Listed after the fiscaal zip, the fiscaal zip itself is checked
+        # with HEAD and nothing is downloaded
+        self.assertEqual(self.conn.requests, [
+            ('listing', '20190501_parkeervakken.zip'),
+            ('20190501_parkeervakken.zip', 'HEAD'),
+        ])
+
+    def test_new_zip(self):
+        self.fetch()
+        objectstore.mark_imported(self.state)
+
+        self.conn.objects['20190502_parkeervakken.zip'] = b'nieuw'
+        self.assertTrue(self.fetch())
+
+        target = os.path.join(
+            self.directory.name, 'parkeren', '20190502_parkeervakken.zip')
+        with open(target, 'rb') as f:
+            self.assertEqual(f.read(), b'nieuw')
@@ -0,0 +1,402 @@
+"""
+Read ESRI shape files and load them with binary COPY.
+
+Only what the parkeervakken exports use is supported: (multi)polygon
+shapes, read as 2D MultiPolygons, and dBASE III attributes. Attributes are
+decoded per batch into columns, {name: [value, ...]}. Field names are lower
+case, like shp2pgsql makes them.
+
+Rings are grouped into polygons like shp2pgsql does: clockwise rings are
+outer rings, a counter-clockwise ring is a hole of the outer ring that
+contains it. A hole that is not inside an outer ring becomes an outer ring.
+"""
+import datetime
+import decimal
+import struct
+import sys
+from array import array
+
+SHP_HEADER = struct.Struct('>i20xi4x4x')
+SHP_FILE_CODE = 9994
+SHP_HEADER_SIZE = 100
+RECORD_HEADER = struct.Struct('>ii')
+POLYGON_HEADER = struct.Struct('<i32xii')
+
+NULL_SHAPE = 0
+POLYGON_TYPES = (5, 15, 25)  # Polygon, PolygonZ, PolygonM
+
+DBF_HEADER = struct.Struct('<4xIHH20x')
+DBF_FIELD = struct.Struct('<11sc4xBB14x')
+DBF_DELETED = 0x2a  # *
+
+WKB_MULTIPOLYGON = struct.Struct('<BII')
+WKB_POLYGON = struct.Struct('<BII')
+UINT32 = struct.Struct('<I')
+
+COPY_HEADER = b'PGCOPY\n\xff\r\n\x00' + struct.pack('>ii', 0, 0)
+COPY_TRAILER = struct.pack('>h', -1)
+COPY_FIELDS = struct.Struct('>h')
+COPY_LENGTH = struct.Struct('>i')
+COPY_NULL = COPY_LENGTH.pack(-1)
+
+POSTGRES_EPOCH = datetime.date(2000, 1, 1).toordinal()
+
+BATCH_SIZE = 10000
+
+
+def read_shp(buffer):
+    """
+    The geometries of a .shp file as MultiPolygon WKB, None for a null
+    shape.
+    """
+    data = memoryview(buffer)
+
+    file_code, length = SHP_HEADER.unpack_from(data, 0)
+    if file_code != SHP_FILE_CODE:
+        raise ValueError('Not a shape file')
+
+    end = min(length * 2, len(data))
+    offset = SHP_HEADER_SIZE
+
+    while offset + RECORD_HEADER.size <= end:
+        _, content_length = RECORD_HEADER.unpack_from(data, offset)
+        offset += RECORD_HEADER.size
+        content = data[offset:offset + content_length * 2]
+        offset += content_length * 2
+
+        yield _polygon_wkb(content)
+
+
+def _polygon_wkb(content):
+    shape_type, = struct.unpack_from('<i', content, 0)
+
+    if shape_type == NULL_SHAPE:
+        return None
+
+    if shape_type not in POLYGON_TYPES:
+        raise ValueError('Unsupported shape type {}'.format(shape_type))
+
+    _, n_parts, n_points = POLYGON_HEADER.unpack_from(content, 0)
+    parts = array('i')
+    parts.frombytes(content[44:44 + 4 * n_parts])
+    points_at = 44 + 4 * n_parts
+    points = content[points_at:points_at + 16 * n_points]
+    coords = array('d')
+    coords.frombytes(points)
+    if sys.byteorder == 'big':
+        parts.byteswap()
+        coords.byteswap()
+
+    bounds = list(parts) + [n_points]
+    outers = []
+    holes = []
+    for start, stop in zip(bounds, bounds[1:]):
+        if stop - start < 4:
+            continue
+        ring = (start, stop)
+        if _signed_area(coords, start, stop) < 0:
+            outers.append([ring])
+        else:
+            holes.append(ring)
+
+    for hole in holes:
+        x, y = coords[2 * hole[0]], coords[2 * hole[0] + 1]
+        for polygon in outers:
+            outer_start, outer_stop = polygon[0]
+            if _contains(coords, outer_start, outer_stop, x, y):
+                polygon.append(hole)
+                break
+        else:
+            outers.append([hole])
+
+    # The points of a shape file are little endian doubles, like WKB
+    wkb = [WKB_MULTIPOLYGON.pack(1, 6, len(outers))]
+    for polygon in outers:
+        wkb.append(WKB_POLYGON.pack(1, 3, len(polygon)))
+        for start, stop in polygon:
+            wkb.append(UINT32.pack(stop - start))
+            wkb.append(points[16 * start:16 * stop])
+
+    return b''.join(wkb)
+
+
+def _signed_area(coords, start, stop):
+    """Twice the signed area of a ring, negative when clockwise"""
+    area = 0.0
+    for i in range(start, stop - 1):
+        area += coords[2 * i] * coords[2 * i + 3] - \
+            coords[2 * i + 2] * coords[2 * i + 1]
+    return area
+
+
+def _contains(coords, start, stop, x, y):
+    """Whether (x, y) is inside the ring, by ray casting"""
+    inside = False
+    for i in range(start, stop - 1):
+        x1, y1 = coords[2 * i], coords[2 * i + 1]
+        x2, y2 = coords[2 * i + 2], coords[2 * i + 3]
+        if (y1 > y) != (y2 > y) and \
+                x < (x2 - x1) * (y - y1) / (y2 - y1) + x1:
+            inside = not inside
+    return inside
+
+
+class Field(object):
+
+    def __init__(self, name, field_type, length, decimals):
+        self.name = name
+        self.type = field_type
+        self.length = length
+        self.decimals = decimals
+
+    def __repr__(self):
+        return '<Field {} {}({},{})>'.format(
+            self.name, self.type, self.length, self.decimals)
+
+
+def read_dbf_fields(data):
+    n_records, header_length, record_length = DBF_HEADER.unpack_from(data, 0)
+
+    fields = []
+    offset = 32
+    while offset < header_length - 1 and data[offset] != 0x0d:
+        name, field_type, length, decimals = DBF_FIELD.unpack_from(
+            data, offset)
+        fields.append(Field(
+            name.split(b'\x00', 1)[0].decode('ascii').strip().lower(),
+            field_type.decode('ascii').upper(), length, decimals))
+        offset += DBF_FIELD.size
+
+    return n_records, header_length, record_length, fields
+
+
+def _decode(field, raw, encoding):
+    if field.type in ('C', 'M'):
+        value = raw.decode(encoding).rstrip(' \x00')
+        return value or None
+
+    value = raw.decode('ascii', 'replace').strip(' \x00')
+
+    if field.type in ('N', 'F'):
+        if not value or set(value) == {'*'}:
+            return None
+        try:
+            return decimal.Decimal(value)
+        except decimal.InvalidOperation:
+            return None
+
+    if field.type == 'L':
+        if value in ('T', 't', 'Y', 'y'):
+            return True
+        if value in ('F', 'f', 'N', 'n'):
+            return False
+        return None
+
+    if field.type == 'D':
+        if not value or value == '00000000':
+            return None
+        try:
+            return datetime.datetime.strptime(value, '%Y%m%d').date()
+        except ValueError:
+            return None
+
+    return value or None
+
+
+def read_dbf(buffer, encoding='latin-1'):
+    """
+    The fields of a .dbf file and a generator of its records, tuples of
+    values in field order. Deleted records are None.
+    """
+    data = memoryview(buffer)
+    n_records, header_length, record_length, fields = read_dbf_fields(data)
+
+    def records():
+        offset = header_length
+        for _ in range(n_records):
+            record = data[offset:offset + record_length]
+            offset += record_length
+            if len(record) < record_length:
+                break
+            if record[0] == DBF_DELETED:
+                yield None
+                continue
+
+            values = []
+            position = 1
+            for field in fields:
+                raw = bytes(record[position:position + field.length])
+                position += field.length
+                values.append(_decode(field, raw, encoding))
+            yield tuple(values)
+
+    return fields, records()
+
+
+class ShapeReader(object):
+    """
+    The shapes and attributes of the shape file `stem` in a `Source` (see
+    `sources.py`).
+    """
+
+    def __init__(self, source, stem, encoding='latin-1'):
+        self.source = source
+        self.stem = stem
+        self.encoding = encoding
+
+    def _member(self, extension):
+        for name in self.source.members(self.stem):
+            if name.lower().endswith('.' + extension):
+                return name
+        raise FileNotFoundError('{}.{}'.format(self.stem, extension))
+
+    def batches(self, size=BATCH_SIZE):
+        """
+        The records in batches of `size`, as columns. The geometries are
+        in the column `geom`. Deleted records are skipped.
+        """
+        shp = self.source.buffer(self._member('shp'))
+        dbf = self.source.buffer(self._member('dbf'))
+
+        fields, records = read_dbf(dbf, self.encoding)
+        names = [field.name for field in fields] + ['geom']
+
+        batch = []
+        for geometry, record in zip(read_shp(shp), records):
+            if record is None:
+                continue
+            batch.append(record + (geometry,))
+            if len(batch) == size:
+                yield dict(zip(names, map(list, zip(*batch))))
+                batch = []
+
+        if batch:
+            yield dict(zip(names, map(list, zip(*batch))))
+
+
+def encode_numeric(value):
+    """The binary representation of a PostgreSQL numeric"""
+    value = decimal.Decimal(value)
+    if value.is_nan():
+        return struct.pack('>hhHH', 0, 0, 0xc000, 0)
+
+    sign, digits, exponent = value.as_tuple()
+    digits = ''.join(map(str, digits))
+    if exponent > 0:
+        digits += '0' * exponent
+        exponent = 0
+    scale = -exponent
+    digits = digits.zfill(scale + 1)
+
+    integer = digits[:len(digits) - scale]
+    fraction = digits[len(digits) - scale:]
+    integer = integer.zfill((len(integer) + 3) // 4 * 4)
+    fraction = fraction.ljust((len(fraction) + 3) // 4 * 4, '0')
+
+    groups = [int(integer[i:i + 4]) for i in range(0, len(integer), 4)]
+    weight = len(groups) - 1
+    groups += [int(fraction[i:i + 4]) for i in range(0, len(fraction), 4)]
+
+    while groups and groups[0] == 0:
+        groups.pop(0)
+        weight -= 1
+    while groups and groups[-1] == 0:
+        groups.pop()
+    if not groups:
+        weight = 0
+
+    return struct.pack(
+        '>hhHH{}H'.format(len(groups)), len(groups), weight,
+        0x4000 if sign else 0, scale, *groups)
+
+
+def encode_date(value):
+    if isinstance(value, str):
+        value = datetime.datetime.strptime(
+            value.replace('-', ''), '%Y%m%d').date()
+    return struct.pack('>i', value.toordinal() - POSTGRES_EPOCH)
+
+
+ENCODERS = {
+    'text': lambda value: str(value).encode('utf-8'),
+    'boolean': lambda value: b'\x01' if value else b'\x00',
+    'smallint': lambda value: struct.pack('>h', value),
+    'integer': lambda value: struct.pack('>i', value),
+    'numeric': encode_numeric,
+    'date': encode_date,
+    'geometry': bytes,
+}
+
+
+def copy_data(columns, batches):
+    """
+    Binary COPY data of `batches`, in chunks. `columns` is a list of
+    (name, type), with the types of `ENCODERS`.
+    """
+    encoders = [(name, ENCODERS[column_type])
+                for name, column_type in columns]
+    field_count = COPY_FIELDS.pack(len(columns))
+
+    yield COPY_HEADER
+
+    for batch in batches:
+        data = [batch[name] for name, _ in encoders]
+        encode = [encoder for _, encoder in encoders]
+        chunk = []
+        for row in zip(*data):
+            chunk.append(field_count)
+            for encoder, value in zip(encode, row):
+                if value is None:
+                    chunk.append(COPY_NULL)
+                else:
+                    value = encoder(value)
+                    chunk.append(COPY_LENGTH.pack(len(value)))
+                    chunk.append(value)
+        yield b''.join(chunk)
+
+    yield COPY_TRAILER
+
+
+class ChunkReader(object):
+    """File-like reader of a generator of chunks, for `copy_expert`"""
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._buffer = bytearray()
+        self.bytes = 0
+
+    def read(self, size=-1):
+        while size < 0 or len(self._buffer) < size:
+            try:
+                self._buffer += next(self._chunks)
+            except StopIteration:
+                break
+
+        if size < 0:
+            size = len(self._buffer)
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        self.bytes += len(data)
+        return data
+
+
+def copy_batches(cur, table, columns, batches, buffer_size=1024 * 1024):
+    """
+    COPY `batches` to `table` in the binary format. Returns the number of
+    rows and the bytes of COPY data sent to the server, which is not the
+    size of the shape file they were read from.
+    """
+    rows = 0
+
+    def counted():
+        nonlocal rows
+        for batch in batches:
+            rows += len(batch[columns[0][0]])
+            yield batch
+
+    reader = ChunkReader(copy_data(columns, counted()))
+    cur.copy_expert(
+        'COPY {} ({}) FROM STDIN WITH (FORMAT binary)'.format(
+            table, ', '.join('"{}"'.format(name) for name, _ in columns)),
+        reader, size=buffer_size)
+    return rows, reader.bytes
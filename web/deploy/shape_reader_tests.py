@@ -0,0 +1,135 @@
+import datetime
+import decimal
+import os
+import struct
+import tempfile
+from unittest import TestCase
+
+import shape_reader
+from geometry_snapshot import parse_wkb
+from sources import open_source
+
+STEM = 'Centrum_parkeerhaven_20190501'
+
+# A square with a square hole, clockwise outer ring, counter-clockwise hole
+OUTER = [(0, 0), (0, 10), (10, 10), (10, 0), (0, 0)]
+HOLE = [(2, 2), (4, 2), (4, 4), (2, 4), (2, 2)]
+
+FIELDS = [
+    ('PARKEER_ID', b'C', 10, 0),
+    ('AANTAL', b'N', 10, 0),
+    ('MA_VR', b'L', 1, 0),
+    ('TVM_BEGIND', b'D', 8, 0),
+]
+
+
+def polygon_record(rings):
+    points = [point for ring in rings for point in ring]
+    parts = []
+    for ring in rings[:-1]:
+        parts.append((parts[-1] if parts else 0) + len(ring))
+    parts = [0] + parts
+    return struct.pack('<i4dii', 5, 0, 0, 10, 10, len(parts), len(points)) + \
+        struct.pack('<{}i'.format(len(parts)), *parts) + \
+        b''.join(struct.pack('<2d', *point) for point in points)
+
+
+def write_shp(path, contents):
+    records = b''.join(
+        struct.pack('>ii', number, len(content) // 2) + content
+        for number, content in enumerate(contents, 1))
+    header = struct.pack('>i20xi', 9994, (100 + len(records)) // 2) + \
+        struct.pack('<ii4d32x', 1000, 5, 0, 0, 10, 10)
+    with open(path, 'wb') as f:
+        f.write(header + records)
+
+
+def write_dbf(path, records):
+    record_length = 1 + sum(length for _, _, length, _ in FIELDS)
+    header_length = 32 + 32 * len(FIELDS) + 1
+    data = struct.pack('<B3xIHH20x', 3, len(records), header_length,
+                       record_length)
+    for name, field_type, length, decimals in FIELDS:
+        data += struct.pack('<11sc4xBB14x', name.encode('ascii'),
+                            field_type, length, decimals)
+    data += b'\r'
+    for deleted, values in records:
+        data += b'*' if deleted else b' '
+        for (_, field_type, length, _), value in zip(FIELDS, values):
+            value = value.encode('latin-1')
+            if field_type == b'N':
+                data += value.rjust(length)
+            else:
+                data += value.ljust(length)
+    data += b'\x1a'
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+class TestShapeReader(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        path = os.path.join(self.directory.name, STEM)
+        write_shp(path + '.shp', [
+            polygon_record([OUTER, HOLE]),
+            struct.pack('<i', 0),
+            polygon_record([OUTER]),
+        ])
+        write_dbf(path + '.dbf', [
+            (False, ['A1', '3', 'T', '20190501']),
+            (False, ['Café', '', '?', '']),
+            (True, ['B2', '1', 'F', '20190502']),
+        ])
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_batches(self):
+        with open_source(self.directory.name) as source:
+            reader = shape_reader.ShapeReader(source, STEM)
+            batches = list(reader.batches(size=1))
+
+        # The deleted record is skipped
+        self.assertEqual(len(batches), 2)
+
+        first, second = batches
+        self.assertEqual(first['parkeer_id'], ['A1'])
+        self.assertEqual(first['aantal'], [decimal.Decimal(3)])
+        self.assertEqual(first['ma_vr'], [True])
+        self.assertEqual(first['tvm_begind'], [datetime.date(2019, 5, 1)])
+        self.assertEqual(
+            parse_wkb(first['geom'][0]),
+            [[[tuple(map(float, p)) for p in OUTER],
+              [tuple(map(float, p)) for p in HOLE]]])
+
+        self.assertEqual(second['parkeer_id'], ['Café'])
+        self.assertEqual(second['aantal'], [None])
+        self.assertEqual(second['ma_vr'], [None])
+        self.assertEqual(second['tvm_begind'], [None])
+        self.assertEqual(second['geom'], [None])
+
+    def test_encode_numeric(self):
+        self.assertEqual(
+            shape_reader.encode_numeric(decimal.Decimal('12345.678')),
+            struct.pack('>hhHH3H', 3, 1, 0, 3, 1, 2345, 6780))
+        self.assertEqual(
+            shape_reader.encode_numeric(decimal.Decimal('-0.0001')),
+            struct.pack('>hhHH1H', 1, -1, 0x4000, 4, 1))
+        self.assertEqual(
+            shape_reader.encode_numeric(decimal.Decimal('0')),
+            struct.pack('>hhHH', 0, 0, 0, 0))
+        self.assertEqual(
+            shape_reader.encode_numeric(decimal.Decimal('20000')),
+            struct.pack('>hhHH1H', 1, 1, 0, 0, 2))
+
+    def test_copy_data(self):
+        data = b''.join(shape_reader.copy_data(
+            [('id', 'text'), ('datum', 'date')],
+            [{'id': ['a', None], 'datum': [datetime.date(2000, 1, 2), None]}]))
+
+        self.assertEqual(data, (
+            shape_reader.COPY_HEADER +
+            struct.pack('>hi1si4s', 2, 1, b'a', 4, struct.pack('>i', 1)) +
+            struct.pack('>hii', 2, -1, -1) +
+            shape_reader.COPY_TRAILER))
@@ -0,0 +1,136 @@
+"""
+The shape files of an import, in a directory or in a zip archive.
+
+Members of a zip are read straight from the archive. Members that are
+stored uncompressed are memory-mapped, compressed members are streamed.
+Directories inside the zip are ignored, members are found by file name.
+"""
+import mmap
+import os
+import pathlib
+import struct
+import zipfile
+
+# Local file header: the lengths of the file name and the extra field, see
+# the zip APPNOTE 4.3.7
+LOCAL_HEADER = struct.Struct('<4s22xHH')
+LOCAL_HEADER_SIGNATURE = b'PK\x03\x04'
+
+
+def open_source(path):
+    """A `ZipSource` or `DirectorySource` for `path`"""
+    path = pathlib.Path(path)
+    if path.is_file() and zipfile.is_zipfile(str(path)):
+        return ZipSource(path)
+    return DirectorySource(path)
+
+
+class Source(object):
+
+    def __init__(self, path):
+        self.path = pathlib.Path(path).absolute()
+
+    @property
+    def nietfiscaal(self):
+        """Niet fiscale parkeervakken are in a path with nietfiscaal"""
+        return any('nietfiscaal' in part for part in self.path.parts)
+
+    def names(self):
+        raise NotImplementedError
+
+    def stems(self, extension):
+        """The names of the files with `extension`, without extension"""
+        suffix = '.' + extension
+        return sorted(
+            name[:-len(suffix)] for name in self.names()
+            if name.endswith(suffix))
+
+    def members(self, stem):
+        """The files of a shape file: .shp, .shx, .dbf, .prj, ..."""
+        return [
+            name for name in self.names()
+            if os.path.splitext(name)[0] == stem]
+
+    def open(self, name):
+        raise NotImplementedError
+
+    def buffer(self, name):
+        """The contents of `name`, memory-mapped when possible"""
+        with self.open(name) as f:
+            return f.read()
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __str__(self):
+        return str(self.path)
+
+
+class DirectorySource(Source):
+
+    def names(self):
+        return [path.name for path in self.path.iterdir() if path.is_file()]
+
+    def open(self, name):
+        return open(str(self.path / name), 'rb')
+
+    def buffer(self, name):
+        with self.open(name) as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return b''
+            return memoryview(
+                mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+
+class ZipSource(Source):
+
+    def __init__(self, path):
+        super().__init__(path)
+        self.zip_file = zipfile.ZipFile(str(self.path))
+        self._file = open(str(self.path), 'rb')
+        self._mmap = mmap.mmap(
+            self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        self.infos = {}
+        for info in self.zip_file.infolist():
+            if not info.is_dir():
+                self.infos[os.path.basename(info.filename)] = info
+
+    def names(self):
+        return list(self.infos)
+
+    def open(self, name):
+        return self.zip_file.open(self.infos[name])
+
+    def buffer(self, name):
+        info = self.infos[name]
+
+        # Encrypted and compressed members have to be decoded
+        if info.compress_type != zipfile.ZIP_STORED or info.flag_bits & 0x1:
+            return super().buffer(name)
+
+        signature, name_length, extra_length = LOCAL_HEADER.unpack_from(
+            self._mmap, info.header_offset)
+        if signature != LOCAL_HEADER_SIGNATURE:
+            raise zipfile.BadZipFile(
+                'Bad local file header of {}'.format(info.filename))
+
+        start = info.header_offset + LOCAL_HEADER.size + \
+            name_length + extra_length
+        return memoryview(self._mmap)[start:start + info.file_size]
+
+    def close(self):
+        self.zip_file.close()
+        try:
+            self._mmap.close()
+        except BufferError:
+            # A memoryview of a member is still in use, the map is closed
+            # when it is released
+            pass
+        self._file.close()
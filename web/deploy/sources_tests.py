@@ -0,0 +1,45 @@
+import os
+import tempfile
+import zipfile
+from unittest import TestCase
+
+from sources import open_source
+
+FILES = {
+    'Centrum_parkeerhaven_20190501.shp': b'shp' * 100,
+    'Centrum_parkeerhaven_20190501.dbf': b'dbf' * 100,
+    'Centrum_parkeerhaven_20190501.shx': b'shx',
+}
+
+
+class TestSources(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.zip_path = os.path.join(
+            self.directory.name, 'parkeervakken_nietfiscaal.zip')
+
+        with zipfile.ZipFile(self.zip_path, 'w') as zf:
+            for name, data in FILES.items():
+                compression = zipfile.ZIP_DEFLATED \
+                    if name.endswith('.dbf') else zipfile.ZIP_STORED
+                zf.writestr('export/' + name, data, compression)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_zip(self):
+        with open_source(self.zip_path) as source:
+            self.assertTrue(source.nietfiscaal)
+            self.assertEqual(
+                source.stems('shp'), ['Centrum_parkeerhaven_20190501'])
+
+            for name, data in FILES.items():
+                # Stored members are memory-mapped, deflated members read
+                buffer = source.buffer(name)
+                self.assertEqual(bytes(buffer), data)
+                if isinstance(buffer, memoryview):
+                    buffer.release()
+
+                with source.open(name) as f:
+                    self.assertEqual(f.read(), data)
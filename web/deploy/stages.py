@@ -0,0 +1,218 @@
+"""
+Timing and row counts of the import stages.
+
+Every stage is written as a JSON line to stdout when it ends, and all
+stages of a run are saved in `bv.import_runs` at the end (`save`). The
+SQL files are executed statement by statement, so each statement is a
+stage of its own. Rows are taken from `cursor.rowcount`. With `explain`
+the statements are run with EXPLAIN ANALYZE, which also gives the plan
+and the bytes read. Other fields of a stage, like the stadsdeel of a shape
+file, are saved as its details.
+"""
+import datetime
+import json
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import psycopg2
+
+BLOCK_SIZE = 8192
+
+EXPLAINABLE = ('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'WITH')
+
+INSERT_SQL = """INSERT INTO bv.import_runs
+(run_id, started_at, stage, seconds, rows, bytes, failed, plan, details)
+VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)"""
+
+FIELDS = (
+    'run_id', 'stage', 'started_at', 'seconds', 'rows', 'bytes', 'failed',
+    'plan',
+)
+
+_dollar_quote = re.compile(r'\$[A-Za-z_]*\$')
+
+
+def split_statements(sql):
+    """
+    Split the contents of an SQL file in statements. Semicolons in strings,
+    quoted identifiers, comments and dollar quoted bodies are skipped.
+    Statements that are only comments are left out.
+    """
+    statements = []
+    start = 0
+    has_code = False
+    i = 0
+    n = len(sql)
+
+    while i < n:
+        c = sql[i]
+
+        if c == '-' and sql.startswith('--', i):
+            end = sql.find('\n', i)
+            i = n if end == -1 else end + 1
+            continue
+
+        if c == '/' and sql.startswith('/*', i):
+            end = sql.find('*/', i + 2)
+            i = n if end == -1 else end + 2
+            continue
+
+        if c in ('\'', '"'):
+            has_code = True
+            i += 1
+            while i < n:
+                if sql[i] == c:
+                    if i + 1 < n and sql[i + 1] == c:
+                        i += 2
+                        continue
+                    break
+                i += 1
+            i += 1
+            continue
+
+        if c == '$':
+            match = _dollar_quote.match(sql, i)
+            if match:
+                has_code = True
+                end = sql.find(match.group(), match.end())
+                i = n if end == -1 else end + len(match.group())
+                continue
+
+        if c == ';':
+            if has_code:
+                statements.append(sql[start:i].strip())
+            start = i + 1
+            has_code = False
+        elif not c.isspace():
+            has_code = True
+
+        i += 1
+
+    if has_code:
+        statements.append(sql[start:].strip())
+
+    return statements
+
+
+def describe(statement, length=60):
+    """First code line of a statement, to name its stage"""
+    for line in statement.splitlines():
+        line = line.strip()
+        if line and not line.startswith('--'):
+            return ' '.join(line.split())[:length]
+    return ''
+
+
+def _json(value):
+    return None if value is None else json.dumps(value, default=str)
+
+
+def _plan_rows(plan):
+    node = plan['Plan']
+    if node.get('Node Type') == 'ModifyTable' and node.get('Plans'):
+        node = node['Plans'][0]
+    return node.get('Actual Rows')
+
+
+def _plan_bytes(plan):
+    node = plan['Plan']
+    blocks = node.get('Shared Read Blocks', 0) + \
+        node.get('Local Read Blocks', 0) + node.get('Temp Read Blocks', 0)
+    return blocks * BLOCK_SIZE
+
+
+class StageRecorder(object):
+
+    def __init__(self, stream=None):
+        self.run_id = str(uuid.uuid4())
+        self.stream = stream or sys.stdout
+        self.stages = []
+        # Steps of the import can run in threads
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name, **fields):
+        """
+        Time the stage `name`. The record is yielded, so the caller can
+        fill in `rows` and `bytes`.
+        """
+        record = OrderedDict([
+            ('run_id', self.run_id),
+            ('stage', name),
+            ('started_at', datetime.datetime.now(datetime.timezone.utc)),
+            ('seconds', None),
+            ('rows', None),
+            ('bytes', None),
+            ('failed', False),
+            ('plan', None),
+        ])
+        record.update(fields)
+
+        start = time.monotonic()
+        try:
+            yield record
+        except Exception:
+            record['failed'] = True
+            raise
+        finally:
+            record['seconds'] = round(time.monotonic() - start, 3)
+            with self._lock:
+                self.stages.append(record)
+                self.stream.write(json.dumps(record, default=str) + '\n')
+                self.stream.flush()
+
+    def execute(self, cur, statement, name, explain=False):
+        """Execute `statement` as the stage `name`"""
+        with self.stage(name) as record:
+            keyword = describe(statement).split(' ', 1)[0].upper()
+            explainable = keyword in EXPLAINABLE
+
+            if explain and explainable:
+                cur.execute(
+                    'EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) ' + statement)
+                plan = cur.fetchone()[0]
+                if isinstance(plan, str):
+                    plan = json.loads(plan)
+                record['plan'] = plan
+                record['rows'] = _plan_rows(plan[0])
+                record['bytes'] = _plan_bytes(plan[0])
+            else:
+                cur.execute(statement)
+                if cur.rowcount >= 0:
+                    record['rows'] = cur.rowcount
+
+    def save(self, database, user, password, host, port):
+        """Store the stages recorded so far in `bv.import_runs`"""
+        conn = psycopg2.connect(
+            database=database,
+            user=user,
+            password=password,
+            host=host,
+            port=port)
+
+        try:
+            with conn:
+                with conn.cursor() as cur:
+                    cur.executemany(INSERT_SQL, [
+                        (record['run_id'], record['started_at'],
+                         record['stage'], record['seconds'], record['rows'],
+                         record['bytes'], record['failed'],
+                         _json(record['plan']),
+                         _json({
+                             key: value for key, value in record.items()
+                             if key not in FIELDS
+                         } or None))
+                        for record in self.stages
+                    ])
+        finally:
+            conn.close()
+
+        self.stages = []
+
+
+recorder = StageRecorder()
@@ -0,0 +1,64 @@
+import io
+import json
+from unittest import TestCase
+from unittest.mock import patch
+
+import stages
+
+
+class TestStages(TestCase):
+
+    def test_split_statements(self):
+        sql = """-- Header; with a semicolon
+SELECT 'a;b' FROM "odd;name";
+
+/* block; comment */
+CREATE FUNCTION f() RETURNS int AS $$ SELECT 1; $$ LANGUAGE sql;
+-- only a comment;
+UPDATE t SET v = 'it''s; fine'"""
+
+        statements = stages.split_statements(sql)
+
+        self.assertEqual(len(statements), 3)
+        self.assertTrue(statements[0].endswith('FROM "odd;name"'))
+        self.assertIn('$$ SELECT 1; $$', statements[1])
+        self.assertTrue(
+            statements[2].endswith("UPDATE t SET v = 'it''s; fine'"))
+
+    def test_split_import_files(self):
+        with open('import_his_bm.sql') as f:
+            statements = stages.split_statements(f.read())
+
+        self.assertTrue(all(
+            stages.describe(statement) for statement in statements))
+
+    def test_stage_record(self):
+        stream = io.StringIO()
+        recorder = stages.StageRecorder(stream)
+
+        with recorder.stage('update_dates') as stage:
+            stage['rows'] = 3
+
+        record = json.loads(stream.getvalue())
+        self.assertEqual(record['stage'], 'update_dates')
+        self.assertEqual(record['rows'], 3)
+        self.assertFalse(record['failed'])
+        self.assertEqual(len(recorder.stages), 1)
+
+    def test_save_details(self):
+        recorder = stages.StageRecorder(io.StringIO())
+
+        with recorder.stage('update_history', stadsdeel='centrum'):
+            pass
+        with recorder.stage('update_dates'):
+            pass
+
+        with patch('psycopg2.connect') as connect:
+            recorder.save('parkeervakken', 'user', 'password', 'host', 5432)
+
+        cur = connect.return_value.cursor.return_value.__enter__.return_value
+        sql, rows = cur.executemany.call_args[0]
+        self.assertEqual(rows[0][2], 'update_history')
+        self.assertEqual(json.loads(rows[0][-1]), {'stadsdeel': 'centrum'})
+        self.assertIsNone(rows[1][-1])
+        self.assertEqual(recorder.stages, [])
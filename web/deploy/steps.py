@@ -0,0 +1,201 @@
+"""
+The import SQL files as a graph of steps.
+
+A file is divided in steps by `-- step: <name>` comments. A step waits for
+the steps named in an `-- after: <name>, ...` comment in the step, and for
+all steps of the files before it. Statements before the first step of a
+file run at the start of every step of that file (SET for example). A file
+without step comments is a single step.
+
+Every step runs in its own transaction on its own connection, independent
+steps run concurrently. A step that fails on a connection problem or a
+deadlock is retried. Finished steps are checkpointed in
+`bv.import_checkpoints`, a resumed run skips them.
+"""
+import logging
+import os
+import re
+import time
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import wait
+
+import psycopg2
+
+from stages import describe
+from stages import recorder
+from stages import split_statements
+
+log = logging.getLogger(__name__)
+
+STEP_MARKER = re.compile(r'^--\s*step:\s*(\S+)\s*$', re.MULTILINE)
+AFTER_MARKER = re.compile(r'^--\s*after:\s*(.+?)\s*$', re.MULTILINE)
+
+CHECKPOINT_SQL = """INSERT INTO bv.import_checkpoints (step)
+VALUES (%s)
+ON CONFLICT (step) DO UPDATE SET finished_at = now()"""
+
+CHECKPOINTS_SQL = "SELECT step FROM bv.import_checkpoints"
+
+CLEAR_CHECKPOINTS_SQL = "DELETE FROM bv.import_checkpoints"
+
+
+class Step(object):
+
+    def __init__(self, name, statements, after=()):
+        self.name = name
+        self.statements = statements
+        self.after = set(after)
+
+    def __repr__(self):
+        return '<Step {}>'.format(self.name)
+
+
+def read_steps(filename):
+    """The steps of an SQL file, named <file>.<step>"""
+    with open(filename) as f:
+        sql = f.read()
+
+    prefix = os.path.splitext(os.path.basename(filename))[0]
+
+    parts = STEP_MARKER.split(sql)
+    preamble = split_statements(parts[0])
+
+    if len(parts) == 1:
+        return [Step(prefix, preamble)]
+
+    steps = []
+    for name, body in zip(parts[1::2], parts[2::2]):
+        after = [
+            '{}.{}'.format(prefix, dependency.strip())
+            for line in AFTER_MARKER.findall(body)
+            for dependency in line.split(',') if dependency.strip()
+        ]
+        steps.append(Step(
+            '{}.{}'.format(prefix, name),
+            preamble + split_statements(body),
+            after))
+
+    return steps
+
+
+def plan(files):
+    """All steps of `files`, in file order, with their dependencies"""
+    steps = OrderedDict()
+    previous = []
+
+    for filename in files:
+        file_steps = read_steps(filename)
+        names = {step.name for step in file_steps}
+
+        for step in file_steps:
+            unknown = step.after - names
+            if unknown:
+                raise ValueError('{} waits for unknown steps {}'.format(
+                    step.name, ', '.join(sorted(unknown))))
+            if step.name in steps:
+                raise ValueError('Duplicate step {}'.format(step.name))
+
+            step.after |= set(previous)
+            steps[step.name] = step
+
+        previous = [step.name for step in file_steps]
+
+    return steps
+
+
+def _execute(connect, sql, fetch=False):
+    conn = connect()
+    try:
+        with conn:
+            with conn.cursor() as cur:
+                cur.execute(sql)
+                if fetch:
+                    return [row[0] for row in cur.fetchall()]
+    finally:
+        conn.close()
+
+
+def run_step(step, connect, retries=2, explain=False):
+    """Run the statements of `step` and its checkpoint in one transaction"""
+    for attempt in range(retries + 1):
+        conn = None
+        try:
+            # Connecting fails when the database restarts or has too many
+            # connections, that is retried as well
+            conn = connect()
+            with conn.cursor() as cur:
+                for number, stmt in enumerate(step.statements, 1):
+                    name = '{}:{} {}'.format(step.name, number, describe(stmt))
+                    recorder.execute(cur, stmt, name, explain)
+                cur.execute(CHECKPOINT_SQL, (step.name,))
+            conn.commit()
+            return
+        except psycopg2.OperationalError:
+            if conn is not None:
+                try:
+                    conn.rollback()
+                except psycopg2.Error:
+                    pass
+            if attempt == retries:
+                raise
+            log.warning('Step %s failed, retry %d of %d',
+                        step.name, attempt + 1, retries, exc_info=True)
+            time.sleep(2 ** attempt)
+        finally:
+            if conn is not None:
+                conn.close()
+
+
+def run_steps(steps, connect, jobs=4, retries=2, resume=False,
+              explain=False):
+    """
+    Run `steps` (see `plan`), at most `jobs` at the same time. `connect`
+    returns a new database connection. With `resume` the steps
+    checkpointed by an earlier, failed, run are skipped.
+    """
+    if resume:
+        done = set(_execute(connect, CHECKPOINTS_SQL, fetch=True))
+        log.info('Resume, skipping %s', ', '.join(sorted(done)) or 'nothing')
+    else:
+        _execute(connect, CLEAR_CHECKPOINTS_SQL)
+        done = set()
+
+    started = set(done)
+    running = {}
+    failed = None
+
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        while True:
+            if failed is None:
+                for step in steps.values():
+                    if step.name not in started and step.after <= done:
+                        log.debug('Step %s', step.name)
+                        started.add(step.name)
+                        future = executor.submit(
+                            run_step, step, connect, retries, explain)
+                        running[future] = step
+
+            if not running:
+                break
+
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                step = running.pop(future)
+                try:
+                    future.result()
+                except Exception as e:
+                    log.error('Step %s failed', step.name)
+                    failed = failed or e
+                else:
+                    done.add(step.name)
+
+    if failed is not None:
+        raise failed
+
+    if set(steps) - done:
+        raise ValueError('Steps waiting on each other: {}'.format(
+            ', '.join(sorted(set(steps) - done))))
+
+    _execute(connect, CLEAR_CHECKPOINTS_SQL)
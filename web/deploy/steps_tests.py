@@ -0,0 +1,135 @@
+import io
+import os
+import tempfile
+import threading
+from unittest import TestCase
+from unittest.mock import patch
+
+import psycopg2
+
+import stages
+import steps
+
+
+class FakeCursor(object):
+
+    def __init__(self, executed):
+        self.executed = executed
+        self.rowcount = 1
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def execute(self, sql, params=None):
+        self.executed.append((sql, params))
+
+    def fetchall(self):
+        return [('a.first',)]
+
+
+class FakeConnection(object):
+
+    def __init__(self, executed):
+        self.executed = executed
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def cursor(self):
+        return FakeCursor(self.executed)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class TestSteps(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.files = []
+        for name, sql in [
+                ('a.sql', 'SET x = 1;\n'
+                          '-- step: first\nSELECT 1;\n'
+                          '-- step: second\nSELECT 2;\n'
+                          '-- step: third\n-- after: first, second\n'
+                          'SELECT 3;\n'),
+                ('b.sql', 'SELECT 4;\n')]:
+            path = os.path.join(self.directory.name, name)
+            with open(path, 'w') as f:
+                f.write(sql)
+            self.files.append(path)
+
+        stages.recorder.stream = io.StringIO()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_plan(self):
+        planned = steps.plan(self.files)
+
+        self.assertEqual(
+            list(planned), ['a.first', 'a.second', 'a.third', 'b'])
+        self.assertEqual(planned['a.first'].after, set())
+        self.assertEqual(planned['a.third'].after, {'a.first', 'a.second'})
+        self.assertEqual(
+            planned['b'].after, {'a.first', 'a.second', 'a.third'})
+        # The statements before the first step run in every step
+        self.assertEqual(
+            planned['a.second'].statements, ['SET x = 1', 'SELECT 2'])
+
+    def test_run_steps_resume(self):
+        executed = []
+        lock = threading.Lock()
+
+        def connect():
+            with lock:
+                return FakeConnection(executed)
+
+        steps.run_steps(steps.plan(self.files), connect, resume=True)
+
+        # Comments in the step, like `-- after:`, stay in the statement
+        statements = [sql.splitlines()[-1] for sql, _ in executed]
+        self.assertNotIn('SELECT 1', statements)
+        self.assertLess(
+            statements.index('SELECT 3'), statements.index('SELECT 4'))
+        self.assertEqual(statements[-1], steps.CLEAR_CHECKPOINTS_SQL)
+
+    def test_run_step_connect_retry(self):
+        executed = []
+        attempts = []
+
+        def connect():
+            attempts.append(len(attempts))
+            if len(attempts) == 1:
+                raise psycopg2.OperationalError('too many connections')
+            return FakeConnection(executed)
+
+        step = steps.plan(self.files)['b']
+        with patch('time.sleep') as sleep:
+            steps.run_step(step, connect, retries=1)
+
+        self.assertEqual(len(attempts), 2)
+        sleep.assert_called_once_with(1)
+        self.assertEqual(
+            executed, [('SELECT 4', None), (steps.CHECKPOINT_SQL, ('b',))])
+
+    def test_run_step_connect_fails(self):
+        def connect():
+            raise psycopg2.OperationalError('database restarting')
+
+        step = steps.plan(self.files)['b']
+        with patch('time.sleep'):
+            with self.assertRaises(psycopg2.OperationalError):
+                steps.run_step(step, connect, retries=2)
@@ -7,3 +7,14 @@ set -x   # print what we are doing
 cd /app
 source /deploy/docker-wait.sh
 python manage.py test --noinput
+
+# The import scripts, against the database of the database service
+cd /deploy
+python -m unittest \
+	geometry_snapshot_tests \
+	import_data_tests \
+	objectstore_tests \
+	shape_reader_tests \
+	sources_tests \
+	stages_tests \
+	steps_tests
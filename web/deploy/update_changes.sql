@@ -0,0 +1,47 @@
+-- Record what the import changed (import_data.py --record-changes).
+--
+-- Compares bm.parkeervakken with the hashes of the last import, so it runs
+-- once, after the fiscale and the niet fiscale parkeervakken are loaded.
+-- The changes get the generation started by new_generation.sql.
+
+INSERT INTO bv.parkeervakken_changes
+(
+    generation,
+    parkeer_id,
+    change,
+    inhoud_hash
+)
+SELECT
+    (SELECT max(generation) FROM bv.import_generations),
+    COALESCE(huidig.parkeer_id, vorig.parkeer_id),
+    CASE
+        WHEN vorig.parkeer_id IS NULL THEN 'added'
+        WHEN huidig.parkeer_id IS NULL THEN 'removed'
+        ELSE 'modified'
+    END,
+    huidig.inhoud_hash
+FROM (
+    SELECT parkeer_id, inhoud_hash
+    FROM bm.parkeervakken
+    WHERE parkeer_id IS NOT NULL
+) AS huidig
+FULL OUTER JOIN bv.parkeervakken_hashes AS vorig
+    ON huidig.parkeer_id = vorig.parkeer_id
+WHERE huidig.inhoud_hash IS DISTINCT FROM vorig.inhoud_hash;
+
+-- Clients with an older `since` get 410 Gone from the API, keep the
+-- interval in line with parkeervakken_api/generation.py
+DELETE FROM bv.parkeervakken_changes
+WHERE generation IN (
+    SELECT generation
+    FROM bv.import_generations
+    WHERE created_at < now() - interval '90 days'
+);
+
+TRUNCATE bv.parkeervakken_hashes;
+
+INSERT INTO bv.parkeervakken_hashes (parkeer_id, inhoud_hash)
+SELECT parkeer_id, inhoud_hash
+FROM bm.parkeervakken
+WHERE parkeer_id IS NOT NULL AND inhoud_hash IS NOT NULL;
+
@@ -0,0 +1,42 @@
+-- Totals of every day of the import window (bm.datums, today and the days
+-- after), replaced on every import. Reservations already known for the
+-- coming days are counted, and are counted again by the next imports. A
+-- day in the past keeps the totals of the last import with the day in its
+-- window, so a day without an import still has the totals of the import
+-- before it.
+
+DELETE FROM his.parkeervakken_dagtotalen
+WHERE datum IN (SELECT datum FROM bm.datums);
+
+INSERT INTO his.parkeervakken_dagtotalen
+(
+    datum,
+    stadsdeel,
+    buurtcode,
+    e_type,
+
+    aantal_vakken,
+    aantal,
+    reserveringen
+)
+SELECT
+    dagen.datum,
+    pv.stadsdeel,
+    pv.buurtcode,
+    pv.e_type,
+
+    count(*),
+    sum(pv.aantal),
+    sum(coalesce(re.reserveringen, 0))
+FROM (
+    -- bm.datums has every day once per goedkeurings_datum
+    SELECT DISTINCT datum FROM bm.datums
+) dagen
+CROSS JOIN bv.parkeervakken pv
+LEFT JOIN (
+    SELECT parkeer_id_md5, reserverings_datum, count(*) AS reserveringen
+    FROM bv.reserveringen
+    GROUP BY parkeer_id_md5, reserverings_datum
+) re ON re.parkeer_id_md5 = pv.parkeer_id_md5 AND
+        re.reserverings_datum = dagen.datum
+GROUP BY dagen.datum, pv.stadsdeel, pv.buurtcode, pv.e_type;
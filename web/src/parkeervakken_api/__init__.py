@@ -0,0 +1 @@
+default_app_config = 'parkeervakken_api.apps.ParkeervakkenConfig'
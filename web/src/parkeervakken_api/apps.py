@@ -0,0 +1,15 @@
+from django.apps import AppConfig
+from django.core.signals import request_started
+from django.db.backends.signals import connection_created
+
+
+class ParkeervakkenConfig(AppConfig):
+    name = 'parkeervakken_api'
+
+    def ready(self):
+        from parkeervakken_api import db
+
+        request_started.connect(
+            db.check_connections, dispatch_uid='parkeervakken_check_conn')
+        connection_created.connect(
+            db.count_new_connection, dispatch_uid='parkeervakken_new_conn')
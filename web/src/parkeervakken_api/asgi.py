@@ -0,0 +1,227 @@
+"""
+ASGI entry point for the geosearch and geoselection endpoints.
+
+Django 2.2 can not serve ASGI, so this is a small standalone application
+that answers `/parkeervakken/geosearch/` and `/parkeervakken/geoselection/`
+with an asyncpg connection pool. It returns the same JSON as the
+`GeoSearchViewSet` and `GeoSelectionViewSet`. All other paths return a 404
+and should be routed to the uWSGI application.
+
+Run it with:
+
+    uvicorn parkeervakken_api.asgi:application
+"""
+
+import json
+import logging
+import os
+from urllib.parse import parse_qs
+from urllib.parse import quote
+
+import asyncpg
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "parkeervakken_api.settings")
+
+from django.conf import settings  # noqa: E402
+from django.utils.http import RFC3986_SUBDELIMS  # noqa: E402
+
+log = logging.getLogger(__name__)
+
+POOL_MIN_SIZE = int(os.getenv('ASYNC_POOL_MIN_SIZE', '2'))
+POOL_MAX_SIZE = int(os.getenv('ASYNC_POOL_MAX_SIZE', '20'))
+
+# The url of `parkeervak-detail`, the Django url conf is not loaded here
+PARKEERVAK_HREF = '{}/parkeervakken/parkeervakken/{}/'
+
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+# The GeoJSON of the Django views, see serializers.GEOJSON_DECIMALS
+GEOSEARCH_RD_SQL = """SELECT id, ST_AsGeoJSON(geometrie, 9, 0)
+FROM geo_parkeervakken
+WHERE ST_Contains(geometrie, ST_SetSRID(ST_MakePoint($1, $2), 28992))
+LIMIT 1"""
+
+GEOSEARCH_WGS84_SQL = """SELECT id, ST_AsGeoJSON(geometrie, 9, 0)
+FROM geo_parkeervakken
+WHERE ST_Contains(
+    geometrie,
+    ST_Transform(ST_SetSRID(ST_MakePoint($1, $2), 4326), 28992))
+LIMIT 1"""
+
+GEOSELECTION_STRAATNAAM_SQL = """SELECT Count(*) AS aantal,
+    ST_AsGeoJSON(ST_Multi(ST_Union(p.geometrie)), 9, 0) AS singleshape
+FROM bv.geo_parkeervakken p WHERE straatnaam = $1"""
+
+GEOSELECTION_IDS_SQL = """SELECT Count(*) AS aantal,
+    ST_AsGeoJSON(ST_Multi(ST_Union(p.geometrie)), 9, 0) AS singleshape
+FROM bv.geo_parkeervakken p WHERE id = ANY($1::text[])"""
+
+_pool = None
+
+
+async def get_pool():
+    global _pool
+
+    if _pool is None:
+        db = settings.DATABASES['default']
+        _pool = await asyncpg.create_pool(
+            database=db['NAME'],
+            user=db['USER'],
+            password=db['PASSWORD'],
+            host=db['HOST'],
+            port=int(db['PORT']),
+            min_size=POOL_MIN_SIZE,
+            max_size=POOL_MAX_SIZE)
+
+    return _pool
+
+
+async def close_pool():
+    global _pool
+
+    if _pool is not None:
+        await _pool.close()
+        _pool = None
+
+
+def base_url(scope):
+    """
+    Scheme and host of the request, the host header or else the server
+    address, like Django's `build_absolute_uri`.
+    """
+    scheme = scope.get('scheme', 'http')
+    headers = dict(scope.get('headers') or [])
+    host = headers.get(b'host', b'').decode('latin-1')
+
+    if not host and scope.get('server'):
+        host, port = scope['server']
+        if port is not None and port != DEFAULT_PORTS.get(scheme):
+            host = '{}:{}'.format(host, port)
+
+    return '{}://{}'.format(scheme, host)
+
+
+def parkeervak_href(url, parkeervak_id):
+    """The detail url of a parkeervak, quoted like `reverse` does"""
+    return PARKEERVAK_HREF.format(
+        url, quote(parkeervak_id, safe=RFC3986_SUBDELIMS + '/~:@'))
+
+
+async def geosearch(query_params, url):
+    """Async version of `GeoSearchViewSet.list`"""
+    if 'lat' in query_params and 'lon' in query_params:
+        sql = GEOSEARCH_WGS84_SQL
+        coords = float(query_params['lon']), float(query_params['lat'])
+    elif 'x' in query_params and 'y' in query_params:
+        sql = GEOSEARCH_RD_SQL
+        coords = float(query_params['x']), float(query_params['y'])
+    else:
+        return b'[]'
+
+    if not coords[0] or not coords[1]:
+        return b'[]'
+
+    pool = await get_pool()
+    row = await pool.fetchrow(sql, *coords)
+
+    if row is None:
+        return b'[]'
+
+    parkeervak_id, geojson = row
+    return ''.join([
+        '[{"_links":{"self":{"href":',
+        json.dumps(parkeervak_href(url, parkeervak_id)),
+        '}},"id":',
+        json.dumps(parkeervak_id),
+        ',"geometrie":',
+        geojson,
+        '}]',
+    ]).encode('utf-8')
+
+
+async def geoselection(query_params, url):
+    """Async version of `GeoSelectionViewSet.list`"""
+    if 'straatnaam' in query_params:
+        sql = GEOSELECTION_STRAATNAAM_SQL
+        param = query_params['straatnaam']
+    elif 'ids' in query_params:
+        sql = GEOSELECTION_IDS_SQL
+        param = query_params['ids'].split(',')
+    else:
+        return b'[]'
+
+    pool = await get_pool()
+    aantal, geojson = await pool.fetchrow(sql, param)
+
+    if aantal == 0:
+        return b'[]'
+
+    return '{{"aantal":{},"singleshape":{}}}'.format(
+        aantal, geojson).encode('utf-8')
+
+
+ROUTES = {
+    '/parkeervakken/geosearch/': geosearch,
+    '/parkeervakken/geoselection/': geoselection,
+}
+
+
+async def send_response(send, status, body, content_type=b'application/json'):
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [
+            (b'content-type', content_type),
+            (b'content-length', str(len(body)).encode('ascii')),
+        ],
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+
+        if message['type'] == 'lifespan.startup':
+            try:
+                await get_pool()
+            except Exception:
+                log.exception('Could not create database pool')
+                await send({'type': 'lifespan.startup.failed'})
+                return
+            await send({'type': 'lifespan.startup.complete'})
+
+        elif message['type'] == 'lifespan.shutdown':
+            await close_pool()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        await lifespan(receive, send)
+        return
+
+    handler = ROUTES.get(scope['path'])
+
+    if handler is None:
+        await send_response(
+            send, 404, b'Not found', content_type=b'text/plain')
+        return
+
+    query = parse_qs(scope['query_string'].decode('latin-1'))
+    query_params = {key: values[-1] for key, values in query.items()}
+
+    try:
+        body = await handler(query_params, base_url(scope))
+    except ValueError:
+        await send_response(
+            send, 400, b'{"detail":"Invalid coordinates"}')
+        return
+    except Exception:
+        log.exception('Could not answer %s', scope['path'])
+        await send_response(
+            send, 500, b'{"detail":"Internal server error"}')
+        return
+
+    await send_response(send, 200, body)
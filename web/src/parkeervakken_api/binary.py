@@ -0,0 +1,119 @@
+"""
+Binary geometry encodings of parkeervakken, made by PostGIS.
+
+fgb     FlatGeobuf (ST_AsFlatGeobuf, PostGIS 3.2 and later)
+pbf     Geobuf protobuf (ST_AsGeobuf, PostGIS built with protobuf-c)
+wkb     for a list of parkeervakken, all numbers little endian:
+
+            uint32 count, then per parkeervak
+            uint32 id length, utf-8 id, uint32 wkb length, wkb
+
+        for a geoselection just the WKB of the shape.
+"""
+import struct
+
+from django.db import connection
+from django.db import InternalError
+from django.db import ProgrammingError
+from django.db import transaction
+
+from parkeervakken_api.models import Parkeervak
+
+FORMATS = ('fgb', 'pbf', 'wkb')
+
+AGGREGATES = {
+    'fgb': "ST_AsFlatGeobuf(q, true, '{}')",
+    'pbf': "ST_AsGeobuf(q, '{}')",
+}
+
+PARKEERVAKKEN_SQL = """SELECT {{columns}}
+FROM {table} p
+JOIN unnest(%s::varchar[]) WITH ORDINALITY AS page(id, n) USING (id)
+ORDER BY page.n""".format(table=Parkeervak._meta.db_table)
+
+PARKEERVAK_COLUMNS = ', '.join([
+    'id', 'buurtcode', 'straatnaam', 'aantal', 'type', 'e_type',
+    'e_type_desc', 'bord', 'geometrie',
+])
+
+UINT32 = struct.Struct('<I')
+
+PROBE_SQL = "SELECT {} FROM (SELECT 'POINT(0 0)'::geometry AS g) q"
+
+_supported = {}
+
+
+def _fetch(sql, params):
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.fetchall()
+
+
+def supported(fmt):
+    """
+    Whether the database can make `fmt`, asked once per process. Older or
+    differently built PostGIS versions lack the aggregate functions.
+    """
+    if fmt not in AGGREGATES:
+        return True
+
+    if fmt not in _supported:
+        try:
+            with transaction.atomic():
+                _fetch(PROBE_SQL.format(AGGREGATES[fmt].format('g')), ())
+        except (InternalError, ProgrammingError):
+            _supported[fmt] = False
+        else:
+            _supported[fmt] = True
+
+    return _supported[fmt]
+
+
+def _aggregate(fmt, sql, params, geometry):
+    rows = _fetch('SELECT {} FROM ({}) q'.format(
+        AGGREGATES[fmt].format(geometry), sql), params)
+    if not rows or rows[0][0] is None:
+        return b''
+    return bytes(rows[0][0])
+
+
+def parkeervakken(fmt, ids):
+    """The parkeervakken with the given `ids`, in the order given"""
+    ids = list(ids)
+
+    if fmt == 'wkb':
+        rows = _fetch(
+            PARKEERVAKKEN_SQL.format(columns='id, ST_AsBinary(geometrie)'),
+            (ids,))
+
+        parts = [UINT32.pack(len(rows))]
+        for parkeervak_id, wkb in rows:
+            parkeervak_id = parkeervak_id.encode('utf-8')
+            wkb = bytes(wkb) if wkb is not None else b''
+            parts.extend([
+                UINT32.pack(len(parkeervak_id)), parkeervak_id,
+                UINT32.pack(len(wkb)), wkb,
+            ])
+        return b''.join(parts)
+
+    return _aggregate(
+        fmt, PARKEERVAKKEN_SQL.format(columns=PARKEERVAK_COLUMNS), (ids,),
+        'geometrie')
+
+
+def selection(fmt, sql, params):
+    """
+    Encode the result of a geoselection query, which returns one row with
+    `aantal` and `singleshape`. Empty when nothing was selected.
+    """
+    if fmt == 'wkb':
+        rows = _fetch(
+            'SELECT ST_AsBinary(singleshape) FROM ({}) q '
+            'WHERE aantal > 0'.format(sql), params)
+        if not rows or rows[0][0] is None:
+            return b''
+        return bytes(rows[0][0])
+
+    return _aggregate(
+        fmt, 'SELECT * FROM ({}) s WHERE aantal > 0'.format(sql), params,
+        'singleshape')
@@ -0,0 +1,60 @@
+"""
+Persistent database connection bookkeeping.
+
+When ``CONN_MAX_AGE`` is set Django keeps the connection of a worker open
+between requests. The handlers below check a reused connection before a
+request uses it and count how often a request could reuse a connection
+(hit) and how often a new connection had to be made (miss).
+
+The counters are kept per process, every uWSGI worker reports its own.
+"""
+import logging
+import threading
+
+from django.db import connections
+
+log = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+
+connection_stats = {
+    'hits': 0,
+    'misses': 0,
+    'unusable': 0,
+}
+
+
+def _increment(name):
+    with _lock:
+        connection_stats[name] += 1
+
+
+def check_connections(sender, **kwargs):
+    """
+    Runs on `request_started`, after Django closed connections that are
+    older than ``CONN_MAX_AGE``. A connection that is still open will be
+    reused by this request, when health checks are enabled it is pinged
+    first so a request never fails on a connection the server dropped.
+    """
+    for conn in connections.all():
+        if conn.connection is None:
+            continue
+
+        if conn.settings_dict.get('CONN_HEALTH_CHECKS') \
+                and not conn.is_usable():
+            log.warning('Closing unusable database connection')
+            _increment('unusable')
+            conn.close()
+            continue
+
+        _increment('hits')
+
+
+def count_new_connection(sender, connection, **kwargs):
+    """Runs on `connection_created`."""
+    _increment('misses')
+
+
+def get_connection_stats():
+    with _lock:
+        return dict(connection_stats)
@@ -0,0 +1,63 @@
+"""
+The importer adds a row to `bv.import_generations` every time it loads new
+data into the bv layer. Caches in the API compare the latest generation
+with the generation they were built for to find out they are stale.
+"""
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection
+from django.db import DatabaseError
+from django.db import transaction
+
+GENERATION_SQL = "SELECT max(generation) FROM bv.import_generations"
+
+# The changes of these generations are removed by update_changes.sql
+PRUNED_GENERATION_SQL = """SELECT max(generation)
+FROM bv.import_generations
+WHERE created_at < now() - interval '90 days'"""
+
+_lock = threading.Lock()
+
+_cached = {}
+
+
+def _latest(sql):
+    now = time.monotonic()
+
+    with _lock:
+        generation, checked = _cached.get(sql, (0, None))
+        if checked is not None and \
+                now - checked < settings.IMPORT_GENERATION_CHECK_INTERVAL:
+            return generation
+
+    try:
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute(sql)
+                generation = cursor.fetchone()[0] or 0
+    except DatabaseError:
+        # No bv layer, for example in the test database
+        generation = 0
+
+    with _lock:
+        _cached[sql] = (generation, now)
+
+    return generation
+
+
+def current_generation():
+    """
+    Returns the latest import generation. The database is asked at most
+    once every `IMPORT_GENERATION_CHECK_INTERVAL` seconds.
+    """
+    return _latest(GENERATION_SQL)
+
+
+def pruned_generation():
+    """
+    Returns the latest import generation whose changes are no longer kept,
+    0 when all changes are kept.
+    """
+    return _latest(PRUNED_GENERATION_SQL)
@@ -0,0 +1,208 @@
+"""
+In memory geosearch engines.
+
+The parkeervakken change once a night, so instead of asking PostGIS for
+every geosearch the geometries can be kept in memory. Which engine is used
+is set with `GEOSEARCH_ENGINE`:
+
+    postgis  - no engine, every geosearch is a database query (default)
+    strtree  - shapely STRtree of prepared geometries, loaded per worker
+    mmap     - memory mapped snapshot written by the importer, shared by
+               all workers (`GEOSEARCH_SNAPSHOT`)
+
+An engine is (re)loaded on first use and whenever it is stale: a new
+import generation (strtree) or the importer wrote a new snapshot (mmap).
+
+The coordinates are rounded like the GeoJSON of the PostGIS geosearch,
+which GDAL writes with 15 significant digits.
+"""
+import logging
+import threading
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection
+
+from parkeervakken_api.generation import current_generation
+from parkeervakken_api.geostore import GeometryStore
+
+try:
+    import numpy
+    import shapely
+    from shapely.geometry import mapping
+except ImportError:
+    shapely = None
+
+log = logging.getLogger(__name__)
+
+PARKEERVAKKEN_SQL = "SELECT id, ST_AsBinary(geometrie) FROM geo_parkeervakken"
+
+# Significant digits of the coordinates in the GeoJSON of GDAL
+GEOJSON_DIGITS = 15
+
+
+def round_coordinates(coordinates):
+    """GeoJSON coordinates rounded to `GEOJSON_DIGITS` significant digits"""
+    if isinstance(coordinates, (list, tuple)):
+        return [round_coordinates(value) for value in coordinates]
+    return float('{:.{}g}'.format(coordinates, GEOJSON_DIGITS))
+
+
+def round_geometry(geometry):
+    return {
+        'type': geometry['type'],
+        'coordinates': round_coordinates(geometry['coordinates']),
+    }
+
+
+class STRtreeEngine(object):
+    """
+    Packed STRtree over all parkeervak geometries. The geometries are
+    prepared so the exact point in polygon test after the tree lookup is
+    cheap.
+    """
+
+    def __init__(self, ids, geometries, generation=None):
+        self.generation = generation
+        self.ids = ids
+        self.geometries = geometries
+        shapely.prepare(self.geometries)
+        self.tree = shapely.STRtree(self.geometries)
+
+    @classmethod
+    def load(cls):
+        if shapely is None:
+            raise ImproperlyConfigured(
+                'GEOSEARCH_ENGINE strtree needs the shapely package')
+
+        generation = current_generation()
+
+        with connection.cursor() as cursor:
+            cursor.execute(PARKEERVAKKEN_SQL)
+            rows = cursor.fetchall()
+
+        ids = [row[0] for row in rows]
+        geometries = shapely.from_wkb([bytes(row[1]) for row in rows])
+        return cls(ids, geometries, generation)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def is_stale(self):
+        return current_generation() != self.generation
+
+    def _feature(self, index):
+        return self.ids[index], round_geometry(
+            mapping(self.geometries[index]))
+
+    def contains(self, x, y):
+        """
+        Returns (id, geojson geometry) of the parkeervak containing the
+        point, None when the point is not inside any parkeervak.
+        """
+        point = shapely.points(x, y)
+        candidates = self.tree.query(point)
+
+        if not len(candidates):
+            return None
+
+        inside = shapely.contains(self.geometries[candidates], point)
+        matches = candidates[inside]
+
+        if not len(matches):
+            return None
+
+        return self._feature(matches[0])
+
+    def nearest(self, x, y, k):
+        """
+        Returns the (id, geojson geometry) of the `k` parkeervakken nearest
+        to the point, nearest first.
+        """
+        if not len(self):
+            return []
+
+        point = shapely.points(x, y)
+
+        # Start searching at the distance of the nearest geometry and
+        # widen the search until there are enough candidates.
+        nearest = self.tree.query_nearest(point, return_distance=True)
+        distance = max(float(nearest[1][0]), 1.0)
+
+        while True:
+            candidates = self.tree.query(
+                point, predicate='dwithin', distance=distance)
+            if len(candidates) >= k or len(candidates) == len(self):
+                break
+            distance *= 2
+
+        distances = shapely.distance(self.geometries[candidates], point)
+        order = numpy.argsort(distances, kind='stable')[:k]
+        return [self._feature(index) for index in candidates[order]]
+
+
+class MmapEngine(GeometryStore):
+    """Geometry snapshot shared by all workers, see `geostore`"""
+
+    @classmethod
+    def load(cls):
+        return cls(settings.GEOSEARCH_SNAPSHOT)
+
+    def feature_geometry(self, feature):
+        return round_geometry(super().feature_geometry(feature))
+
+
+ENGINES = {
+    'strtree': STRtreeEngine,
+    'mmap': MmapEngine,
+}
+
+_lock = threading.Lock()
+
+_loaded = {
+    'engine': None,
+}
+
+
+def get_engine():
+    """
+    Returns the configured geosearch engine, None when geosearch should be
+    done by PostGIS.
+    """
+    name = settings.GEOSEARCH_ENGINE
+
+    if name == 'postgis':
+        return None
+
+    if name not in ENGINES:
+        raise ImproperlyConfigured(
+            'Unknown GEOSEARCH_ENGINE {}'.format(name))
+
+    with _lock:
+        engine = _loaded['engine']
+        if engine is None or engine.is_stale():
+            engine = ENGINES[name].load()
+            log.info(
+                'Loaded %s geosearch engine with %d parkeervakken '
+                'for import generation %s', name, len(engine),
+                engine.generation)
+            _loaded['engine'] = engine
+
+        return engine
+
+
+def warm_engine():
+    """
+    Load the geosearch engine when a worker starts instead of on the first
+    request.
+    """
+    if settings.GEOSEARCH_ENGINE == 'postgis':
+        return
+
+    try:
+        get_engine()
+    except Exception:
+        log.exception('Could not load the geosearch engine')
+    finally:
+        # Do not hand an open connection to forked workers
+        connection.close()
@@ -0,0 +1,239 @@
+"""
+Read-only access to the geometry snapshot written by the importer
+(`deploy/geometry_snapshot.py`, which documents the file layout).
+
+The file is memory mapped, so opening it costs next to nothing and all
+uWSGI workers share the same pages. Lookups use the packed Hilbert R-tree
+stored in the file, the exact tests are done on the coordinates in place.
+"""
+import heapq
+import math
+import mmap
+import os
+import struct
+import sys
+
+MAGIC = b'PVSNAP\x00\x01'
+HEADER = struct.Struct('<8s8I')
+HEADER_SIZE = 64
+
+
+class SnapshotError(Exception):
+    pass
+
+
+def _ring_contains(coords, start, end, x, y):
+    """Even-odd test of point x, y against the ring coords[start:end]"""
+    inside = False
+    xj = coords[2 * (end - 1)]
+    yj = coords[2 * (end - 1) + 1]
+    for i in range(start, end):
+        xi = coords[2 * i]
+        yi = coords[2 * i + 1]
+        if (yi > y) != (yj > y) and \
+                x < (xj - xi) * (y - yi) / (yj - yi) + xi:
+            inside = not inside
+        xj, yj = xi, yi
+    return inside
+
+
+def _ring_distance(coords, start, end, x, y):
+    """Distance of point x, y to the edges of the ring coords[start:end]"""
+    best = math.inf
+    for i in range(start, end - 1):
+        ax, ay = coords[2 * i], coords[2 * i + 1]
+        bx, by = coords[2 * i + 2], coords[2 * i + 3]
+        dx, dy = bx - ax, by - ay
+        length = dx * dx + dy * dy
+        t = 0.0
+        if length:
+            t = max(0.0, min(1.0, ((x - ax) * dx + (y - ay) * dy) / length))
+        best = min(best, math.hypot(x - ax - t * dx, y - ay - t * dy))
+    return best
+
+
+def _box_distance(box, x, y):
+    dx = max(box[0] - x, 0.0, x - box[2])
+    dy = max(box[1] - y, 0.0, y - box[3])
+    return math.hypot(dx, dy)
+
+
+class GeometryStore(object):
+
+    def __init__(self, path):
+        self.path = path
+
+        with open(path, 'rb') as f:
+            self.stat = os.fstat(f.fileno())
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, self.generation, self.n_features, n_parts, n_rings, \
+            n_coords, self.n_nodes, self.node_size, ids_bytes = \
+            HEADER.unpack_from(self._mmap, 0)
+
+        if magic != MAGIC:
+            raise SnapshotError('{} is not a geometry snapshot'.format(path))
+
+        if sys.byteorder == 'big':
+            raise SnapshotError('Snapshots can only be read little endian')
+
+        view = memoryview(self._mmap)
+        offset = HEADER_SIZE
+
+        def section(fmt, count):
+            nonlocal offset
+            size = struct.calcsize(fmt) * count
+            data = view[offset:offset + size].cast(fmt)
+            offset += size + (-size % 8)
+            return data
+
+        self.boxes = section('d', self.n_nodes * 4)
+        self.indices = section('I', self.n_nodes)
+        self.parts = section('I', self.n_features + 1)
+        self.rings = section('I', n_parts + 1)
+        self.coords_at = section('I', n_rings + 1)
+        self.coords = section('d', n_coords * 2)
+        self.ids_at = section('I', self.n_features + 1)
+        self.ids = view[offset:offset + ids_bytes]
+
+        # Last node of every tree level, leaves first
+        self.level_ends = [self.n_features]
+        count = self.n_features
+        end = self.n_features
+        while count > 1:
+            count = -(-count // self.node_size)
+            end += count
+            self.level_ends.append(end)
+
+    def __len__(self):
+        return self.n_features
+
+    def is_stale(self):
+        """True when the importer replaced the snapshot file"""
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return False
+        return (stat.st_ino, stat.st_mtime_ns) != \
+            (self.stat.st_ino, self.stat.st_mtime_ns)
+
+    def box(self, node):
+        return self.boxes[4 * node:4 * node + 4]
+
+    def _children(self, node):
+        """Node positions of the children of an internal node"""
+        first = self.indices[node]
+        level_end = next(end for end in self.level_ends if end > first)
+        return range(first, min(first + self.node_size, level_end))
+
+    def search(self, minx, miny, maxx, maxy):
+        """Features with a bounding box intersecting the given box"""
+        if not self.n_features:
+            return []
+
+        results = []
+        stack = [self.n_nodes - 1]
+
+        while stack:
+            node = stack.pop()
+            box = self.box(node)
+            if box[2] < minx or box[3] < miny or \
+                    box[0] > maxx or box[1] > maxy:
+                continue
+            if node < self.n_features:
+                results.append(self.indices[node])
+            else:
+                stack.extend(self._children(node))
+
+        return results
+
+    def feature_id(self, feature):
+        return bytes(
+            self.ids[self.ids_at[feature]:self.ids_at[feature + 1]]
+        ).decode('utf-8')
+
+    def _polygons(self, feature):
+        for part in range(self.parts[feature], self.parts[feature + 1]):
+            yield [
+                (self.coords_at[ring], self.coords_at[ring + 1])
+                for ring in range(self.rings[part], self.rings[part + 1])
+            ]
+
+    def feature_contains(self, feature, x, y):
+        for rings in self._polygons(feature):
+            shell, holes = rings[0], rings[1:]
+            if not _ring_contains(self.coords, shell[0], shell[1], x, y):
+                continue
+            if not any(_ring_contains(self.coords, start, end, x, y)
+                       for start, end in holes):
+                return True
+        return False
+
+    def feature_distance(self, feature, x, y):
+        if self.feature_contains(feature, x, y):
+            return 0.0
+        return min(
+            _ring_distance(self.coords, start, end, x, y)
+            for rings in self._polygons(feature)
+            for start, end in rings
+        )
+
+    def feature_geometry(self, feature):
+        """GeoJSON MultiPolygon of a feature"""
+        coords = self.coords
+        return {
+            'type': 'MultiPolygon',
+            'coordinates': [
+                [
+                    [[coords[2 * i], coords[2 * i + 1]]
+                     for i in range(start, end)]
+                    for start, end in rings
+                ]
+                for rings in self._polygons(feature)
+            ],
+        }
+
+    def contains(self, x, y):
+        """
+        Returns (id, geojson geometry) of the parkeervak containing the
+        point, None when the point is not inside any parkeervak.
+        """
+        for feature in self.search(x, y, x, y):
+            if self.feature_contains(feature, x, y):
+                return self.feature_id(feature), \
+                    self.feature_geometry(feature)
+        return None
+
+    def nearest(self, x, y, k):
+        """
+        Returns the (id, geojson geometry) of the `k` parkeervakken nearest
+        to the point, nearest first.
+        """
+        if not self.n_features:
+            return []
+
+        found = []
+        root = self.n_nodes - 1
+        # (distance, is exact feature distance, node)
+        queue = [(_box_distance(self.box(root), x, y), False, root)]
+
+        while queue and len(found) < k:
+            distance, exact, node = heapq.heappop(queue)
+
+            if exact:
+                found.append(node)
+            elif node < self.n_features:
+                feature = self.indices[node]
+                heapq.heappush(
+                    queue,
+                    (self.feature_distance(feature, x, y), True, feature))
+            else:
+                for child in self._children(node):
+                    heapq.heappush(
+                        queue,
+                        (_box_distance(self.box(child), x, y), False, child))
+
+        return [
+            (self.feature_id(feature), self.feature_geometry(feature))
+            for feature in found
+        ]
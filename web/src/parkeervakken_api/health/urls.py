@@ -5,6 +5,7 @@ from . import views
 urlpatterns = [
     path('health', views.health),
     path('data', views.check_data),
+    path('metrics', views.metrics),
 ]
 
 
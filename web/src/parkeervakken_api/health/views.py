@@ -13,6 +13,8 @@ except ImportError:
 
 from django.http import HttpResponse
 
+from parkeervakken_api.db import get_connection_stats
+
 try:
     model = get_model(settings.HEALTH_MODEL)
 except: # noqa E722
@@ -49,3 +51,31 @@ def check_data(request):
 
     return HttpResponse(
         "Data OK", content_type='text/plain', status=200)
+
+
+def metrics(request):
+    """
+    Database connection reuse counters of this worker process in the
+    Prometheus text format.
+    """
+    stats = get_connection_stats()
+
+    lines = [
+        '# HELP parkeervakken_db_connection_reuse_total '
+        'Requests that reused an open database connection.',
+        '# TYPE parkeervakken_db_connection_reuse_total counter',
+        'parkeervakken_db_connection_reuse_total {}'.format(stats['hits']),
+        '# HELP parkeervakken_db_connection_new_total '
+        'New database connections opened.',
+        '# TYPE parkeervakken_db_connection_new_total counter',
+        'parkeervakken_db_connection_new_total {}'.format(stats['misses']),
+        '# HELP parkeervakken_db_connection_unusable_total '
+        'Reused database connections that failed the health check.',
+        '# TYPE parkeervakken_db_connection_unusable_total counter',
+        'parkeervakken_db_connection_unusable_total {}'.format(
+            stats['unusable']),
+    ]
+
+    return HttpResponse(
+        '\n'.join(lines) + '\n',
+        content_type='text/plain; version=0.0.4', status=200)
@@ -0,0 +1,54 @@
+import time
+
+from django.core.management.base import BaseCommand
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from parkeervakken_api.models import Parkeervak
+from parkeervakken_api.renderers import JSONRenderer
+from parkeervakken_api.serializers import ParkeervakRowSerializer
+from parkeervakken_api.serializers import ParkeervakSerializer
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare the CPU time per row of the ParkeervakSerializer and the '
+        'ParkeervakRowSerializer for the parkeervakken list.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1000)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        request = Request(
+            APIRequestFactory().get('/parkeervakken/parkeervakken/'))
+        context = {'request': request}
+        renderer = JSONRenderer()
+        queryset = Parkeervak.objects.order_by('id')[:options['rows']]
+
+        def serializer_path():
+            data = ParkeervakSerializer(
+                queryset.all(), many=True, context=context).data
+            return renderer.render(data)
+
+        def row_path():
+            rows = ParkeervakRowSerializer.rows(queryset.all())
+            data = ParkeervakRowSerializer(context).serialize(rows)
+            return renderer.render(data)
+
+        rows = queryset.count()
+        if not rows:
+            self.stderr.write('No parkeervakken to benchmark')
+            return
+
+        for name, path in (('serializer', serializer_path),
+                           ('rows', row_path)):
+            best = None
+            for _ in range(options['repeat']):
+                start = time.process_time()
+                path()
+                elapsed = time.process_time() - start
+                best = elapsed if best is None else min(best, elapsed)
+
+            self.stdout.write('{:12} {:8.1f} us/row CPU ({} rows)'.format(
+                name, best * 1e6 / rows, rows))
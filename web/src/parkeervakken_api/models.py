@@ -1,5 +1,7 @@
 from django.contrib.gis.db import models
 
+PARKEERVAK_DISPLAY = "Parkeervak {} te {}"
+
 
 class Parkeervak(models.Model):
     """
@@ -21,7 +23,53 @@ class Parkeervak(models.Model):
     geometrie = models.MultiPolygonField(name='geometrie')
 
     def __str__(self):
-        return f"Parkeervak {self.id} te {self.straatnaam}"
+        return PARKEERVAK_DISPLAY.format(self.id, self.straatnaam)
+
+
+class Capaciteit(models.Model):
+    """
+    Aantal parkeervakken en plaatsen per straat en soort parkeervak
+    """
+    class Meta:
+        db_table = 'geo_parkeervakken_capaciteit'
+
+    stadsdeel = models.CharField(max_length=20, null=True)
+    buurtcode = models.CharField(max_length=20, null=True)
+    straatnaam = models.CharField(max_length=40, null=True)
+    e_type = models.CharField(max_length=5, null=True)
+    soort = models.CharField(max_length=20, null=True)
+    type = models.CharField(max_length=20, null=True)
+    aantal_vakken = models.IntegerField()
+    aantal = models.IntegerField(null=True)
+
+
+class Dagtotaal(models.Model):
+    """
+    Aantal parkeervakken, plaatsen en reserveringen per buurt en e_type per dag
+    """
+    class Meta:
+        db_table = 'geo_parkeervakken_dagtotalen'
+
+    datum = models.DateField()
+    stadsdeel = models.CharField(max_length=40, null=True)
+    buurtcode = models.CharField(max_length=20, null=True)
+    e_type = models.CharField(max_length=5, null=True)
+    aantal_vakken = models.IntegerField()
+    aantal = models.IntegerField(null=True)
+    reserveringen = models.IntegerField()
+
+
+class Wijziging(models.Model):
+    """
+    Parkeervak toegevoegd, gewijzigd of verwijderd door een import generatie
+    """
+    class Meta:
+        db_table = 'geo_parkeervakken_changes'
+
+    id = models.CharField(max_length=50, primary_key=True)
+    generation = models.IntegerField()
+    parkeer_id = models.CharField(max_length=30)
+    change = models.CharField(max_length=10)
 
 
 class GeoSelection(models.Model):
@@ -0,0 +1,153 @@
+"""
+HAL pagination with a configurable way to count the filtered parkeervakken.
+
+LIST_COUNT_STRATEGY
+
+exact       COUNT(*) for every page, like `HALPagination`
+cached      COUNT(*) once per query and import generation
+estimated   the row estimate of the query planner. Small results, below
+            `LIST_COUNT_EXACT_BELOW`, are counted exactly. The response gets
+            `"count_estimated": true` when the count is an estimate.
+"""
+import hashlib
+import json
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.paginator import EmptyPage
+from django.core.paginator import Page
+from django.core.paginator import PageNotAnInteger
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+
+from datapunt_api.pagination import HALPagination
+from parkeervakken_api.generation import current_generation
+
+COUNT_STRATEGIES = ('exact', 'cached', 'estimated')
+
+# Counts are keyed on the import generation, the timeout only keeps the
+# cache from filling up with old generations.
+CACHE_TIMEOUT = 24 * 60 * 60
+
+if settings.LIST_COUNT_STRATEGY not in COUNT_STRATEGIES:
+    raise ImproperlyConfigured(
+        'LIST_COUNT_STRATEGY must be one of {}'.format(
+            ', '.join(COUNT_STRATEGIES)))
+
+
+class EstimatedPage(Page):
+    """
+    Page of a paginator with an estimated count. Whether there is a next
+    page is known from fetching one row more than the page size.
+    """
+
+    def __init__(self, object_list, number, paginator, has_next):
+        super().__init__(object_list, number, paginator)
+        self._has_next = has_next
+
+    def has_next(self):
+        return self._has_next
+
+    def next_page_number(self):
+        return self.number + 1
+
+    def previous_page_number(self):
+        return self.number - 1
+
+    def end_index(self):
+        return self.start_index() + len(self.object_list) - 1
+
+
+class CountPaginator(Paginator):
+
+    estimated = False
+
+    def _sql(self):
+        query = self.object_list.query.clone()
+        query.clear_ordering(force_empty=True)
+        return query.sql_with_params()
+
+    def exact_count(self):
+        return Paginator.count.func(self)
+
+    def cached_count(self):
+        sql, params = self._sql()
+        digest = hashlib.sha1(
+            json.dumps([sql, params], default=str).encode()).hexdigest()
+        key = 'parkeervakken:count:{}:{}'.format(
+            current_generation(), digest)
+
+        count = cache.get(key)
+        if count is None:
+            count = self.exact_count()
+            cache.set(key, count, CACHE_TIMEOUT)
+        return count
+
+    def estimated_count(self):
+        sql, params = self._sql()
+        connection = connections[self.object_list.db]
+
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN (FORMAT JSON) ' + sql, params)
+            plan = cursor.fetchone()[0]
+
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+
+        estimate = plan[0]['Plan']['Plan Rows']
+        if estimate < settings.LIST_COUNT_EXACT_BELOW:
+            return self.exact_count()
+
+        self.estimated = True
+        return int(estimate)
+
+    @cached_property
+    def count(self):
+        strategy = settings.LIST_COUNT_STRATEGY
+        if not hasattr(self.object_list, 'query') or strategy == 'exact':
+            return self.exact_count()
+        if strategy == 'cached':
+            return self.cached_count()
+        return self.estimated_count()
+
+    def page(self, number):
+        if not self.count or not self.estimated:
+            return super().page(number)
+
+        # The estimate could be too low, so the page number is not checked
+        # against the number of pages.
+        try:
+            number = int(number)
+        except (TypeError, ValueError):
+            raise PageNotAnInteger('That page number is not an integer')
+        if number < 1:
+            raise EmptyPage('That page number is less than 1')
+
+        bottom = (number - 1) * self.per_page
+        rows = list(self.object_list[bottom:bottom + self.per_page + 1])
+        if not rows and number > 1:
+            raise EmptyPage('That page contains no results')
+
+        return EstimatedPage(
+            rows[:self.per_page], number, self,
+            has_next=len(rows) > self.per_page)
+
+
+class CountPagination(HALPagination):
+    django_paginator_class = CountPaginator
+
+    def get_paginated_response(self, data):
+        response = super().get_paginated_response(data)
+
+        if self.page.paginator.estimated:
+            data = OrderedDict()
+            for name, value in response.data.items():
+                data[name] = value
+                if name == 'count':
+                    data['count_estimated'] = True
+            response.data = data
+
+        return response
@@ -0,0 +1,156 @@
+import json
+
+import simplejson
+
+from django.conf import settings
+from django.contrib.gis.geos import GEOSGeometry
+from django.core.exceptions import ImproperlyConfigured
+from rest_framework import encoders
+from rest_framework import renderers
+from rest_framework.compat import INDENT_SEPARATORS
+from rest_framework.compat import LONG_SEPARATORS
+from rest_framework.compat import SHORT_SEPARATORS
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+JSON_BACKENDS = ('orjson', 'simplejson', 'stdlib')
+
+if settings.JSON_RENDERER_BACKEND not in JSON_BACKENDS:
+    raise ImproperlyConfigured(
+        'JSON_RENDERER_BACKEND must be one of {}'.format(
+            ', '.join(JSON_BACKENDS)))
+
+if settings.JSON_RENDERER_BACKEND == 'orjson' and orjson is None:
+    raise ImproperlyConfigured(
+        'JSON_RENDERER_BACKEND is orjson, but orjson is not installed')
+
+
+class RawJSON(simplejson.RawJSON):
+    """
+    Already encoded JSON. simplejson writes it as is, orjson as a fragment
+    and the standard library json module decodes it first.
+    """
+
+
+class JSONEncoder(encoders.JSONEncoder):
+    """rest_framework JSONEncoder that also knows geometries and RawJSON"""
+
+    def default(self, obj):
+        if isinstance(obj, RawJSON):
+            return json.loads(obj.encoded_json)
+        if isinstance(obj, GEOSGeometry):
+            return json.loads(obj.geojson)
+        return super().default(obj)
+
+
+_encoder = JSONEncoder()
+
+
+def _orjson_default(obj):
+    if isinstance(obj, RawJSON):
+        return orjson.Fragment(obj.encoded_json)
+    return _encoder.default(obj)
+
+
+class JSONRenderer(renderers.JSONRenderer):
+    """
+    Same output as the rest_framework JSONRenderer, but encoded by the
+    `JSON_RENDERER_BACKEND`:
+
+    orjson      fastest, used for compact output without ensure_ascii,
+                anything else falls back to simplejson. Floats that need
+                an exponent are written as 1e-5 instead of 1e-05, the RD
+                coordinates never do.
+    simplejson  writes values wrapped in `RawJSON` as they are, so the
+                GeoJSON made by PostGIS is not decoded and encoded again
+    stdlib      the rest_framework JSONRenderer
+    """
+    encoder_class = JSONEncoder
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        backend = settings.JSON_RENDERER_BACKEND
+
+        if backend == 'stdlib':
+            return super().render(
+                data, accepted_media_type, renderer_context)
+
+        if data is None:
+            return b''
+
+        renderer_context = renderer_context or {}
+        indent = self.get_indent(accepted_media_type, renderer_context)
+
+        if backend == 'orjson' and indent is None and self.compact \
+                and not self.ensure_ascii:
+            try:
+                return self.render_orjson(data)
+            except orjson.JSONEncodeError:
+                # Integers over 64 bit, recursion limits and the like
+                pass
+
+        if indent is None:
+            separators = SHORT_SEPARATORS if self.compact else LONG_SEPARATORS
+        else:
+            separators = INDENT_SEPARATORS
+
+        ret = simplejson.dumps(
+            data, default=self.encoder_class().default,
+            indent=indent, ensure_ascii=self.ensure_ascii,
+            allow_nan=not self.strict, separators=separators,
+            use_decimal=False, namedtuple_as_object=False
+        )
+
+        ret = ret.replace('\u2028', '\\u2028').replace('\u2029', '\\u2029')
+        return ret.encode()
+
+    def render_orjson(self, data):
+        # Dates go through the rest_framework encoder, orjson formats
+        # them differently.
+        ret = orjson.dumps(
+            data, default=_orjson_default,
+            option=orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS)
+
+        return ret.replace(
+            '\u2028'.encode(), b'\\u2028').replace(
+            '\u2029'.encode(), b'\\u2029')
+
+
+class BinaryRenderer(renderers.BaseRenderer):
+    """
+    Passes on a geometry encoding made by PostGIS (see
+    `parkeervakken_api.binary`). Anything else, like an error, is rendered
+    as JSON.
+    """
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, (bytes, bytearray, memoryview)):
+            return bytes(data)
+
+        response = (renderer_context or {}).get('response')
+        if response is not None:
+            response['Content-Type'] = JSONRenderer.media_type
+
+        return JSONRenderer().render(data)
+
+
+class FlatGeobufRenderer(BinaryRenderer):
+    media_type = 'application/flatgeobuf'
+    format = 'fgb'
+
+
+class GeobufRenderer(BinaryRenderer):
+    media_type = 'application/x-protobuf'
+    format = 'pbf'
+
+
+class WKBRenderer(BinaryRenderer):
+    media_type = 'application/x-wkb'
+    format = 'wkb'
+
+
+BINARY_RENDERERS = (FlatGeobufRenderer, GeobufRenderer, WKBRenderer)
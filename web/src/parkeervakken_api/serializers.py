@@ -1,11 +1,24 @@
-import json
-import logging
-
+from collections import OrderedDict
+from urllib.parse import quote
+
+from django.db.models import Func
+from django.db.models import TextField
+from django.db.models import Value
+from django.urls import reverse
+from django.utils.http import RFC3986_SUBDELIMS
 from rest_framework import serializers
 
 from datapunt_api.rest import DisplayField
 from datapunt_api.rest import HALSerializer
 from parkeervakken_api.models import Parkeervak, GeoSelection
+from parkeervakken_api.models import PARKEERVAK_DISPLAY
+from parkeervakken_api.renderers import RawJSON
+
+# GeoJSON by PostGIS as GDAL writes it for the `ParkeervakSerializer`:
+# without the crs member PostGIS 3 adds for other SRIDs than 4326, and with
+# 9 decimals, the 15 significant digits of GDAL for RD coordinates.
+GEOJSON_DECIMALS = 9
+GEOJSON_OPTIONS = 0
 
 
 class BaseSerializer(object):
@@ -51,6 +64,64 @@ class ParkeervakSerializer(BaseSerializer, HALSerializer):
         fields = ["_links", "_display", "id", "buurtcode", "straatnaam", "aantal", "type", "e_type", "e_type_desc", "bord", "geometrie"]
 
 
+class ParkeervakRowSerializer(BaseSerializer):
+    """
+    Same output as the `ParkeervakSerializer`, for the rows of
+    `parkeervak_rows`. The base url is computed once per request instead of
+    once per row, and the GeoJSON made by PostGIS is passed on as is.
+    """
+
+    fields = (
+        'id', 'buurtcode', 'straatnaam', 'aantal', 'type', 'e_type',
+        'e_type_desc', 'bord', 'geojson',
+    )
+
+    def __init__(self, context):
+        self.context = context
+        # Split the detail url around the id, so the url of a row is
+        # just a concatenation.
+        marker = 'PARKEERVAK_ID'
+        url = self.href_url(
+            reverse('parkeervak-detail', kwargs={'pk': marker}))
+        self.url_prefix, self.url_suffix = url.split(marker)
+
+    @classmethod
+    def rows(cls, queryset):
+        """Fetch the parkeervakken as tuples, with GeoJSON by PostGIS"""
+        return queryset.annotate(
+            geojson=Func(
+                'geometrie', Value(GEOJSON_DECIMALS), Value(GEOJSON_OPTIONS),
+                function='ST_AsGeoJSON', output_field=TextField())
+        ).values_list(*cls.fields)
+
+    def to_representation(self, row):
+        pk, buurtcode, straatnaam, aantal, type_, e_type, e_type_desc, \
+            bord, geojson = row
+
+        return OrderedDict([
+            ('_links', OrderedDict([
+                ('self', dict(href=''.join([
+                    self.url_prefix,
+                    quote(pk, safe=RFC3986_SUBDELIMS + '/~:@'),
+                    self.url_suffix,
+                ]))),
+            ])),
+            ('_display', PARKEERVAK_DISPLAY.format(pk, straatnaam)),
+            ('id', pk),
+            ('buurtcode', buurtcode),
+            ('straatnaam', straatnaam),
+            ('aantal', None if aantal is None else int(aantal)),
+            ('type', type_),
+            ('e_type', e_type),
+            ('e_type_desc', e_type_desc),
+            ('bord', bord),
+            ('geometrie', None if geojson is None else RawJSON(geojson)),
+        ])
+
+    def serialize(self, rows):
+        return [self.to_representation(row) for row in rows]
+
+
 class SimpleParkeervakSerializer(BaseSerializer, HALSerializer):
     class Meta(object):
         model = Parkeervak
@@ -55,8 +55,43 @@ DATABASES = {
     'default': DATABASE_OPTIONS[get_database_key()]
 }
 
+# Connection reuse. With CONN_MAX_AGE > 0 every uWSGI worker keeps its
+# connection open between requests instead of reconnecting per request.
+# CONN_HEALTH_CHECKS pings a reused connection before handing it out.
+DATABASES['default']['CONN_MAX_AGE'] = int(
+    os.getenv('DATABASE_CONN_MAX_AGE', '0'))
+DATABASES['default']['CONN_HEALTH_CHECKS'] = \
+    os.getenv('DATABASE_CONN_HEALTH_CHECKS', 'true').lower() == 'true'
+
+# PgBouncer in transaction pooling mode does not support server side
+# cursors.
+if os.getenv('DATABASE_PGBOUNCER', 'false').lower() == 'true':
+    DATABASES['default']['DISABLE_SERVER_SIDE_CURSORS'] = True
+
 HEALTH_MODEL = 'parkeervakken_api.Parkeervak'
 
+# Render JSON parkeervakken lists without the rest_framework serializers
+FAST_LIST_RENDERING = \
+    os.getenv('FAST_LIST_RENDERING', 'true').lower() == 'true'
+
+# orjson, simplejson or stdlib, see parkeervakken_api.renderers
+JSON_RENDERER_BACKEND = os.getenv('JSON_RENDERER_BACKEND', 'orjson')
+
+# exact, cached or estimated, see parkeervakken_api.pagination
+LIST_COUNT_STRATEGY = os.getenv('LIST_COUNT_STRATEGY', 'exact')
+LIST_COUNT_EXACT_BELOW = int(os.getenv('LIST_COUNT_EXACT_BELOW', '10000'))
+
+# Seconds between checks for a new import generation
+IMPORT_GENERATION_CHECK_INTERVAL = int(
+    os.getenv('IMPORT_GENERATION_CHECK_INTERVAL', '60'))
+
+# postgis, strtree or mmap, see parkeervakken_api.geoindex
+GEOSEARCH_ENGINE = os.getenv('GEOSEARCH_ENGINE', 'postgis')
+
+# Geometry snapshot written by the importer, for the mmap engine
+GEOSEARCH_SNAPSHOT = os.getenv(
+    'GEOSEARCH_SNAPSHOT', '/data/snapshot/parkeervakken.bin')
+
 SENTRY_DSN = os.getenv('SENTRY_DSN')
 if SENTRY_DSN:
     sentry_sdk.init(
@@ -108,7 +108,7 @@ REST_FRAMEWORK = dict(
     ),
 
     DEFAULT_RENDERER_CLASSES=(
-        'rest_framework.renderers.JSONRenderer',
+        'parkeervakken_api.renderers.JSONRenderer',
         'rest_framework.renderers.BrowsableAPIRenderer'
     ),
     DEFAULT_FILTER_BACKENDS=(
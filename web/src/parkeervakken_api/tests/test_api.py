@@ -1,6 +1,15 @@
 # Packages
+import json
+from unittest.mock import patch
+
+from django.contrib.gis.geos import MultiPolygon
+from django.contrib.gis.geos import Polygon
+from django.test import override_settings
 from rest_framework.test import APITestCase
 
+from parkeervakken_api import binary
+from parkeervakken_api import geoindex
+from parkeervakken_api.models import Wijziging
 from . import factories
 
 
@@ -10,6 +19,8 @@ class BrowseDatasetsTestCase(APITestCase):
         'parkeervakken/parkeervakken',
         'parkeervakken/geosearch',
         'parkeervakken/geoselection',
+        'parkeervakken/capaciteit',
+        'parkeervakken/tijdreeks',
     ]
 
     with_count = [
@@ -70,3 +81,262 @@ class BrowseDatasetsTestCase(APITestCase):
                     'count',
                     response.data,
                     'No count attribute in {}'.format(url))
+
+    def test_connection_metrics(self):
+        response = self.client.get('/status/metrics')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(
+            b'parkeervakken_db_connection_reuse_total', response.content)
+        self.assertIn(
+            b'parkeervakken_db_connection_new_total', response.content)
+
+    def test_geosearch_nearest(self):
+        response = self.client.get(
+            '/parkeervakken/geosearch/?x=121000&y=487000&nearest=1')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data), 1)
+        self.assertEqual(response.data[0]['id'], self.p.id)
+
+    def geosearch(self, engine, query):
+        geoindex._loaded['engine'] = None
+        with override_settings(GEOSEARCH_ENGINE=engine):
+            response = self.client.get(
+                '/parkeervakken/geosearch/?{}'.format(query))
+
+        self.assertEqual(response.status_code, 200)
+        return json.loads(response.content)
+
+    def test_geosearch_strtree(self):
+        vierkant = Polygon.from_bbox((122000, 488000, 122010, 488010))
+        vierkant.srid = 28992
+        other = factories.ParkeervakFactory(
+            geometrie=MultiPolygon([vierkant]))
+
+        # More digits than the 15 significant digits of the GeoJSON
+        fijn = Polygon.from_bbox(
+            (123000.123456789012, 489000.987654321098,
+             123010.555555555555, 489010.111111111111))
+        fijn.srid = 28992
+        factories.ParkeervakFactory(geometrie=MultiPolygon([fijn]))
+
+        queries = [
+            # Inside the parkeervak, outside of all parkeervakken
+            'x=121880&y=487310',
+            'x=121000&y=487000',
+            'x=121880&y=487310&nearest=1',
+            'x=121000&y=487000&nearest=2',
+            'x=122005&y=488005&nearest=100',
+            'x=123005&y=489005',
+        ]
+        for query in queries:
+            self.assertEqual(
+                self.geosearch('strtree', query),
+                self.geosearch('postgis', query), query)
+
+        found = self.geosearch('strtree', 'x=121880&y=487310')
+        self.assertEqual([f['id'] for f in found], [self.p.id])
+        self.assertEqual(
+            found[0]['_links']['self']['href'],
+            'http://testserver/parkeervakken/parkeervakken/{}/'.format(
+                self.p.id))
+        self.assertEqual(self.geosearch('strtree', 'x=121000&y=487000'), [])
+
+        found = self.geosearch('strtree', 'x=121000&y=487000&nearest=2')
+        self.assertEqual([f['id'] for f in found], [self.p.id, other.id])
+        geoindex._loaded['engine'] = None
+
+    def test_geosearch_strtree_stale(self):
+        with override_settings(GEOSEARCH_ENGINE='strtree'), \
+                patch('parkeervakken_api.geoindex.current_generation',
+                      return_value=1):
+            geoindex._loaded['engine'] = None
+            engine = geoindex.get_engine()
+            self.assertFalse(engine.is_stale())
+
+            # Any new import, whether or not it recorded changes
+            with patch('parkeervakken_api.geoindex.current_generation',
+                       return_value=2):
+                self.assertTrue(engine.is_stale())
+                self.assertIsNot(geoindex.get_engine(), engine)
+        geoindex._loaded['engine'] = None
+
+    def test_list_fast_rendering(self):
+        # Coordinates with all the decimals GeoJSON can have
+        vierkant = Polygon.from_bbox(
+            (122000.123456789, 488000.5, 122010.987654321, 488010.25))
+        vierkant.srid = 28992
+        factories.ParkeervakFactory(
+            geometrie=MultiPolygon([vierkant]), aantal=2, e_type='E9')
+
+        content = {}
+        for fast in (True, False):
+            with override_settings(FAST_LIST_RENDERING=fast):
+                response = self.client.get('/parkeervakken/parkeervakken/')
+            self.assertEqual(response.status_code, 200)
+            content[fast] = response.content
+
+        # ParkeervakRowSerializer and ParkeervakSerializer
+        self.assertEqual(content[True], content[False])
+
+    def test_list_wkb(self):
+        response = self.client.get('/parkeervakken/parkeervakken/?format=wkb')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/x-wkb')
+        self.assertEqual(response['X-Total-Count'], '1')
+        # One parkeervak, followed by the length of its id
+        self.assertEqual(response.content[:8], b'\x01\x00\x00\x00\x1e\x00\x00\x00')
+        self.assertEqual(response.content[8:38], self.p.id.encode())
+
+    def test_binary_unsupported(self):
+        # Like a PostGIS before 3.2, without ST_AsFlatGeobuf
+        with patch.dict(binary._supported, {'fgb': False}):
+            for url in ['/parkeervakken/parkeervakken/?format=fgb',
+                        '/parkeervakken/geosearch/?x=121000&y=487000'
+                        '&format=fgb']:
+                response = self.client.get(url)
+
+                self.assertEqual(response.status_code, 406, url)
+                self.assertEqual(
+                    response['Content-Type'], 'application/json')
+                self.assertIn(b'fgb', response.content)
+
+        # Asked once, whatever the test database supports
+        self.assertTrue(binary.supported('wkb'))
+        supported = binary.supported('fgb')
+        self.assertEqual(binary._supported['fgb'], supported)
+
+    @override_settings(LIST_COUNT_STRATEGY='estimated')
+    def test_list_estimated_count(self):
+        response = self.client.get('/parkeervakken/parkeervakken/')
+
+        # Small results are counted exactly
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['count'], 1)
+        self.assertNotIn('count_estimated', response.data)
+
+    def test_changes(self):
+        response = self.client.get('/parkeervakken/changes/?since=0')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        self.assertIn('X-Import-Generation', response)
+
+        lines = b''.join(response.streaming_content).splitlines()
+        self.assertEqual(len(lines), 1)
+        change = json.loads(lines[0])
+        self.assertEqual(change['id'], self.p.id)
+        self.assertEqual(change['change'], 'added')
+        self.assertEqual(change['parkeervak']['id'], self.p.id)
+
+        response = self.client.get('/parkeervakken/changes/?since=-1')
+        self.assertEqual(response.status_code, 400)
+
+    def changes(self, since):
+        with patch('parkeervakken_api.views.current_generation',
+                   return_value=2):
+            response = self.client.get(
+                '/parkeervakken/changes/?since={}'.format(since))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-Import-Generation'], '2')
+        return [
+            json.loads(line)
+            for line in b''.join(response.streaming_content).splitlines()
+        ]
+
+    def test_changes_since(self):
+        nieuw = factories.ParkeervakFactory(id='NIEUW')
+
+        for generation, parkeer_id, change in [
+                (1, self.p.id, 'added'),
+                (1, 'WEG', 'added'),
+                (2, self.p.id, 'modified'),
+                (2, 'WEG', 'removed'),
+                (2, nieuw.id, 'added'),
+                # Imported after the current generation was read
+                (3, self.p.id, 'removed')]:
+            Wijziging.objects.create(
+                id='{}-{}'.format(generation, parkeer_id),
+                generation=generation, parkeer_id=parkeer_id, change=change)
+
+        changes = {change['id']: change for change in self.changes(1)}
+
+        # The last change of every parkeervak up to the current generation
+        self.assertEqual(
+            {pid: change['change'] for pid, change in changes.items()},
+            {self.p.id: 'modified', 'WEG': 'removed', 'NIEUW': 'added'})
+        self.assertEqual(
+            {change['generation'] for change in changes.values()}, {2})
+        self.assertEqual(
+            changes[self.p.id]['parkeervak']['id'], self.p.id)
+        self.assertEqual(changes['NIEUW']['parkeervak']['id'], 'NIEUW')
+        self.assertIsNone(changes['WEG']['parkeervak'])
+
+        self.assertEqual(self.changes(2), [])
+
+    def test_changes_gone(self):
+        # The changes of generation 1 and 2 were removed
+        with patch('parkeervakken_api.views.pruned_generation',
+                   return_value=2):
+            response = self.client.get('/parkeervakken/changes/?since=1')
+            self.assertEqual(response.status_code, 410)
+            self.assertIn('since=0', response.data['detail'])
+
+            self.assertEqual(self.changes(2), [])
+            self.assertEqual(len(self.changes(0)), 1)
+
+    def test_list_bbox(self):
+        url = '/parkeervakken/parkeervakken/?bbox={}'
+
+        response = self.client.get(url.format('121800,487300,121900,487400'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['count'], 1)
+
+        response = self.client.get(url.format('120000,480000,120100,480100'))
+        self.assertEqual(response.data['count'], 0)
+
+        response = self.client.get(url.format('120000,480000'))
+        self.assertEqual(response.status_code, 400)
+
+    def test_list_within(self):
+        url = '/parkeervakken/parkeervakken/'
+        around = Polygon.from_bbox((121800, 487300, 121900, 487400))
+        elsewhere = Polygon.from_bbox((120000, 480000, 120100, 480100))
+
+        for geometry, count in [
+                (around.wkt, 1),
+                (elsewhere.wkt, 0),
+                ('SRID=28992;{}'.format(around.wkt), 1),
+                # GeoJSON without a crs is RD as well, not WGS84
+                (around.json, 1),
+                (elsewhere.json, 0)]:
+            response = self.client.get(url, {'within': geometry})
+            self.assertEqual(response.status_code, 200, geometry)
+            self.assertEqual(response.data['count'], count, geometry)
+
+        for geometry in ['POLYGON((', 'POINT(121860 487310)']:
+            response = self.client.get(url, {'within': geometry})
+            self.assertEqual(response.status_code, 400, geometry)
+
+    def test_list_near(self):
+        url = '/parkeervakken/parkeervakken/?near=121800,487300{}'
+
+        # The parkeervak is 50 meters away
+        for radius, count in [('', 1), ('&radius=10', 0),
+                              ('&radius=60', 1)]:
+            response = self.client.get(url.format(radius))
+            self.assertEqual(response.status_code, 200, radius)
+            self.assertEqual(response.data['count'], count, radius)
+
+        for radius in ['&radius=0', '&radius=-5', '&radius=2001']:
+            response = self.client.get(url.format(radius))
+            self.assertEqual(response.status_code, 400, radius)
+            self.assertEqual(
+                response.data['radius'],
+                'Must be more than 0 and at most 2000')
+
+        response = self.client.get(url.format('') + ',3')
+        self.assertEqual(response.status_code, 400)
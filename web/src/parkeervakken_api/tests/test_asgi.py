@@ -0,0 +1,116 @@
+import asyncio
+import json
+from unittest.mock import patch
+
+from django.db import connection
+from rest_framework.test import APITransactionTestCase
+
+from parkeervakken_api import asgi
+from . import factories
+
+
+def asgi_get(path, query_string='', host=b'testserver'):
+    """Status and body of a GET by the ASGI application"""
+    messages = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        messages.append(message)
+
+    async def request():
+        scope = {
+            'type': 'http',
+            'scheme': 'http',
+            'method': 'GET',
+            'path': path,
+            'query_string': query_string.encode('latin-1'),
+            'headers': [(b'host', host)],
+        }
+        try:
+            await asgi.application(scope, receive, send)
+        finally:
+            # The pool belongs to the event loop of this request
+            await asgi.close_pool()
+
+    asyncio.run(request())
+
+    return messages[0]['status'], messages[1]['body']
+
+
+class ASGITestCase(APITransactionTestCase):
+    """
+    The ASGI application reads with its own connections, so the test data
+    is committed.
+    """
+
+    def setUp(self):
+        self.p = factories.ParkeervakFactory(straatnaam='Zonnehof')
+
+    def bv_view(self, sql):
+        with connection.cursor() as cursor:
+            cursor.execute(sql)
+
+    def test_geosearch_same_as_django(self):
+        queries = [
+            'x=121880&y=487310',
+            'x=121000&y=487000',
+            '',
+        ]
+        for query in queries:
+            response = self.client.get(
+                '/parkeervakken/geosearch/?{}'.format(query))
+            status, body = asgi_get('/parkeervakken/geosearch/', query)
+
+            self.assertEqual(status, 200, query)
+            self.assertEqual(
+                json.loads(body), json.loads(response.content), query)
+
+        status, body = asgi_get(
+            '/parkeervakken/geosearch/', 'x=121880&y=487310')
+        self.assertEqual(
+            json.loads(body)[0]['_links']['self']['href'],
+            'http://testserver/parkeervakken/parkeervakken/{}/'.format(
+                self.p.id))
+
+    def test_geoselection_same_as_django(self):
+        # The geoselection reads the bv layer of the importer
+        self.bv_view("""CREATE SCHEMA IF NOT EXISTS bv;
+            CREATE OR REPLACE VIEW bv.geo_parkeervakken AS
+            SELECT * FROM geo_parkeervakken""")
+        self.addCleanup(
+            self.bv_view, 'DROP VIEW IF EXISTS bv.geo_parkeervakken')
+        factories.ParkeervakFactory(straatnaam='Zonnehof')
+
+        queries = [
+            'straatnaam=Zonnehof',
+            'straatnaam=Nergens',
+            'ids={}'.format(self.p.id),
+            '',
+        ]
+        for query in queries:
+            response = self.client.get(
+                '/parkeervakken/geoselection/?{}'.format(query))
+            status, body = asgi_get('/parkeervakken/geoselection/', query)
+
+            self.assertEqual(status, 200, query)
+            self.assertEqual(body, response.content, query)
+
+    def test_errors(self):
+        status, _ = asgi_get('/parkeervakken/parkeervakken/')
+        self.assertEqual(status, 404)
+
+        status, body = asgi_get('/parkeervakken/geosearch/', 'x=a&y=b')
+        self.assertEqual(status, 400)
+        self.assertIn('detail', json.loads(body))
+
+        async def failing(query_params, url):
+            raise RuntimeError('database gone')
+
+        with patch.dict(asgi.ROUTES, {'/parkeervakken/geosearch/': failing}):
+            status, body = asgi_get(
+                '/parkeervakken/geosearch/', 'x=121880&y=487310')
+        self.assertEqual(status, 500)
+        self.assertEqual(
+            json.loads(body), {'detail': 'Internal server error'})
@@ -0,0 +1,86 @@
+from unittest.mock import patch
+
+from django.core.cache import cache
+from django.core.paginator import EmptyPage
+from django.test import override_settings
+from rest_framework.test import APITestCase
+
+from parkeervakken_api.models import Parkeervak
+from parkeervakken_api.pagination import CountPaginator
+from . import factories
+
+
+class CountPaginatorTestCase(APITestCase):
+
+    url = '/parkeervakken/parkeervakken/'
+
+    def setUp(self):
+        cache.clear()
+        factories.ParkeervakFactory.create_batch(3)
+
+    def tearDown(self):
+        cache.clear()
+
+    @override_settings(LIST_COUNT_STRATEGY='cached')
+    def test_cached_count(self):
+        with patch('parkeervakken_api.pagination.current_generation',
+                   return_value=1):
+            response = self.client.get(self.url)
+            self.assertEqual(response.data['count'], 3)
+
+            # Counted once per import generation
+            factories.ParkeervakFactory()
+            response = self.client.get(self.url)
+            self.assertEqual(response.data['count'], 3)
+            self.assertNotIn('count_estimated', response.data)
+
+            # Per query
+            response = self.client.get(
+                self.url, {'id': Parkeervak.objects.first().id})
+            self.assertEqual(response.data['count'], 1)
+
+        with patch('parkeervakken_api.pagination.current_generation',
+                   return_value=2):
+            response = self.client.get(self.url)
+            self.assertEqual(response.data['count'], 4)
+
+    @override_settings(LIST_COUNT_STRATEGY='estimated',
+                       LIST_COUNT_EXACT_BELOW=0)
+    def test_estimated_count(self):
+        response = self.client.get(self.url, {'page_size': 2})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIs(response.data['count_estimated'], True)
+        self.assertIsInstance(response.data['count'], int)
+        self.assertEqual(len(response.data['results']), 2)
+        self.assertIsNotNone(response.data['_links']['next']['href'])
+
+        response = self.client.get(self.url, {'page_size': 2, 'page': 2})
+        self.assertEqual(len(response.data['results']), 1)
+        self.assertIsNone(response.data['_links']['next']['href'])
+
+    @override_settings(LIST_COUNT_STRATEGY='estimated',
+                       LIST_COUNT_EXACT_BELOW=0)
+    def test_estimated_pages(self):
+        paginator = CountPaginator(Parkeervak.objects.order_by('id'), 2)
+
+        # The planner estimate, whatever it is, is not checked against
+        first = paginator.page(1)
+        self.assertTrue(paginator.estimated)
+        self.assertTrue(first.has_next())
+        self.assertEqual((first.start_index(), first.end_index()), (1, 2))
+
+        second = paginator.page(2)
+        self.assertFalse(second.has_next())
+        self.assertEqual((second.start_index(), second.end_index()), (3, 3))
+
+        with self.assertRaises(EmptyPage):
+            paginator.page(3)
+
+    @override_settings(LIST_COUNT_STRATEGY='estimated',
+                       LIST_COUNT_EXACT_BELOW=1000)
+    def test_estimated_small_count(self):
+        paginator = CountPaginator(Parkeervak.objects.order_by('id'), 2)
+
+        self.assertEqual(paginator.count, 3)
+        self.assertFalse(paginator.estimated)
@@ -0,0 +1,51 @@
+import datetime
+from collections import OrderedDict
+from decimal import Decimal
+
+from django.test import SimpleTestCase
+from django.test import override_settings
+from rest_framework import renderers
+
+from parkeervakken_api.renderers import JSONRenderer
+from parkeervakken_api.renderers import RawJSON
+
+
+class JSONRendererTestCase(SimpleTestCase):
+
+    data = OrderedDict([
+        ('count', 2),
+        ('results', [
+            OrderedDict([
+                ('id', '121403487060'),
+                ('straatnaam', 'Weesperstraat  '),
+                ('aantal', Decimal('1.5')),
+                ('datum', datetime.date(2020, 1, 31)),
+                ('tijd', datetime.datetime(2020, 1, 31, 9, 30, 15, 120)),
+                ('geometrie', {
+                    'type': 'Point',
+                    'coordinates': [121403.96, 487060.04]
+                }),
+                ('leeg', None),
+                (1, True),
+            ]),
+        ]),
+    ])
+
+    def test_same_output(self):
+        expected = renderers.JSONRenderer().render(self.data)
+
+        for backend in ('orjson', 'simplejson', 'stdlib'):
+            with override_settings(JSON_RENDERER_BACKEND=backend):
+                self.assertEqual(
+                    JSONRenderer().render(self.data), expected,
+                    'Different output with {}'.format(backend))
+
+    def test_raw_json(self):
+        data = {'geometrie': RawJSON('{"type":"Point","coordinates":[1,2]}')}
+
+        for backend in ('orjson', 'simplejson', 'stdlib'):
+            with override_settings(JSON_RENDERER_BACKEND=backend):
+                self.assertEqual(
+                    JSONRenderer().render(data),
+                    b'{"geometrie":{"type":"Point","coordinates":[1,2]}}',
+                    'Different output with {}'.format(backend))
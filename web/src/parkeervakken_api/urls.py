@@ -42,6 +42,12 @@ parkeervakken.register(r'geosearch', api_views.GeoSearchViewSet,
                        basename='geosearch')
 parkeervakken.register(r'geoselection', api_views.GeoSelectionViewSet,
                        basename='geoselection')
+parkeervakken.register(r'capaciteit', api_views.CapaciteitViewSet,
+                       basename='capaciteit')
+parkeervakken.register(r'tijdreeks', api_views.TijdreeksViewSet,
+                       basename='tijdreeks')
+parkeervakken.register(r'changes', api_views.ChangesViewSet,
+                       basename='changes')
 
 urls = parkeervakken.urls
 
@@ -2,22 +2,97 @@ from django_filters.rest_framework import FilterSet
 from django_filters.rest_framework import filters
 from django_filters.rest_framework import DjangoFilterBackend
 
+from parkeervakken_api.models import Capaciteit
+from parkeervakken_api.models import Dagtotaal
 from parkeervakken_api.models import Parkeervak
+from parkeervakken_api.models import Wijziging
 from datapunt_api.rest import DatapuntViewSet
 from parkeervakken_api.serializers import ParkeervakSerializer
 
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.gis.geos import GEOSException
 from django.contrib.gis.geos import GEOSGeometry
+from django.contrib.gis.geos import Point
+from django.contrib.gis.geos import Polygon
+from django.db.models import Sum
+from django.db.models.expressions import RawSQL
+from django.http import StreamingHttpResponse
+from django.urls import reverse
+from django.utils.dateparse import parse_date
 from rest_framework import viewsets
+from rest_framework.exceptions import APIException
+from rest_framework.exceptions import NotAcceptable
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
 from django.db import connection
 
+from parkeervakken_api import binary
+from parkeervakken_api.generation import current_generation
+from parkeervakken_api.generation import pruned_generation
 from parkeervakken_api.geo_params import get_request_coord
+from parkeervakken_api.geoindex import get_engine
+from parkeervakken_api.pagination import CountPagination
+from parkeervakken_api.renderers import BINARY_RENDERERS
+from parkeervakken_api.renderers import BinaryRenderer
+from parkeervakken_api.renderers import JSONRenderer
+from parkeervakken_api.serializers import ParkeervakRowSerializer
 from parkeervakken_api.serializers import SimpleParkeervakSerializer
 from parkeervakken_api.serializers import GeoSelectionSerializer
 
 
+CAPACITEIT_FIELDS = (
+    'stadsdeel', 'buurtcode', 'straatnaam', 'e_type', 'soort', 'type',
+)
+
+TIJDREEKS_FIELDS = ('stadsdeel', 'buurtcode', 'e_type')
+
+MAX_RADIUS = 2000
+
+DEFAULT_RADIUS = 100
+
+# Parkeervakken looked up at once for the change feed
+CHANGES_CHUNK_SIZE = 1000
+
+DISTANCE_SQL = "geometrie <-> ST_SetSRID(ST_MakePoint(%s, %s), 28992)"
+
+# A Z-order curve on every PostGIS version, the btree order of geometries
+# only follows the Hilbert curve from PostGIS 3.1
+GEOHASH_SQL = "ST_GeoHash(ST_Transform(ST_Centroid(geometrie), 4326))"
+
+
+def parse_coordinates(name, value, count):
+    try:
+        coordinates = [float(c) for c in value.split(',')]
+    except ValueError:
+        coordinates = []
+
+    if len(coordinates) != count:
+        raise ValidationError(
+            {name: 'Must be {} comma separated numbers'.format(count)})
+
+    return coordinates
+
+
 class ParkeervakFilter(FilterSet):
+    """
+    Besides the fields, parkeervakken can be selected with a geometry in
+    RD (EPSG:28992):
+
+    bbox=minx,miny,maxx,maxy  intersecting the box
+    within=<WKT or GeoJSON>   within the (multi)polygon
+    near=x,y&radius=m         within `radius` meters of the point
+
+    Spatial selections are ordered on the geohash of the centroid, which
+    keeps parkeervakken close to each other on the same pages, `near` on
+    distance.
+    """
     id = filters.CharFilter()
+    bbox = filters.CharFilter(method='filter_bbox')
+    within = filters.CharFilter(method='filter_within')
+    near = filters.CharFilter(method='filter_near')
+    radius = filters.NumberFilter(method='filter_radius')
 
     class Meta(object):
         model = Parkeervak
@@ -33,6 +108,73 @@ class ParkeervakFilter(FilterSet):
             'bord',
         )
 
+    def filter_bbox(self, queryset, name, value):
+        bbox = Polygon.from_bbox(parse_coordinates(name, value, 4))
+        bbox.srid = 28992
+        return queryset.filter(geometrie__intersects=bbox)
+
+    def filter_within(self, queryset, name, value):
+        try:
+            geometry = GEOSGeometry(value)
+        except (GEOSException, ValueError):
+            raise ValidationError({name: 'Must be WKT or GeoJSON'})
+
+        if geometry.geom_type not in ('Polygon', 'MultiPolygon'):
+            raise ValidationError({name: 'Must be a (multi)polygon'})
+
+        # GDAL reads GeoJSON without a crs as WGS84, but like WKT without
+        # an SRID it is in RD here
+        if not geometry.srid or \
+                value.lstrip().startswith('{') and '"crs"' not in value:
+            geometry.srid = 28992
+
+        return queryset.filter(geometrie__within=geometry)
+
+    def filter_near(self, queryset, name, value):
+        x, y = parse_coordinates(name, value, 2)
+        radius = self.form.cleaned_data.get('radius')
+        if radius is None:
+            radius = DEFAULT_RADIUS
+
+        if not 0 < radius <= MAX_RADIUS:
+            raise ValidationError(
+                {'radius': 'Must be more than 0 and at most {}'.format(
+                    MAX_RADIUS)})
+
+        return queryset.filter(
+            geometrie__dwithin=(Point(x, y, srid=28992), float(radius)))
+
+    def filter_radius(self, queryset, name, value):
+        # Used by `filter_near`
+        return queryset
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        data = self.form.cleaned_data
+
+        if data.get('near'):
+            x, y = parse_coordinates('near', data['near'], 2)
+            return queryset.order_by(RawSQL(DISTANCE_SQL, (x, y)), 'id')
+
+        if data.get('bbox') or data.get('within'):
+            return queryset.order_by(RawSQL(GEOHASH_SQL, ()), 'id')
+
+        return queryset
+
+
+def binary_format(request):
+    """The binary geometry format asked for, None for the other formats"""
+    renderer = getattr(request, 'accepted_renderer', None)
+    if not isinstance(renderer, BinaryRenderer):
+        return None
+
+    if not binary.supported(renderer.format):
+        raise NotAcceptable(
+            'Format {} is not supported by the database'.format(
+                renderer.format))
+
+    return renderer.format
+
 
 class ParkeervakList(DatapuntViewSet):
     """Filter parkeervakken.
@@ -41,6 +183,18 @@ class ParkeervakList(DatapuntViewSet):
 
     https://api.data.amsterdam.nl/parkeervakken/parkeervakken/?buurtcode=&stadsdeel=&straatnaam=&soort=&aantal=&type=&e_type=E8&bord=Opladen+elektrische+voertuigen
 
+    Kaartvenster:
+
+    https://api.data.amsterdam.nl/parkeervakken/parkeervakken/?bbox=121000,487000,122000,488000
+
+    https://api.data.amsterdam.nl/parkeervakken/parkeervakken/?near=121400,487060&radius=50
+
+    Afhankelijk van `LIST_COUNT_STRATEGY` is `count` een schatting, dan
+    staat `count_estimated` op true.
+
+    Geometrie in FlatGeobuf, Geobuf of WKB met `?format=fgb`, `pbf` of
+    `wkb`. De paginering staat dan in de `Link` en `X-Total-Count` headers.
+
     """
     queryset = Parkeervak.objects.all().order_by('id')
     serializer_detail_class = ParkeervakSerializer
@@ -48,6 +202,66 @@ class ParkeervakList(DatapuntViewSet):
     filter_backends = (DjangoFilterBackend,)
     filter_class = ParkeervakFilter
     queryset_detail = (Parkeervak.objects.all())
+    pagination_class = CountPagination
+    renderer_classes = tuple(DatapuntViewSet.renderer_classes) + \
+        BINARY_RENDERERS
+
+    def list(self, request, *args, **kwargs):
+        fmt = binary_format(request)
+        if fmt:
+            return self.binary_list(fmt)
+
+        if not settings.FAST_LIST_RENDERING or \
+                not isinstance(request.accepted_renderer, JSONRenderer):
+            return super().list(request, *args, **kwargs)
+
+        queryset = self.filter_queryset(self.get_queryset())
+        rows = ParkeervakRowSerializer.rows(queryset)
+        serializer = ParkeervakRowSerializer(self.get_serializer_context())
+
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            return self.get_paginated_response(serializer.serialize(page))
+
+        return Response(serializer.serialize(rows))
+
+    def binary_list(self, fmt):
+        queryset = self.filter_queryset(self.get_queryset())
+        ids = queryset.values_list('id', flat=True)
+
+        page = self.paginate_queryset(ids)
+        if page is None:
+            return Response(binary.parkeervakken(fmt, ids))
+
+        response = Response(binary.parkeervakken(fmt, page))
+
+        hal = self.get_paginated_response(None).data
+        rels = {'self': 'self', 'next': 'next', 'previous': 'prev'}
+        response['Link'] = ', '.join(
+            '<{}>; rel="{}"'.format(link['href'], rels[name])
+            for name, link in hal['_links'].items() if link['href'])
+        response['X-Total-Count'] = hal['count']
+        if hal.get('count_estimated'):
+            response['X-Total-Count-Estimated'] = 'true'
+        return response
+
+
+MAX_NEAREST = 100
+
+
+def parkeervak_summary(request, parkeervak_id, geometry):
+    """
+    Same output as the `SimpleParkeervakSerializer` for a parkeervak found
+    by the in memory geosearch engine.
+    """
+    return OrderedDict([
+        ('_links', OrderedDict([
+            ('self', dict(href=request.build_absolute_uri(reverse(
+                'parkeervak-detail', kwargs={'pk': parkeervak_id})))),
+        ])),
+        ('id', parkeervak_id),
+        ('geometrie', geometry),
+    ])
 
 
 class GeoSearchViewSet(viewsets.ViewSet):
@@ -57,26 +271,86 @@ class GeoSearchViewSet(viewsets.ViewSet):
     And empty collection is returned when the point is
     not enclosed in any parkeervak.
 
+    With `nearest=<k>` the k parkeervakken nearest to
+    the location are returned, nearest first.
+
     http://localhost:8000/parkeervakken/geosearch/?x=129569.42&y=479968.42
 
+    http://localhost:8000/parkeervakken/geosearch/?x=129569.42&y=479968.42&nearest=5
+
+    http://localhost:8000/parkeervakken/geosearch/?x=129569.42&y=479968.42&format=fgb
+
     """
     url_name = 'geosearch'
+    renderer_classes = tuple(viewsets.ViewSet.renderer_classes) + \
+        BINARY_RENDERERS
 
     def list(self, request):
+        fmt = binary_format(request)
+
         x, y = get_request_coord(request.query_params)
         if not x or not y:
-            return Response([])
+            return Response(binary.parkeervakken(fmt, []) if fmt else [])
+
+        nearest = self.get_nearest(request)
+        engine = get_engine()
+
+        if engine is not None:
+            if nearest:
+                found = engine.nearest(x, y, nearest)
+            else:
+                found = engine.contains(x, y)
+                found = [found] if found else []
+            if fmt:
+                return Response(binary.parkeervakken(
+                    fmt, [parkeervak_id for parkeervak_id, _ in found]))
+            return Response(
+                [parkeervak_summary(request, *f) for f in found])
+
+        if nearest:
+            selection = Parkeervak.objects.order_by(
+                RawSQL(DISTANCE_SQL, (x, y)))
+            if fmt:
+                return Response(binary.parkeervakken(
+                    fmt, selection.values_list('id', flat=True)[:nearest]))
+            serializer = SimpleParkeervakSerializer(
+                selection[:nearest], many=True, context={'request': request})
+            return Response(serializer.data)
 
         # https://gis.stackexchange.com/questions/206378/st-geomfromtext-not-found
 
+        selection = Parkeervak.objects.extra(
+            where=["ST_Contains(geometrie, ST_GeomFromText('POINT(%s %s)', 28992))"], params=[x, y]).all()  # noqa
+
+        if fmt:
+            return Response(binary.parkeervakken(
+                fmt, selection.values_list('id', flat=True)[:1]))
+
         try:
-            selection = Parkeervak.objects.extra(
-                where=["ST_Contains(geometrie, ST_GeomFromText('POINT(%s %s)', 28992))"], params=[x, y]).all()[0]  # noqa
-            serializer = SimpleParkeervakSerializer(selection)
+            selection = selection[0]
+            serializer = SimpleParkeervakSerializer(
+                selection, context={'request': request})
             return Response([serializer.data])
         except IndexError:
             return Response([])
 
+    def get_nearest(self, request):
+        nearest = request.query_params.get('nearest')
+
+        if not nearest:
+            return None
+
+        try:
+            nearest = int(nearest)
+        except ValueError:
+            raise ValidationError({'nearest': 'Must be an integer'})
+
+        if not 0 < nearest <= MAX_NEAREST:
+            raise ValidationError(
+                {'nearest': 'Must be between 1 and {}'.format(MAX_NEAREST)})
+
+        return nearest
+
 
 class GeoSelectionViewSet(viewsets.ViewSet):
     """
@@ -87,10 +361,16 @@ class GeoSelectionViewSet(viewsets.ViewSet):
     /parkeervakken/geoselection/?straatnaam=Zonnehof
 
     /parkeervakken/geoselection/?ids= 129643479988,129643479977,129641479976,129639479975,129637479974,129626479980,129628479981,129633479983,129635479984,129630479982,129635479972,129627479968,129629479969,129631479970
+
+    /parkeervakken/geoselection/?straatnaam=Zonnehof&format=wkb
     """
     url_name = 'geoselection'
+    renderer_classes = tuple(viewsets.ViewSet.renderer_classes) + \
+        BINARY_RENDERERS
 
     def list(self, request):
+        fmt = binary_format(request)
+
         if 'straatnaam' in request.query_params:
             sql = """SELECT Count(*) as aantal, ST_Multi(ST_Union(p.geometrie)) as singleshape
 FROM bv.geo_parkeervakken p WHERE straatnaam = %s"""
@@ -103,7 +383,10 @@ FROM bv.geo_parkeervakken p WHERE id in (%s)"""
             sql = sql % format_strings
             params = tuple(ids)
         else:
-            return Response([])
+            return Response(b'' if fmt else [])
+
+        if fmt:
+            return Response(binary.selection(fmt, sql, params))
 
         with connection.cursor() as cursor:
             cursor.execute(sql, params)
@@ -112,3 +395,233 @@ FROM bv.geo_parkeervakken p WHERE id in (%s)"""
                     return Response([])
                 serializer = GeoSelectionSerializer({'aantal': row[0], 'singleshape': GEOSGeometry(row[1])})
                 return Response(serializer.data)
+
+
+def get_group_by(request, fields):
+    """The `group_by` fields, which have to be in `fields`"""
+    group_by = [
+        field for field in
+        request.query_params.get('group_by', '').split(',') if field
+    ]
+
+    unknown = set(group_by) - set(fields)
+    if unknown:
+        raise ValidationError({'group_by': 'Unknown {}, use {}'.format(
+            ', '.join(sorted(unknown)), ', '.join(fields))})
+
+    return group_by
+
+
+def filter_on_fields(queryset, request, fields):
+    return queryset.filter(**{
+        field: request.query_params[field]
+        for field in fields if field in request.query_params
+    })
+
+
+def get_date(request, name):
+    value = request.query_params.get(name)
+    if not value:
+        return None
+
+    try:
+        date = parse_date(value)
+    except ValueError:
+        date = None
+
+    if date is None:
+        raise ValidationError({name: 'Must be a date, YYYY-MM-DD'})
+
+    return date
+
+
+class CapaciteitViewSet(viewsets.ViewSet):
+    """
+    Aantal parkeervakken (`aantal_vakken`) en plaatsen (`aantal`), gegroepeerd
+    op `group_by`: een of meer van stadsdeel, buurtcode, straatnaam, e_type,
+    soort en type. Op dezelfde velden kan gefilterd worden.
+
+    /parkeervakken/capaciteit/?group_by=stadsdeel,e_type
+
+    /parkeervakken/capaciteit/?group_by=buurtcode,soort&stadsdeel=A
+    """
+    url_name = 'capaciteit'
+
+    def list(self, request):
+        group_by = get_group_by(request, CAPACITEIT_FIELDS)
+        queryset = filter_on_fields(
+            Capaciteit.objects.all(), request, CAPACITEIT_FIELDS)
+
+        totals = dict(
+            totaal_vakken=Sum('aantal_vakken'),
+            totaal=Sum('aantal'),
+        )
+
+        if group_by:
+            rows = queryset.values(*group_by).annotate(
+                **totals).order_by(*group_by)
+        else:
+            rows = [queryset.aggregate(**totals)]
+
+        return Response([
+            OrderedDict(
+                [(field, row[field]) for field in group_by] + [
+                    ('aantal_vakken', row['totaal_vakken'] or 0),
+                    ('aantal', int(row['totaal'] or 0)),
+                ])
+            for row in rows
+        ])
+
+
+class TijdreeksViewSet(viewsets.ViewSet):
+    """
+    Per dag het aantal parkeervakken (`aantal_vakken`), plaatsen (`aantal`)
+    en reserveringen, gegroepeerd op `group_by`: een of meer van stadsdeel,
+    buurtcode en e_type. Op dezelfde velden kan gefilterd worden, `van` en
+    `tot` (YYYY-MM-DD, tot en met) begrenzen de periode.
+
+    Elke import vervangt de dagen van vandaag tot het einde van zijn
+    periode, met de reserveringen die dan bekend zijn. Een voorbije dag
+    houdt de totalen van de laatste import die de dag in zijn periode had.
+
+    /parkeervakken/tijdreeks/?group_by=stadsdeel&van=2020-01-01
+
+    /parkeervakken/tijdreeks/?group_by=e_type&buurtcode=A04c
+    """
+    url_name = 'tijdreeks'
+
+    def list(self, request):
+        group_by = get_group_by(request, TIJDREEKS_FIELDS)
+        queryset = filter_on_fields(
+            Dagtotaal.objects.all(), request, TIJDREEKS_FIELDS)
+
+        van = get_date(request, 'van')
+        if van:
+            queryset = queryset.filter(datum__gte=van)
+
+        tot = get_date(request, 'tot')
+        if tot:
+            queryset = queryset.filter(datum__lte=tot)
+
+        rows = queryset.values('datum', *group_by).annotate(
+            totaal_vakken=Sum('aantal_vakken'),
+            totaal=Sum('aantal'),
+            totaal_reserveringen=Sum('reserveringen'),
+        ).order_by('datum', *group_by)
+
+        return Response([
+            OrderedDict(
+                [('datum', row['datum'])] +
+                [(field, row[field]) for field in group_by] + [
+                    ('aantal_vakken', row['totaal_vakken'] or 0),
+                    ('aantal', int(row['totaal'] or 0)),
+                    ('reserveringen', row['totaal_reserveringen'] or 0),
+                ])
+            for row in rows
+        ])
+
+
+def get_generation(request, name):
+    value = request.query_params.get(name)
+
+    try:
+        generation = int(value)
+    except (TypeError, ValueError):
+        generation = -1
+
+    if generation < 0:
+        raise ValidationError(
+            {name: 'Must be an import generation, 0 or more'})
+
+    return generation
+
+
+def change_lines(request, changes):
+    """
+    Newline delimited JSON of the (parkeer_id, change, generation) tuples
+    in `changes`, with the current parkeervak unless it was removed.
+    """
+    serializer = ParkeervakRowSerializer({'request': request})
+    renderer = JSONRenderer()
+
+    chunk = []
+    for change in changes:
+        chunk.append(change)
+        if len(chunk) == CHANGES_CHUNK_SIZE:
+            yield from _change_lines(serializer, renderer, chunk)
+            chunk = []
+
+    if chunk:
+        yield from _change_lines(serializer, renderer, chunk)
+
+
+def _change_lines(serializer, renderer, chunk):
+    ids = [
+        parkeer_id for parkeer_id, change, _ in chunk if change != 'removed'
+    ]
+    rows = {
+        row[0]: row for row in ParkeervakRowSerializer.rows(
+            Parkeervak.objects.filter(id__in=ids))
+    }
+
+    for parkeer_id, change, generation in chunk:
+        row = rows.get(parkeer_id) if change != 'removed' else None
+        yield renderer.render(OrderedDict([
+            ('id', parkeer_id),
+            ('change', change),
+            ('generation', generation),
+            ('parkeervak',
+             serializer.to_representation(row) if row else None),
+        ])) + b'\n'
+
+
+class ChangesGone(APIException):
+    status_code = 410
+    default_detail = (
+        'The changes since this generation are no longer kept, '
+        'start again with since=0')
+    default_code = 'gone'
+
+
+class ChangesViewSet(viewsets.ViewSet):
+    """
+    Parkeervakken toegevoegd (`added`), gewijzigd (`modified`) of verwijderd
+    (`removed`) sinds import generatie `since`, een regel JSON per
+    parkeervak met de laatste wijziging en het huidige parkeervak.
+
+    De header `X-Import-Generation` geeft de generatie van het antwoord,
+    gebruik die als `since` van de volgende aanvraag. `since=0` geeft alle
+    parkeervakken als `added`. Wijzigingen worden 90 dagen bewaard, voor
+    een oudere `since` is het antwoord 410 Gone: begin dan opnieuw met
+    `since=0`.
+
+    /parkeervakken/changes/?since=0
+    """
+    url_name = 'changes'
+
+    def list(self, request):
+        since = get_generation(request, 'since')
+        generation = current_generation()
+
+        if 0 < since < pruned_generation():
+            raise ChangesGone()
+
+        if since == 0:
+            changes = (
+                (parkeer_id, 'added', generation)
+                for parkeer_id in Parkeervak.objects.order_by(
+                    'id').values_list('id', flat=True).iterator()
+            )
+        else:
+            # The last change of every parkeervak
+            changes = Wijziging.objects.filter(
+                generation__gt=since, generation__lte=generation,
+            ).order_by('parkeer_id', '-generation').distinct(
+                'parkeer_id',
+            ).values_list('parkeer_id', 'change', 'generation').iterator()
+
+        response = StreamingHttpResponse(
+            change_lines(request, changes),
+            content_type='application/x-ndjson')
+        response['X-Import-Generation'] = str(generation)
+        return response
@@ -14,3 +14,7 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "parkeervakken_api.settings")
 
 application = get_wsgi_application()
+
+from parkeervakken_api.geoindex import warm_engine  # noqa: E402
+
+warm_engine()